@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from bench.fake_switch import FakeSwitchFarm, SwitchProfile, farm_address, load_profiles
+
+VENDOR_NAMES = {"huawei": "Huawei", "h3c": "H3C", "cisco": "Cisco"}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batch backups against a local fake switch farm")
+    parser.add_argument("--devices", type=int, default=100, help="number of fake switches")
+    parser.add_argument("--configs", default=os.path.join(BACKEND_DIR, "backups"), help="directory of .cfg captures to replay")
+    parser.add_argument("--commands", nargs="+", default=["dis version", "dis cur"])
+    parser.add_argument("--latency", type=float, default=0.05, help="mean per-command latency in seconds")
+    parser.add_argument("--page-size", type=int, default=40, help="lines per '---- More ----' page")
+    parser.add_argument("--force-paging", action="store_true", help="ignore paging-disable commands")
+    parser.add_argument("--config-lines", type=int, default=2000, help="size of the synthetic running config")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of connections that fail")
+    parser.add_argument("--failure-modes", default="reset,auth", help="comma list of reset, auth, stall")
+    parser.add_argument("--sites", type=int, default=16, help="spread devices over this many locations")
+    parser.add_argument("--per-subnet", type=int, default=1, help="devices per /24 of loopback addresses")
+    parser.add_argument("--port", type=int, default=10022)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--only-changed", action="store_true")
+    parser.add_argument("--ssh-timeout", type=float, default=10)
+    parser.add_argument("--in-process", action="store_true", help="run the farm in the benchmark process")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    return parser.parse_args(argv)
+
+def farm_kwargs(args) -> Dict:
+    return dict(
+        count=args.devices,
+        port=args.port,
+        per_subnet=args.per_subnet,
+        latency=args.latency,
+        page_size=args.page_size,
+        force_paging=args.force_paging,
+        config_lines=args.config_lines,
+        failure_rate=args.failure_rate,
+        failure_modes=[m for m in args.failure_modes.split(",") if m],
+        stall_seconds=args.ssh_timeout * 2
+    )
+
+def run_farm(profiles: List[SwitchProfile], kwargs: Dict, ready, stop):
+    farm = FakeSwitchFarm(profiles, **kwargs)
+    farm.start()
+    ready.set()
+    stop.wait()
+    farm.stop()
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def seed_devices(profiles: List[SwitchProfile], args) -> List[str]:
+    from database import SessionLocal
+    from models import Device
+
+    db = SessionLocal()
+    try:
+        ids = []
+        for i in range(args.devices):
+            profile = profiles[i % len(profiles)]
+            ids.append(f"bench-{i}")
+            db.add(Device(
+                id=f"bench-{i}",
+                name=f"{profile.hostname}-{i}",
+                ip=farm_address(i, args.per_subnet),
+                vendor=VENDOR_NAMES[profile.vendor],
+                location=f"site-{i % max(args.sites, 1)}"
+            ))
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+async def run_round(device_ids: List[str], args) -> Dict:
+    from database import SessionLocal
+    from routers.backup_jobs import BackupJobRequest, execute_batch_backup
+    from services.jobs import job_manager
+
+    request = BackupJobRequest(
+        device_ids=device_ids,
+        commands=args.commands,
+        template={"name": "bench", "username": "bench", "password": "bench", "port": args.port},
+        only_changed=args.only_changed
+    )
+    cpu_before = cpu_seconds()
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        status = await execute_batch_backup(request, db)
+    finally:
+        db.close()
+    job = job_manager.get(status.job_id)
+    async for message in job_manager.events(job):
+        if message and message["event"] == "done":
+            break
+    elapsed = time.perf_counter() - started
+    cpu = cpu_seconds() - cpu_before
+
+    durations = [d["duration"] for d in job.devices.values() if d.get("duration") is not None]
+    return {
+        "status": job.status,
+        "devices": job.total,
+        "success": job.success,
+        "failed": job.failed,
+        "changed": job.changed,
+        "unchanged": job.unchanged,
+        "retries": sum(max(d.get("attempts", 1) - 1, 0) for d in job.devices.values()),
+        "elapsed_s": round(elapsed, 3),
+        "devices_per_s": round(job.total / elapsed, 2) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(durations, 0.50), 3),
+        "latency_p95_s": round(percentile(durations, 0.95), 3),
+        "latency_mean_s": round(statistics.fmean(durations), 3) if durations else 0.0,
+        "cpu_s": round(cpu, 2),
+        "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+async def run_rounds(device_ids: List[str], args) -> List[Dict]:
+    from services.collector import collector
+    from services.jobs import job_manager
+
+    job_manager.start()
+    try:
+        rounds = []
+        for i in range(args.rounds):
+            report = await run_round(device_ids, args)
+            report["round"] = i + 1
+            print_round(report)
+            rounds.append(report)
+        return rounds
+    finally:
+        await job_manager.stop()
+        collector.shutdown()
+
+def print_round(report: Dict):
+    print(
+        f"round {report['round']}: {report['success']}/{report['devices']} ok, {report['failed']} failed, "
+        f"{report['retries']} retries in {report['elapsed_s']}s -> {report['devices_per_s']} devices/s | "
+        f"latency p50 {report['latency_p50_s']}s p95 {report['latency_p95_s']}s | "
+        f"cpu {report['cpu_s']}s ({report['cpu_percent']}%) | peak rss {report['peak_rss_mb']} MB"
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="netguard-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["NETGUARD_BACKUP_DIR"] = os.path.join(workdir, "backups")
+    os.environ.setdefault("NETGUARD_SSH_TIMEOUT", str(args.ssh_timeout))
+    os.environ.setdefault("NETGUARD_LOGIN_RATE_PER_MINUTE", "0")
+    os.makedirs(os.environ["NETGUARD_BACKUP_DIR"])
+
+    profiles = load_profiles(args.configs)
+    kwargs = farm_kwargs(args)
+    farm = None
+    farm_process = None
+    if args.in_process:
+        farm = FakeSwitchFarm(profiles, **kwargs)
+        farm.start()
+    else:
+        # Keeping the farm in its own process leaves the CPU and RSS figures to the backend
+        context = multiprocessing.get_context("spawn")
+        ready, stop = context.Event(), context.Event()
+        farm_process = context.Process(target=run_farm, args=(profiles, kwargs, ready, stop), daemon=True)
+        farm_process.start()
+        if not ready.wait(120):
+            raise SystemExit("fake switch farm did not start")
+
+    from database import init_db
+    init_db()
+    device_ids = seed_devices(profiles, args)
+    print(
+        f"farm: {args.devices} devices on port {args.port}, latency {args.latency}s, page {args.page_size} lines, "
+        f"failure rate {args.failure_rate:.0%}, workdir {workdir}"
+    )
+
+    try:
+        rounds = asyncio.run(run_rounds(device_ids, args))
+    finally:
+        if farm_process is not None:
+            stop.set()
+            farm_process.join(10)
+        if farm is not None:
+            farm.stop()
+
+    if args.json_path:
+        settings = {k: v for k, v in vars(args).items() if k != "json_path"}
+        env = {k: v for k, v in os.environ.items() if k.startswith("NETGUARD_")}
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "env": env, "rounds": rounds}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
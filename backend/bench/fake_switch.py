@@ -0,0 +1,274 @@
+import glob
+import os
+import random
+import re
+import selectors
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import paramiko
+
+PAGER_MARKERS = {"huawei": "  ---- More ----", "h3c": "---- More ----", "cisco": " --More-- "}
+PAGER_ERASE = "\x1b[16D" + " " * 16 + "\x1b[16D"
+PAGING_COMMANDS = ("screen-length", "terminal length", "set cli screen-length")
+UNKNOWN_COMMAND = {
+    "huawei": "Error: Unrecognized command found at '^' position.",
+    "h3c": "% Unrecognized command found at '^' position.",
+    "cisco": "% Invalid input detected at '^' marker.",
+}
+SECTION = re.compile(r"^# Command: (.*)$", re.MULTILINE)
+VRP_PROMPT = re.compile(r"^[<\[]([^<>\[\]\r\n]+)[>\]]", re.MULTILINE)
+IOS_PROMPT = re.compile(r"^([\w.\-]+)[>#]", re.MULTILINE)
+MORE_LINE = re.compile(r"^\s*-{2,} ?More ?-{2,}\s*$|^\s*--More--\s*$", re.MULTILINE)
+
+# Command words are matched by prefix, and display/show or current/running are
+# treated alike so one command list can drive every emulated vendor.
+ALIASES = {"show": "display", "running-config": "current-configuration"}
+
+@dataclass
+class SwitchProfile:
+    hostname: str
+    vendor: str
+    outputs: Dict[str, str] = field(default_factory=dict)
+
+def detect_vendor(text: str) -> str:
+    if "Cisco" in text:
+        return "cisco"
+    if "HUAWEI" in text or "Huawei" in text:
+        return "huawei"
+    return "h3c"
+
+def clean_section(body: str, command: str) -> str:
+    lines = body.replace("\r", "").split("\n")
+    for i, line in enumerate(lines):
+        if line.rstrip().endswith(command) and (VRP_PROMPT.match(line) or IOS_PROMPT.match(line)):
+            lines = lines[i + 1:]
+            break
+    text = MORE_LINE.sub("", "\n".join(lines))
+    text = re.sub(r"\n[<\[][^<>\[\]\n]+[>\]]\s*\Z", "", text.rstrip())
+    return text.strip("\n")
+
+def load_profile(path: str) -> SwitchProfile:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        raw = f.read()
+    vendor = detect_vendor(raw)
+    prompt = (IOS_PROMPT if vendor == "cisco" else VRP_PROMPT).search(raw)
+    hostname = prompt.group(1) if prompt else os.path.splitext(os.path.basename(path))[0]
+    outputs = {}
+    parts = SECTION.split(raw)
+    for command, body in zip(parts[1::2], parts[2::2]):
+        outputs[canonical(command)] = clean_section(body, command.strip())
+    return SwitchProfile(hostname=re.sub(r"\s+", "_", hostname), vendor=vendor, outputs=outputs)
+
+def load_profiles(directory: str) -> List[SwitchProfile]:
+    profiles = [load_profile(path) for path in sorted(glob.glob(os.path.join(directory, "*.cfg")))]
+    return profiles or [SwitchProfile(hostname="FAKE-SW", vendor="huawei")]
+
+def canonical(command: str) -> str:
+    return " ".join(ALIASES.get(word, word) for word in command.strip().lower().split())
+
+def lookup(outputs: Dict[str, str], command: str) -> Optional[str]:
+    words = canonical(command).split()
+    if " ".join(words) in outputs:
+        return outputs[" ".join(words)]
+    for known, output in outputs.items():
+        known_words = known.split()
+        if len(known_words) == len(words) and all(k.startswith(w) for k, w in zip(known_words, words)):
+            return output
+    return None
+
+# Each device listens on its own loopback address with the shared port, so a
+# single login template works for the whole farm (Linux routes all of
+# 127.0.0.0/8 to lo; other systems need the aliases configured).
+def farm_address(index: int, per_subnet: int = 1) -> str:
+    subnet, host = divmod(index, max(per_subnet, 1))
+    return f"127.{16 + subnet // 256}.{subnet % 256}.{host + 1}"
+
+def synthetic_config(hostname: str, vendor: str, lines: int) -> str:
+    if vendor == "cisco":
+        body = [f"hostname {hostname}", "!"]
+        for i in range(lines):
+            body.append(f"interface GigabitEthernet1/0/{i + 1}" if i % 4 == 0 else f" description bench-port-{i}")
+        return "\n".join(body + ["end"])
+    body = ["#", f" sysname {hostname}", "#"]
+    for i in range(lines):
+        body.append(f"interface GigabitEthernet1/0/{i + 1}" if i % 4 == 0 else f" description bench-port-{i}")
+    return "\n".join(body + ["#", "return"])
+
+def is_current_config(command: str) -> bool:
+    words = canonical(command).split()
+    return len(words) == 2 and "display".startswith(words[0]) and "current-configuration".startswith(words[1])
+
+class FakeServer(paramiko.ServerInterface):
+    def __init__(self, password: str, reject_auth: bool):
+        self.password = password
+        self.reject_auth = reject_auth
+
+    def check_auth_password(self, username, password):
+        if self.reject_auth or password != self.password:
+            return paramiko.AUTH_FAILED
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return True
+
+# Emulates one device. Each accepted TCP connection either fails according to
+# the farm's failure rate or gets a shell that replays the device's captured
+# command output with per-command latency and `---- More ----` paging.
+class FakeSwitch:
+    def __init__(self, farm: "FakeSwitchFarm", profile: SwitchProfile, address: str):
+        self.farm = farm
+        self.profile = profile
+        self.address = address
+
+    def prompt(self) -> str:
+        if self.profile.vendor == "cisco":
+            return f"{self.profile.hostname}#"
+        return f"<{self.profile.hostname}>"
+
+    def handle(self, sock: socket.socket):
+        failure = self.farm.pick_failure()
+        if failure == "reset":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\x01\x00\x00\x00\x00\x00\x00\x00")
+            sock.close()
+            return
+        if failure == "stall":
+            time.sleep(self.farm.stall_seconds)
+            sock.close()
+            return
+
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.farm.host_key)
+        try:
+            transport.start_server(server=FakeServer(self.farm.password, failure == "auth"))
+            chan = transport.accept(30)
+            if chan is not None:
+                self.serve(chan)
+        except Exception:
+            pass
+        finally:
+            transport.close()
+
+    def output_for(self, command: str) -> str:
+        output = lookup(self.profile.outputs, command)
+        if output is None and is_current_config(command):
+            output = synthetic_config(self.profile.hostname, self.profile.vendor, self.farm.config_lines)
+        if output is None:
+            output = UNKNOWN_COMMAND[self.profile.vendor]
+        return output
+
+    def send_paged(self, chan, text: str, paging: bool) -> bool:
+        lines = text.split("\n")
+        page = self.farm.page_size if paging and self.farm.page_size > 0 else len(lines)
+        for start in range(0, len(lines), page):
+            chan.sendall("\r\n".join(lines[start:start + page]) + "\r\n")
+            if start + page < len(lines):
+                chan.sendall(PAGER_MARKERS[self.profile.vendor])
+                if not chan.recv(1):
+                    return False
+                chan.sendall(PAGER_ERASE)
+        return True
+
+    def serve(self, chan):
+        paging = True
+        chan.sendall("\r\n" + "*" * 40 + "\r\n* NetGuard benchmark switch\r\n" + "*" * 40 + "\r\n\r\n" + self.prompt())
+        buffer = b""
+        while True:
+            data = chan.recv(4096)
+            if not data:
+                return
+            buffer += data
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command = line.decode("utf-8", "replace").strip()
+                chan.sendall(command + "\r\n")
+                if self.farm.latency:
+                    time.sleep(self.farm.latency * random.uniform(0.5, 1.5))
+                if command.startswith(PAGING_COMMANDS):
+                    paging = self.farm.force_paging
+                elif command and not self.send_paged(chan, self.output_for(command), paging):
+                    return
+                chan.sendall(self.prompt())
+
+class FakeSwitchFarm:
+    def __init__(
+        self,
+        profiles: Sequence[SwitchProfile],
+        count: int,
+        port: int = 10022,
+        per_subnet: int = 1,
+        password: str = "bench",
+        latency: float = 0.05,
+        page_size: int = 40,
+        force_paging: bool = False,
+        config_lines: int = 2000,
+        failure_rate: float = 0.0,
+        failure_modes: Sequence[str] = ("reset", "auth"),
+        stall_seconds: float = 60.0
+    ):
+        self.profiles = list(profiles)
+        self.count = count
+        self.port = port
+        self.per_subnet = max(per_subnet, 1)
+        self.password = password
+        self.latency = latency
+        self.page_size = page_size
+        self.force_paging = force_paging
+        self.config_lines = config_lines
+        self.failure_rate = failure_rate
+        self.failure_modes = tuple(failure_modes)
+        self.stall_seconds = stall_seconds
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.switches: List[FakeSwitch] = []
+        self._selector = selectors.DefaultSelector()
+        self._stopped = threading.Event()
+
+    def address(self, index: int) -> str:
+        return farm_address(index, self.per_subnet)
+
+    def pick_failure(self) -> Optional[str]:
+        if self.failure_modes and random.random() < self.failure_rate:
+            return random.choice(self.failure_modes)
+        return None
+
+    def start(self) -> List[FakeSwitch]:
+        for i in range(self.count):
+            switch = FakeSwitch(self, self.profiles[i % len(self.profiles)], self.address(i))
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((switch.address, self.port))
+            listener.listen(64)
+            listener.setblocking(False)
+            self._selector.register(listener, selectors.EVENT_READ, switch)
+            self.switches.append(switch)
+        threading.Thread(target=self._accept_loop, name="fake-switch-accept", daemon=True).start()
+        return self.switches
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            for key, _ in self._selector.select(timeout=0.5):
+                try:
+                    sock, _ = key.fileobj.accept()
+                except BlockingIOError:
+                    continue
+                sock.setblocking(True)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=key.data.handle, args=(sock,), daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        for key in list(self._selector.get_map().values()):
+            self._selector.unregister(key.fileobj)
+            key.fileobj.close()
@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from bench.backup_bench import farm_kwargs, percentile, run_farm, seed_devices
+from bench.fake_switch import FakeSwitchFarm, load_profiles
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API latency while single-device backups run concurrently")
+    parser.add_argument("--devices", type=int, default=20, help="number of fake switches")
+    parser.add_argument("--concurrency", type=int, default=20, help="single backups in flight at once")
+    parser.add_argument("--requests", type=int, default=40, help="total POST /api/backups/ calls")
+    parser.add_argument("--configs", default=os.path.join(BACKEND_DIR, "backups"), help="directory of .cfg captures to replay")
+    parser.add_argument("--commands", nargs="+", default=["dis version", "dis cur"])
+    parser.add_argument("--latency", type=float, default=0.2, help="mean per-command latency in seconds")
+    parser.add_argument("--page-size", type=int, default=40, help="lines per '---- More ----' page")
+    parser.add_argument("--force-paging", action="store_true", help="ignore paging-disable commands")
+    parser.add_argument("--config-lines", type=int, default=2000, help="size of the synthetic running config")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of connections that fail")
+    parser.add_argument("--failure-modes", default="reset,auth", help="comma list of reset, auth, stall")
+    parser.add_argument("--sites", type=int, default=4, help="spread devices over this many locations")
+    parser.add_argument("--per-subnet", type=int, default=1, help="devices per /24 of loopback addresses")
+    parser.add_argument("--port", type=int, default=10022)
+    parser.add_argument("--ssh-timeout", type=float, default=10)
+    parser.add_argument("--probe", default="/api/health", help="endpoint polled to measure API latency")
+    parser.add_argument("--probe-interval", type=float, default=0.05, help="seconds between probe requests")
+    parser.add_argument("--baseline-seconds", type=float, default=2, help="probe alone for this long first")
+    parser.add_argument("--in-process", action="store_true", help="run the farm in the benchmark process")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    return parser.parse_args(argv)
+
+def latency_report(samples: List[float]) -> Dict:
+    return {
+        "samples": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+        "max_ms": round(max(samples, default=0.0) * 1000, 1),
+    }
+
+async def probe(client, path: str, interval: float, stop: asyncio.Event) -> List[float]:
+    samples = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+async def run_backups(client, device_ids: List[str], args) -> Dict:
+    slots = asyncio.Semaphore(args.concurrency)
+    template = {"name": "bench", "username": "bench", "password": "bench", "port": args.port}
+    durations, statuses = [], {}
+
+    async def one(i: int):
+        async with slots:
+            started = time.perf_counter()
+            response = await client.post("/api/backups/", json={
+                "switch_id": device_ids[i % len(device_ids)],
+                "commands": args.commands,
+                "template": template
+            })
+            durations.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": args.requests,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "backups_per_s": round(args.requests / elapsed, 2) if elapsed else 0.0,
+        "backup_p50_s": round(percentile(durations, 0.50), 3),
+        "backup_p95_s": round(percentile(durations, 0.95), 3),
+    }
+
+# The app is driven in-process over ASGI, so any blocking call inside a request
+# handler stalls the probe requests sharing the same event loop.
+async def run_load(device_ids: List[str], args) -> Dict:
+    import httpx
+    import main as app_main
+    from services.collector import collector
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://netguard", timeout=None) as client:
+            stop = asyncio.Event()
+            baseline_task = asyncio.ensure_future(probe(client, args.probe, args.probe_interval, stop))
+            await asyncio.sleep(args.baseline_seconds)
+            stop.set()
+            baseline = await baseline_task
+
+            stop = asyncio.Event()
+            loaded_task = asyncio.ensure_future(probe(client, args.probe, args.probe_interval, stop))
+            backups = await run_backups(client, device_ids, args)
+            stop.set()
+            loaded = await loaded_task
+    finally:
+        collector.shutdown()
+
+    return {
+        "baseline": latency_report(baseline),
+        "under_load": latency_report(loaded),
+        "backups": backups,
+    }
+
+def print_report(report: Dict):
+    for label in ("baseline", "under_load"):
+        r = report[label]
+        print(f"{label:>10}: {r['samples']} probes, p50 {r['p50_ms']}ms p95 {r['p95_ms']}ms p99 {r['p99_ms']}ms max {r['max_ms']}ms")
+    b = report["backups"]
+    print(
+        f"   backups: {b['requests']} requests {b['statuses']} in {b['elapsed_s']}s -> {b['backups_per_s']}/s | "
+        f"p50 {b['backup_p50_s']}s p95 {b['backup_p95_s']}s"
+    )
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="netguard-load-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'load.db')}"
+    os.environ["NETGUARD_BACKUP_DIR"] = os.path.join(workdir, "backups")
+    os.environ.setdefault("NETGUARD_SSH_TIMEOUT", str(args.ssh_timeout))
+    os.environ.setdefault("NETGUARD_LOGIN_RATE_PER_MINUTE", "0")
+    os.makedirs(os.environ["NETGUARD_BACKUP_DIR"])
+
+    profiles = load_profiles(args.configs)
+    kwargs = farm_kwargs(args)
+    farm = None
+    farm_process = None
+    if args.in_process:
+        farm = FakeSwitchFarm(profiles, **kwargs)
+        farm.start()
+    else:
+        context = multiprocessing.get_context("spawn")
+        ready, stop = context.Event(), context.Event()
+        farm_process = context.Process(target=run_farm, args=(profiles, kwargs, ready, stop), daemon=True)
+        farm_process.start()
+        if not ready.wait(120):
+            raise SystemExit("fake switch farm did not start")
+
+    from database import init_db
+    init_db()
+    device_ids = seed_devices(profiles, args)
+    print(
+        f"farm: {args.devices} devices on port {args.port}, latency {args.latency}s; "
+        f"{args.requests} single backups, {args.concurrency} at a time, probing {args.probe}"
+    )
+
+    try:
+        report = asyncio.run(run_load(device_ids, args))
+    finally:
+        if farm_process is not None:
+            stop.set()
+            farm_process.join(10)
+        if farm is not None:
+            farm.stop()
+
+    print_report(report)
+    if args.json_path:
+        settings = {k: v for k, v in vars(args).items() if k != "json_path"}
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "report": report}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
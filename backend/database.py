@@ -1,17 +1,86 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, inspect, event
 from sqlalchemy.orm import sessionmaker, Session
-from models import Base, Device, Backup, Template
+from models import Base, Device, Backup, Template, BackupJob, ConfigBlob, SearchDocument
 import os
+import time
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./netguard.db?check_same_thread=False")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", DATABASE_URL)
 
-engine = create_engine(
-    DATABASE_URL, 
-    echo=False, 
-    connect_args={"check_same_thread": False},
-    pool_pre_ping=True
-)
+POOL_SIZE = int(os.getenv("NETGUARD_DB_POOL_SIZE", 10))
+MAX_OVERFLOW = int(os.getenv("NETGUARD_DB_MAX_OVERFLOW", 20))
+READ_POOL_SIZE = int(os.getenv("NETGUARD_DB_READ_POOL_SIZE", 10))
+POOL_RECYCLE = int(os.getenv("NETGUARD_DB_POOL_RECYCLE", 1800))
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("NETGUARD_SQLITE_BUSY_TIMEOUT_MS", 10000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("NETGUARD_SQLITE_CACHE_SIZE_KB", 65536))
+SQLITE_MMAP_SIZE = int(os.getenv("NETGUARD_SQLITE_MMAP_SIZE", 268435456))
+SQLITE_SYNCHRONOUS = os.getenv("NETGUARD_SQLITE_SYNCHRONOUS", "NORMAL")
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def sqlite_pragmas(read_only: bool = False):
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = ON")
+    else:
+        # auto_vacuum has to precede WAL to apply to a new database file; existing
+        # databases switch with one full VACUUM (POST /api/retention/run?vacuum=true)
+        pragmas += ["PRAGMA auto_vacuum = INCREMENTAL", "PRAGMA journal_mode = WAL", f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}"]
+    return pragmas
+
+def build_engine(url: str, read_only: bool = False):
+    if not is_sqlite(url):
+        return create_engine(
+            url,
+            echo=False,
+            pool_size=READ_POOL_SIZE if read_only else POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    
+    sqlite_engine = create_engine(
+        url,
+        echo=False,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=READ_POOL_SIZE if read_only else POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True
+    )
+    
+    @event.listens_for(sqlite_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in sqlite_pragmas(read_only):
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    
+    return sqlite_engine
+
+engine = build_engine(DATABASE_URL)
+read_engine = build_engine(DATABASE_READ_URL, read_only=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+@event.listens_for(SessionLocal, "before_commit")
+def start_commit_timer(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(SessionLocal, "after_commit")
+def record_commit_time(session):
+    from services import metrics
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        metrics.db_commit_seconds.observe(time.perf_counter() - started)
 
 def get_db():
     db = SessionLocal()
@@ -20,10 +89,55 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def migrate_schema():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}"))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def init_db():
-    with engine.connect() as conn:
-        conn.execute(text("PRAGMA encoding = 'UTF-8'"))
-        conn.commit()
+    from services import archive, blobstore, compliance, retention, search, stats
+    
+    if is_sqlite(DATABASE_URL):
+        with engine.connect() as conn:
+            conn.execute(text("PRAGMA encoding = 'UTF-8'"))
+            conn.commit()
     
     Base.metadata.create_all(bind=engine)
+    migrate_schema()
+    search.create_index(engine)
+    
+    db = SessionLocal()
+    try:
+        migrated = blobstore.migrate_legacy_content(db)
+        if migrated:
+            print(f"Moved {migrated} legacy backups into the blob store")
+        archive.backfill_fingerprints(db)
+        stats.backfill(db)
+        retention.seed_managed(db)
+        indexed = search.reindex_missing(db)
+        if indexed:
+            print(f"Indexed {indexed} configurations for full-text search")
+        seeded = compliance.seed_default_rules(db)
+        if seeded:
+            print(f"Added {seeded} default compliance rules")
+    finally:
+        db.close()
     print("Database initialized successfully")
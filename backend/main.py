@@ -1,14 +1,18 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import uvicorn
 import os
 from datetime import datetime
 
-from routers import devices, backups, templates, backup_jobs
+from routers import devices, backups, templates, backup_jobs, schedules, configs, compliance, retention, stats
 from database import init_db
+from services import metrics
+from services.collector import collector
+from services.jobs import job_manager
+from services.scheduler import SCHEDULER_ENABLED, scheduler
 
 app = FastAPI(
     title="NetGuard AI Backend", 
@@ -19,7 +23,17 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    job_manager.start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await scheduler.stop()
+    await job_manager.stop()
+    collector.shutdown()
+
+app.add_middleware(metrics.RequestMetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:5173", "http://127.0.0.1:5173"],
@@ -32,6 +46,11 @@ app.include_router(devices.router, prefix="/api/devices", tags=["devices"])
 app.include_router(backups.router, prefix="/api/backups", tags=["backups"])
 app.include_router(templates.router, prefix="/api/templates", tags=["templates"])
 app.include_router(backup_jobs.router, prefix="/api/backup-jobs", tags=["backup-jobs"])
+app.include_router(schedules.router, prefix="/api/schedules", tags=["schedules"])
+app.include_router(configs.router, prefix="/api/configs", tags=["configs"])
+app.include_router(compliance.router, prefix="/api/compliance", tags=["compliance"])
+app.include_router(retention.router, prefix="/api/retention", tags=["retention"])
+app.include_router(stats.router, prefix="/api/stats", tags=["stats"])
 
 @app.get("/")
 async def root():
@@ -46,6 +65,10 @@ async def root():
 async def health():
     return {"status": "ok", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Text, ForeignKey, LargeBinary, Index, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -14,6 +14,12 @@ class Device(Base):
     vendor = Column(String(50), nullable=False)
     location = Column(String(100), default="未知")
     last_backup = Column(DateTime, nullable=True)
+    last_verified = Column(DateTime, nullable=True)
+    last_config_hash = Column(String(64), nullable=True, index=True)
+    last_failure = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+    last_error_class = Column(String(30), nullable=True)
+    backup_count = Column(Integer, nullable=True, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     backups = relationship("Backup", back_populates="device", cascade="all, delete-orphan")
@@ -24,13 +30,83 @@ class Backup(Base):
     id = Column(String, primary_key=True)
     switch_id = Column(String, ForeignKey("devices.id", ondelete="CASCADE"), nullable=False, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(Text, nullable=False, default="")
+    content_hash = Column(String(64), nullable=True, index=True)
+    fingerprint = Column(String(64), nullable=True)
+    size = Column(Integer, nullable=True)
     filename = Column(String(255), nullable=True)
     commands = Column(String(1000), nullable=True)
     template_name = Column(String(100), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     device = relationship("Device", back_populates="backups")
+    
+    __table_args__ = (
+        Index("ix_backups_timestamp_id", "timestamp", "id"),
+        Index("ix_backups_switch_timestamp_id", "switch_id", "timestamp", "id"),
+        Index("ix_backups_template_timestamp_id", "template_name", "timestamp", "id"),
+    )
+
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+    
+    day = Column(String(10), primary_key=True)
+    metric = Column(String(50), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ConfigBlob(Base):
+    __tablename__ = "config_blobs"
+    
+    hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    compression = Column(String(10), nullable=False)
+    base_hash = Column(String(64), nullable=True, index=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+
+class ParsedConfig(Base):
+    __tablename__ = "parsed_configs"
+    
+    content_hash = Column(String(64), primary_key=True)
+    parser_version = Column(Integer, nullable=False)
+    dialect = Column(String(20), nullable=False)
+    dialect_hint = Column(String(20), nullable=True)
+    summary = Column(Text, nullable=False)
+    tree = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ComplianceRule(Base):
+    __tablename__ = "compliance_rules"
+    
+    id = Column(String, primary_key=True)
+    name = Column(String(200), nullable=False)
+    category = Column(String(100), nullable=True)
+    severity = Column(String(10), nullable=False, default="MEDIUM")
+    kind = Column(String(20), nullable=False)
+    pattern = Column(Text, nullable=False)
+    section = Column(Text, nullable=True)
+    section_filter = Column(Text, nullable=True)
+    vendor = Column(String(50), nullable=True)
+    description = Column(Text, nullable=True)
+    remediation = Column(Text, nullable=True)
+    enabled = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ComplianceResult(Base):
+    __tablename__ = "compliance_results"
+    
+    content_hash = Column(String(64), primary_key=True)
+    ruleset_hash = Column(String(64), primary_key=True)
+    dialect = Column(String(20), nullable=True)
+    config_found = Column(Boolean, nullable=False)
+    findings = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
 class Template(Base):
     __tablename__ = "templates"
@@ -43,3 +119,77 @@ class Template(Base):
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+
+class BackupJob(Base):
+    __tablename__ = "backup_jobs"
+    
+    id = Column(String, primary_key=True)
+    kind = Column(String(50), nullable=False, default="backup")
+    status = Column(String(20), nullable=False, index=True)
+    total = Column(Integer, default=0)
+    success = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    state = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class CollectionTask(Base):
+    __tablename__ = "collection_tasks"
+    
+    id = Column(String, primary_key=True)
+    job_id = Column(String, nullable=False, index=True)
+    device_id = Column(String, nullable=False)
+    site = Column(String(100), nullable=True)
+    status = Column(String(20), nullable=False, default="queued")
+    payload = Column(Text, nullable=True)
+    worker_id = Column(String(100), nullable=True)
+    lease_token = Column(String(36), nullable=True, index=True)
+    lease_expires = Column(DateTime, nullable=True)
+    leases = Column(Integer, default=0)
+    result = Column(Text, nullable=True)
+    reported = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index("ix_collection_tasks_status_created", "status", "created_at"),
+        Index("ix_collection_tasks_job_status", "job_id", "status", "reported"),
+    )
+
+class RetentionPolicy(Base):
+    __tablename__ = "retention_policies"
+    
+    id = Column(String, primary_key=True)
+    enabled = Column(Boolean, default=False)
+    keep_last = Column(Integer, default=10)
+    keep_daily_days = Column(Integer, default=30)
+    keep_monthly_months = Column(Integer, default=12)
+    keep_changed = Column(Boolean, default=True)
+    cron = Column(String(100), nullable=False, default="30 3 * * *")
+    next_run_at = Column(DateTime, nullable=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_status = Column(String(20), nullable=True)
+    last_report = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BackupSchedule(Base):
+    __tablename__ = "backup_schedules"
+    
+    id = Column(String, primary_key=True)
+    name = Column(String(100), nullable=False)
+    cron = Column(String(100), nullable=False)
+    location = Column(String(100), nullable=True)
+    vendor = Column(String(50), nullable=True)
+    device_ids = Column(Text, nullable=True)
+    commands = Column(Text, nullable=False)
+    template_id = Column(String, ForeignKey("templates.id"), nullable=False)
+    only_changed = Column(Boolean, default=False)
+    jitter_seconds = Column(Integer, default=300)
+    enabled = Column(Boolean, default=True, index=True)
+    next_run_at = Column(DateTime, nullable=True, index=True)
+    last_run_at = Column(DateTime, nullable=True)
+    last_job_id = Column(String, nullable=True)
+    last_status = Column(String(20), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
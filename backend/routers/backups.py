@@ -1,19 +1,78 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Header
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from sqlalchemy import tuple_, func
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db, ReadSessionLocal, SessionLocal
 from models import Backup as DBBackup, Device
-import uuid
+from services import backup_runner, blobstore, configtree, export, history, diff, retention, search, stats
+import asyncio
+import base64
 from datetime import datetime
-import paramiko
+from urllib.parse import quote
+import hashlib
 import os
 
 router = APIRouter()
 
-BACKUP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "backups")
+BACKUP_DIR = os.getenv("NETGUARD_BACKUP_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "backups"))
 os.makedirs(BACKUP_DIR, exist_ok=True)
 
+class BackupSummary(BaseModel):
+    id: str
+    switch_id: str
+    timestamp: str
+    content_hash: Optional[str] = None
+    size: Optional[int] = None
+    filename: Optional[str] = None
+    commands: List[str]
+    template_name: str
+
+class BackupPage(BaseModel):
+    items: List[BackupSummary]
+    next_cursor: Optional[str] = None
+    limit: int
+
+class BackupVersion(BaseModel):
+    version: int
+    backup_id: str
+    timestamp: str
+    content_hash: Optional[str] = None
+    size: Optional[int] = None
+    storage: str
+    chain_depth: int
+
+class BackupDiff(BaseModel):
+    switch_id: str
+    backup_id: str
+    against_id: str
+    from_hash: Optional[str] = None
+    to_hash: Optional[str] = None
+    changed: bool
+    added: int
+    removed: int
+    format: str
+    diff: Optional[str] = None
+    hunks: Optional[List[dict]] = None
+
+class SearchHit(BaseModel):
+    backup_id: str
+    switch_id: str
+    device_name: Optional[str] = None
+    device_ip: Optional[str] = None
+    timestamp: str
+    match_count: int
+    matches: List[dict]
+
+class ParsedBackup(BaseModel):
+    backup_id: str
+    switch_id: str
+    content_hash: str
+    dialect: str
+    summary: dict
+    tree: Optional[List[dict]] = None
+
 class BackupCreate(BaseModel):
     switch_id: str
     commands: List[str]
@@ -24,93 +83,318 @@ class Backup(BaseModel):
     switch_id: str
     timestamp: str
     content: str
+    content_hash: Optional[str] = None
+    size: Optional[int] = None
     filename: str
     commands: List[str]
     template_name: str
 
-async def execute_ssh_commands(host: str, username: str, password: str, port: int, commands: List[str]) -> str:
-    try:
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(hostname=host, username=username, password=password, port=port, timeout=10)
-        
-        results = []
-        for command in commands:
-            stdin, stdout, stderr = ssh.exec_command(command)
-            output = stdout.read().decode('utf-8')
-            results.append(f"# Command: {command}\n{output}\n")
-        
-        ssh.close()
-        return "\n".join(results)
-    except Exception as e:
-        raise Exception(f"SSH connection failed: {str(e)}")
-
-def db_to_model(backup: DBBackup) -> Backup:
+def db_to_model(backup: DBBackup, db: Session) -> Backup:
     return Backup(
         id=backup.id,
         switch_id=backup.switch_id,
         timestamp=backup.timestamp.isoformat() if backup.timestamp else "",
-        content=backup.content,
+        content=blobstore.backup_content(db, backup),
+        content_hash=backup.content_hash,
+        size=backup.size,
         filename=backup.filename,
         commands=backup.commands.split(',') if backup.commands else [],
         template_name=backup.template_name or ""
     )
 
+def attachment(filename: str) -> str:
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace("?", "_").replace('"', "_")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+def encode_cursor(timestamp: datetime, backup_id: str) -> str:
+    raw = f"{timestamp.isoformat()}|{backup_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        timestamp, backup_id = raw.split("|", 1)
+        return datetime.fromisoformat(timestamp), backup_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/summaries", response_model=BackupPage)
+async def list_backup_summaries(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    switch_id: Optional[str] = None,
+    template_name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_read_db)
+):
+    query = db.query(
+        DBBackup.id,
+        DBBackup.switch_id,
+        DBBackup.timestamp,
+        DBBackup.content_hash,
+        DBBackup.size,
+        DBBackup.filename,
+        DBBackup.commands,
+        DBBackup.template_name
+    )
+    if switch_id:
+        query = query.filter(DBBackup.switch_id == switch_id)
+    if template_name:
+        query = query.filter(DBBackup.template_name == template_name)
+    if since:
+        query = query.filter(DBBackup.timestamp >= since)
+    if until:
+        query = query.filter(DBBackup.timestamp < until)
+    if cursor:
+        query = query.filter(tuple_(DBBackup.timestamp, DBBackup.id) < tuple_(*decode_cursor(cursor)))
+    
+    rows = query.order_by(DBBackup.timestamp.desc(), DBBackup.id.desc()).limit(limit + 1).all()
+    items = [
+        BackupSummary(
+            id=row.id,
+            switch_id=row.switch_id,
+            timestamp=row.timestamp.isoformat() if row.timestamp else "",
+            content_hash=row.content_hash,
+            size=row.size,
+            filename=row.filename,
+            commands=row.commands.split(',') if row.commands else [],
+            template_name=row.template_name or ""
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return BackupPage(items=items, next_cursor=next_cursor, limit=limit)
+
 @router.get("/", response_model=List[Backup])
-async def get_all_backups(db: Session = Depends(get_db)):
+async def get_all_backups(db: Session = Depends(get_read_db)):
     backups = db.query(DBBackup).order_by(DBBackup.timestamp.desc()).all()
-    return [db_to_model(b) for b in backups]
+    return [db_to_model(b, db) for b in backups]
+
+@router.get("/history/{switch_id}", response_model=List[BackupVersion])
+async def get_backup_history(switch_id: str, db: Session = Depends(get_read_db)):
+    return [BackupVersion(**v) for v in history.describe_versions(db, switch_id)]
+
+@router.get("/history/{switch_id}/{version}", response_model=Backup)
+async def get_backup_version(switch_id: str, version: int, db: Session = Depends(get_db)):
+    backup = history.get_version(db, switch_id, version)
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup version not found")
+    return db_to_model(backup, db)
+
+def previous_backup(db: Session, backup: DBBackup) -> Optional[DBBackup]:
+    return (
+        db.query(DBBackup)
+        .filter(
+            DBBackup.switch_id == backup.switch_id,
+            tuple_(DBBackup.timestamp, DBBackup.id) < tuple_(backup.timestamp, backup.id)
+        )
+        .order_by(DBBackup.timestamp.desc(), DBBackup.id.desc())
+        .first()
+    )
+
+def diff_backups(db: Session, old: DBBackup, new: DBBackup, fmt: str, context: int) -> BackupDiff:
+    old_text = blobstore.backup_content(db, old)
+    new_text = blobstore.backup_content(db, new)
+    old_hash = old.content_hash or blobstore.content_hash(old_text)
+    new_hash = new.content_hash or blobstore.content_hash(new_text)
+    result = diff.diff_contents(old_hash, old_text, new_hash, new_text, fmt=fmt, context=context)
+    return BackupDiff(
+        switch_id=new.switch_id,
+        backup_id=new.id,
+        against_id=old.id,
+        from_hash=old_hash,
+        to_hash=new_hash,
+        format=fmt,
+        **result
+    )
+
+@router.get("/search", response_model=List[SearchHit])
+async def search_backups(
+    q: str = Query(..., min_length=search.MIN_QUERY_LENGTH),
+    latest_only: bool = True,
+    switch_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    if not search.is_supported(db.get_bind()):
+        raise HTTPException(status_code=501, detail="Full-text search requires SQLite FTS5")
+    return [SearchHit(**hit) for hit in search.search(db, q, latest_only=latest_only, switch_id=switch_id, limit=limit)]
+
+@router.get("/diff/latest", response_model=List[BackupDiff])
+async def diff_latest_backups(
+    switch_ids: Optional[List[str]] = Query(None),
+    format: str = Query("unified", pattern="^(unified|structured)$"),
+    context: int = Query(diff.DEFAULT_CONTEXT, ge=0, le=50),
+    changed_only: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    rank = func.row_number().over(
+        partition_by=DBBackup.switch_id,
+        order_by=(DBBackup.timestamp.desc(), DBBackup.id.desc())
+    ).label("rank")
+    ranked = db.query(DBBackup.id, DBBackup.switch_id, rank)
+    if switch_ids:
+        ranked = ranked.filter(DBBackup.switch_id.in_(switch_ids))
+    ranked = ranked.subquery()
+    
+    rows = (
+        db.query(DBBackup, ranked.c.rank)
+        .join(ranked, DBBackup.id == ranked.c.id)
+        .filter(ranked.c.rank <= 2)
+        .all()
+    )
+    pairs = {}
+    for backup, position in rows:
+        pairs.setdefault(backup.switch_id, {})[position] = backup
+    
+    results = []
+    for switch_id in sorted(pairs):
+        pair = pairs[switch_id]
+        if 2 not in pair:
+            continue
+        result = diff_backups(db, pair[2], pair[1], format, context)
+        if result.changed or not changed_only:
+            results.append(result)
+    return results
+
+@router.get("/export")
+async def export_backups(
+    format: str = Query("tar.gz", pattern="^(tar\\.gz|zip)$"),
+    at: Optional[datetime] = None,
+    switch_ids: Optional[List[str]] = Query(None),
+    location: Optional[str] = None,
+    vendor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    rows = export.selected_backups(db, at, switch_ids, location, vendor)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No backups matched the filter")
+    
+    media_type, extension = export.ARCHIVE_FORMATS[format]
+    stamp = (at or datetime.utcnow()).strftime("%Y%m%d-%H%M%S")
+    return StreamingResponse(
+        export.stream_archive(ReadSessionLocal, format, rows, at),
+        media_type=media_type,
+        headers={"Content-Disposition": attachment(f"netguard-backups-{stamp}.{extension}")}
+    )
+
+@router.get("/{backup_id}/download")
+async def download_backup(
+    backup_id: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db)
+):
+    backup = db.query(DBBackup).filter(DBBackup.id == backup_id).first()
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    
+    # Blob-backed backups are immutable and addressed by content hash, so the
+    # hash is the ETag and a revalidation never has to touch the blob store.
+    content = None
+    digest = backup.content_hash
+    if not digest:
+        content = blobstore.backup_content(db, backup)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    if content is None:
+        content = blobstore.backup_content(db, backup)
+    filename = os.path.basename(backup.filename) if backup.filename else f"{backup.id}.cfg"
+    headers["Content-Disposition"] = attachment(filename)
+    return Response(content=content, media_type="text/plain; charset=utf-8", headers=headers)
+
+@router.get("/{backup_id}/parsed", response_model=ParsedBackup)
+async def get_parsed_backup(backup_id: str, include_tree: bool = True, db: Session = Depends(get_db)):
+    backup = db.query(DBBackup).filter(DBBackup.id == backup_id).first()
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    if not backup.content_hash:
+        raise HTTPException(status_code=409, detail="Backup content has not been migrated to the blob store")
+    
+    parsed = configtree.parsed_for(db, backup.content_hash, backup.device.vendor if backup.device else None)
+    if parsed is None:
+        raise HTTPException(status_code=404, detail="Backup content not found")
+    db.commit()
+    return ParsedBackup(
+        backup_id=backup.id,
+        switch_id=backup.switch_id,
+        content_hash=backup.content_hash,
+        dialect=parsed["dialect"],
+        summary=parsed["summary"],
+        tree=parsed["tree"] if include_tree else None
+    )
+
+@router.get("/{backup_id}/diff", response_model=BackupDiff)
+async def diff_backup(
+    backup_id: str,
+    against: str = "previous",
+    format: str = Query("unified", pattern="^(unified|structured)$"),
+    context: int = Query(diff.DEFAULT_CONTEXT, ge=0, le=50),
+    db: Session = Depends(get_db)
+):
+    backup = db.query(DBBackup).filter(DBBackup.id == backup_id).first()
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    
+    if against == "previous":
+        other = previous_backup(db, backup)
+        if not other:
+            raise HTTPException(status_code=404, detail="No previous backup for this device")
+    else:
+        other = db.query(DBBackup).filter(DBBackup.id == against).first()
+        if not other:
+            raise HTTPException(status_code=404, detail="Backup to compare against not found")
+    
+    return diff_backups(db, other, backup, format, context)
+
+def find_device(device_id: str) -> Optional[Device]:
+    db = SessionLocal()
+    try:
+        device = db.query(Device).filter(Device.id == device_id).first()
+        if device:
+            db.expunge(device)
+        return device
+    finally:
+        db.close()
+
+def load_backup(backup_id: str) -> Backup:
+    db = SessionLocal()
+    try:
+        return db_to_model(db.query(DBBackup).filter(DBBackup.id == backup_id).one(), db)
+    finally:
+        db.close()
 
 @router.post("/", response_model=Backup, status_code=201)
-async def create_backup(backup: BackupCreate, db: Session = Depends(get_db)):
+async def create_backup(backup: BackupCreate):
+    device = await asyncio.to_thread(find_device, backup.switch_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+    
     try:
-        device = db.query(Device).filter(Device.id == backup.switch_id).first()
-        if not device:
-            raise HTTPException(status_code=404, detail="Device not found")
-        
-        template = backup.template
-        content = await execute_ssh_commands(
-            host=template.get("ip"),
-            username=template.get("username"),
-            password=template.get("password"),
-            port=template.get("port", 22),
-            commands=backup.commands
-        )
-        
-        timestamp = datetime.utcnow()
-        filename = f"{backup.switch_id}_{timestamp.strftime('%Y-%m-%d-%H-%M-%S')}.txt"
-        filepath = os.path.join(BACKUP_DIR, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        db_backup = DBBackup(
-            id=str(uuid.uuid4()),
-            switch_id=backup.switch_id,
-            timestamp=timestamp,
-            content=content,
-            filename=filename,
-            commands=','.join(backup.commands),
-            template_name=template.get("name", "Unknown")
-        )
-        db.add(db_backup)
-        db.commit()
-        db.refresh(db_backup)
-        
-        device.last_backup = timestamp
-        db.commit()
-        
-        return db_to_model(db_backup)
+        result = await backup_runner.backup_device(device, backup.template, backup.commands)
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Backup failed: {str(e)}")
+    if not result["success"]:
+        raise HTTPException(status_code=502, detail=f"Backup failed: {result['error']}")
+    
+    return await asyncio.to_thread(load_backup, result["backup_id"])
 
 @router.get("/{backup_id}", response_model=Backup)
 async def get_backup(backup_id: str, db: Session = Depends(get_db)):
     backup = db.query(DBBackup).filter(DBBackup.id == backup_id).first()
     if not backup:
         raise HTTPException(status_code=404, detail="Backup not found")
-    return db_to_model(backup)
+    return db_to_model(backup, db)
 
 @router.delete("/{backup_id}", status_code=204)
 async def delete_backup(backup_id: str, db: Session = Depends(get_db)):
@@ -118,11 +402,11 @@ async def delete_backup(backup_id: str, db: Session = Depends(get_db)):
     if not backup:
         raise HTTPException(status_code=404, detail="Backup not found")
     
-    if backup.filename:
-        filepath = os.path.join(BACKUP_DIR, backup.filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
-    
+    # Batch backups of a device share one file; it goes with the last row naming
+    # it. The blob is left to the retention run.
+    filename = backup.filename
     db.delete(backup)
+    stats.adjust_backup_counts(db, {backup.switch_id: -1})
     db.commit()
+    retention.remove_unreferenced_files(db, [filename])
     return None
@@ -0,0 +1,240 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from database import get_db, SessionLocal
+from models import Backup as DBBackup, ComplianceRule as DBRule, Device
+import asyncio
+import uuid
+from services import compliance, export
+
+router = APIRouter()
+
+class RuleCreate(BaseModel):
+    name: str
+    kind: str
+    pattern: str
+    severity: str = "MEDIUM"
+    category: Optional[str] = None
+    section: Optional[str] = None
+    section_filter: Optional[str] = None
+    vendor: Optional[str] = None
+    description: Optional[str] = None
+    remediation: Optional[str] = None
+    enabled: bool = True
+
+class RuleUpdate(BaseModel):
+    name: Optional[str] = None
+    kind: Optional[str] = None
+    pattern: Optional[str] = None
+    severity: Optional[str] = None
+    category: Optional[str] = None
+    section: Optional[str] = None
+    section_filter: Optional[str] = None
+    vendor: Optional[str] = None
+    description: Optional[str] = None
+    remediation: Optional[str] = None
+    enabled: Optional[bool] = None
+
+class Rule(BaseModel):
+    id: str
+    name: str
+    kind: str
+    pattern: str
+    severity: str
+    category: Optional[str] = None
+    section: Optional[str] = None
+    section_filter: Optional[str] = None
+    vendor: Optional[str] = None
+    description: Optional[str] = None
+    remediation: Optional[str] = None
+    enabled: bool
+
+class DeviceCompliance(BaseModel):
+    switch_id: str
+    device_name: Optional[str] = None
+    device_ip: Optional[str] = None
+    vendor: Optional[str] = None
+    location: Optional[str] = None
+    backup_id: Optional[str] = None
+    timestamp: Optional[str] = None
+    status: str
+    dialect: Optional[str] = None
+    score: Optional[int] = None
+    counts: dict = {}
+    issues: Optional[List[dict]] = None
+
+class ComplianceReport(BaseModel):
+    ruleset: str
+    rules: int
+    total: int
+    compliant: int
+    violations: int
+    no_config: int
+    no_backup: int
+    devices: List[DeviceCompliance]
+
+def db_to_model(rule: DBRule) -> Rule:
+    return Rule(
+        id=rule.id,
+        name=rule.name,
+        kind=rule.kind,
+        pattern=rule.pattern,
+        severity=rule.severity,
+        category=rule.category,
+        section=rule.section,
+        section_filter=rule.section_filter,
+        vendor=rule.vendor,
+        description=rule.description,
+        remediation=rule.remediation,
+        enabled=bool(rule.enabled)
+    )
+
+def validate_rule(data: dict):
+    if data.get("kind") not in ("required", "forbidden"):
+        raise HTTPException(status_code=400, detail="kind must be 'required' or 'forbidden'")
+    if data.get("severity") not in compliance.SEVERITY_WEIGHTS:
+        raise HTTPException(status_code=400, detail="severity must be one of HIGH, MEDIUM, LOW, INFO")
+    try:
+        compliance.validate_rule(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def build_report(switch_ids, location, vendor, status, include_issues) -> ComplianceReport:
+    db = SessionLocal()
+    try:
+        ruleset = compliance.load_ruleset(db)
+        rows = [row for row in export.selected_backups(db, None, switch_ids, location, vendor) if row.content_hash]
+        results = compliance.evaluate_missing(db, ruleset, [row.content_hash for row in rows])
+
+        devices = []
+        for row in rows:
+            if row.content_hash not in results:
+                continue
+            report = compliance.device_report(ruleset, results[row.content_hash], row.vendor)
+            devices.append(DeviceCompliance(
+                switch_id=row.switch_id,
+                device_name=row.name,
+                device_ip=row.ip,
+                vendor=row.vendor,
+                location=row.location,
+                backup_id=row.id,
+                timestamp=row.timestamp.isoformat() if row.timestamp else None,
+                status=report["status"],
+                dialect=report["dialect"],
+                score=report["score"],
+                counts=report["counts"],
+                issues=report["issues"] if include_issues else None
+            ))
+
+        covered = {row.switch_id for row in rows}
+        query = db.query(Device)
+        if switch_ids:
+            query = query.filter(Device.id.in_(switch_ids))
+        if location:
+            query = query.filter(Device.location == location)
+        if vendor:
+            query = query.filter(Device.vendor == vendor)
+        for device in query.order_by(Device.location, Device.name).all():
+            if device.id not in covered:
+                devices.append(DeviceCompliance(
+                    switch_id=device.id,
+                    device_name=device.name,
+                    device_ip=device.ip,
+                    vendor=device.vendor,
+                    location=device.location,
+                    status="no_backup"
+                ))
+
+        tally = {s: sum(1 for d in devices if d.status == s) for s in ("compliant", "violations", "no_config", "no_backup")}
+        if status:
+            devices = [d for d in devices if d.status == status]
+        return ComplianceReport(
+            ruleset=ruleset.fingerprint,
+            rules=len(ruleset.rules),
+            total=sum(tally.values()),
+            devices=devices,
+            **tally
+        )
+    finally:
+        db.close()
+
+@router.get("/rules", response_model=List[Rule])
+async def get_rules(db: Session = Depends(get_db)):
+    return [db_to_model(r) for r in db.query(DBRule).order_by(DBRule.id).all()]
+
+@router.post("/rules", response_model=Rule, status_code=201)
+async def create_rule(rule: RuleCreate, db: Session = Depends(get_db)):
+    data = rule.model_dump()
+    validate_rule(data)
+    db_rule = DBRule(id=str(uuid.uuid4()), **data)
+    db.add(db_rule)
+    db.commit()
+    compliance.prune_stale_results(db, compliance.load_ruleset(db))
+    db.refresh(db_rule)
+    return db_to_model(db_rule)
+
+@router.put("/rules/{rule_id}", response_model=Rule)
+async def update_rule(rule_id: str, rule: RuleUpdate, db: Session = Depends(get_db)):
+    db_rule = db.query(DBRule).filter(DBRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+
+    changes = rule.model_dump(exclude_unset=True)
+    validate_rule({**compliance.rule_to_dict(db_rule), **changes})
+    for field, value in changes.items():
+        setattr(db_rule, field, value)
+    db.commit()
+    compliance.prune_stale_results(db, compliance.load_ruleset(db))
+    db.refresh(db_rule)
+    return db_to_model(db_rule)
+
+@router.delete("/rules/{rule_id}", status_code=204)
+async def delete_rule(rule_id: str, db: Session = Depends(get_db)):
+    db_rule = db.query(DBRule).filter(DBRule.id == rule_id).first()
+    if not db_rule:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    db.delete(db_rule)
+    db.commit()
+    compliance.prune_stale_results(db, compliance.load_ruleset(db))
+    return None
+
+@router.get("/report", response_model=ComplianceReport)
+async def get_report(
+    switch_ids: Optional[List[str]] = Query(None),
+    location: Optional[str] = None,
+    vendor: Optional[str] = None,
+    status: Optional[str] = Query(None, pattern="^(compliant|violations|no_config|no_backup)$"),
+    include_issues: bool = False
+):
+    return await asyncio.to_thread(build_report, switch_ids, location, vendor, status, include_issues)
+
+@router.get("/backups/{backup_id}", response_model=DeviceCompliance)
+async def get_backup_compliance(backup_id: str, db: Session = Depends(get_db)):
+    backup = db.query(DBBackup).filter(DBBackup.id == backup_id).first()
+    if not backup:
+        raise HTTPException(status_code=404, detail="Backup not found")
+    if not backup.content_hash:
+        raise HTTPException(status_code=409, detail="Backup content has not been migrated to the blob store")
+
+    device = backup.device
+    vendor = device.vendor if device else None
+    ruleset = compliance.load_ruleset(db)
+    results = compliance.evaluate_missing(db, ruleset, [backup.content_hash])
+    if backup.content_hash not in results:
+        raise HTTPException(status_code=404, detail="Backup content not found")
+    report = compliance.device_report(ruleset, results[backup.content_hash], vendor)
+    return DeviceCompliance(
+        switch_id=backup.switch_id,
+        device_name=device.name if device else None,
+        device_ip=device.ip if device else None,
+        vendor=vendor,
+        location=device.location if device else None,
+        backup_id=backup.id,
+        timestamp=backup.timestamp.isoformat() if backup.timestamp else None,
+        status=report["status"],
+        dialect=report["dialect"],
+        score=report["score"],
+        counts=report["counts"],
+        issues=report["issues"]
+    )
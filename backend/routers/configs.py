@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from database import get_db
+from datetime import datetime
+from services import configtree, export
+
+router = APIRouter()
+
+class DeviceConfigSummary(BaseModel):
+    switch_id: str
+    device_name: Optional[str] = None
+    device_ip: Optional[str] = None
+    vendor: Optional[str] = None
+    location: Optional[str] = None
+    backup_id: str
+    timestamp: str
+    content_hash: str
+    summary: dict
+
+class InterfaceMatch(BaseModel):
+    switch_id: str
+    device_name: Optional[str] = None
+    device_ip: Optional[str] = None
+    backup_id: str
+    interfaces: List[dict]
+
+def latest_summaries(db: Session, at, switch_ids, location, vendor):
+    rows = [row for row in export.selected_backups(db, at, switch_ids, location, vendor) if row.content_hash]
+    summaries = configtree.summaries_for(db, [(row.content_hash, row.vendor) for row in rows])
+    db.commit()
+    return [(row, summaries[(row.content_hash, row.vendor)]) for row in rows if (row.content_hash, row.vendor) in summaries]
+
+def interface_matches(iface: dict, mode, vlan, shutdown, description, acl) -> bool:
+    if mode and iface["mode"] != mode:
+        return False
+    if vlan is not None and iface["access_vlan"] != vlan and not configtree.in_ranges(vlan, iface["trunk_vlans"]):
+        return False
+    if shutdown is not None and iface["shutdown"] != shutdown:
+        return False
+    if description and description.lower() not in (iface["description"] or "").lower():
+        return False
+    if acl is not None and not (iface["acls"] if acl == "*" else any(acl in applied.split() for applied in iface["acls"])):
+        return False
+    return True
+
+@router.get("/summaries", response_model=List[DeviceConfigSummary])
+async def get_config_summaries(
+    switch_ids: Optional[List[str]] = Query(None),
+    location: Optional[str] = None,
+    vendor: Optional[str] = None,
+    at: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    return [
+        DeviceConfigSummary(
+            switch_id=row.switch_id,
+            device_name=row.name,
+            device_ip=row.ip,
+            vendor=row.vendor,
+            location=row.location,
+            backup_id=row.id,
+            timestamp=row.timestamp.isoformat() if row.timestamp else "",
+            content_hash=row.content_hash,
+            summary=summary
+        )
+        for row, summary in latest_summaries(db, at, switch_ids, location, vendor)
+    ]
+
+@router.get("/interfaces", response_model=List[InterfaceMatch])
+async def query_interfaces(
+    mode: Optional[str] = Query(None, pattern="^(access|trunk|hybrid|routed)$"),
+    vlan: Optional[int] = Query(None, ge=1, le=configtree.MAX_VLAN),
+    shutdown: Optional[bool] = None,
+    description: Optional[str] = None,
+    acl: Optional[str] = None,
+    switch_ids: Optional[List[str]] = Query(None),
+    location: Optional[str] = None,
+    vendor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    results = []
+    for row, summary in latest_summaries(db, None, switch_ids, location, vendor):
+        interfaces = [
+            iface for iface in summary["interfaces"]
+            if interface_matches(iface, mode, vlan, shutdown, description, acl)
+        ]
+        if interfaces:
+            results.append(InterfaceMatch(
+                switch_id=row.switch_id,
+                device_name=row.name,
+                device_ip=row.ip,
+                backup_id=row.id,
+                interfaces=interfaces
+            ))
+    return results
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from pydantic import BaseModel
 from typing import List, Optional
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db
 from models import Device as DBDevice
 import uuid
 from datetime import datetime
+from services import device_import, retention
 
 router = APIRouter()
 
@@ -28,6 +30,7 @@ class Device(BaseModel):
     vendor: str
     location: str
     last_backup: Optional[str] = None
+    last_verified: Optional[str] = None
     created_at: str
 
 def db_to_model(device: DBDevice) -> Device:
@@ -38,11 +41,12 @@ def db_to_model(device: DBDevice) -> Device:
         vendor=device.vendor,
         location=device.location,
         last_backup=device.last_backup.isoformat() if device.last_backup else None,
+        last_verified=device.last_verified.isoformat() if device.last_verified else None,
         created_at=device.created_at.isoformat() if device.created_at else ""
     )
 
 @router.get("/", response_model=List[Device])
-async def get_all_devices(db: Session = Depends(get_db)):
+async def get_all_devices(db: Session = Depends(get_read_db)):
     devices = db.query(DBDevice).all()
     return [db_to_model(d) for d in devices]
 
@@ -62,6 +66,53 @@ async def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
     db.refresh(db_device)
     return db_to_model(db_device)
 
+class BulkImportRow(BaseModel):
+    row: int
+    ip: str
+    name: str
+    status: str
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BulkImportResult(BaseModel):
+    total: int
+    created: int
+    updated: int
+    skipped: int
+    failed: int
+    results: List[BulkImportRow]
+
+@router.post("/bulk", response_model=BulkImportResult)
+async def bulk_import_devices(
+    request: Request,
+    on_conflict: str = Query("update", pattern="^(update|skip)$"),
+    db: Session = Depends(get_db)
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        items = device_import.iter_csv(request.stream())
+    elif content_type in ("application/json", "application/x-ndjson", ""):
+        items = device_import.iter_json(request.stream())
+    else:
+        raise HTTPException(status_code=415, detail="Body must be JSON, NDJSON or CSV")
+
+    try:
+        results = await device_import.import_devices(db, items, on_conflict)
+        db.commit()
+    except device_import.ImportFormatError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Import failed, no devices were changed: {str(e)}")
+
+    counts = {s: sum(1 for r in results if r["status"] == s) for s in ("created", "updated", "skipped", "failed")}
+    return BulkImportResult(
+        total=len(results),
+        results=[BulkImportRow(**r) for r in results],
+        **counts
+    )
+
 @router.get("/{device_id}", response_model=Device)
 async def get_device(device_id: str, db: Session = Depends(get_db)):
     device = db.query(DBDevice).filter(DBDevice.id == device_id).first()
@@ -94,8 +145,10 @@ async def delete_device(device_id: str, db: Session = Depends(get_db)):
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     
+    filenames = [b.filename for b in device.backups]
     db.delete(device)
     db.commit()
+    retention.remove_unreferenced_files(db, filenames)
     return None
 
 class BatchDeleteRequest(BaseModel):
@@ -111,6 +164,7 @@ async def batch_delete_devices(request: BatchDeleteRequest, db: Session = Depend
     success = 0
     failed = 0
     errors = []
+    filenames = []
     
     for device_id in request.device_ids:
         try:
@@ -120,6 +174,7 @@ async def batch_delete_devices(request: BatchDeleteRequest, db: Session = Depend
                 errors.append(f"Device {device_id} not found")
                 continue
             
+            filenames.extend(b.filename for b in device.backups)
             db.delete(device)
             success += 1
         except Exception as e:
@@ -127,6 +182,7 @@ async def batch_delete_devices(request: BatchDeleteRequest, db: Session = Depend
             errors.append(f"Failed to delete device {device_id}: {str(e)}")
     
     db.commit()
+    retention.remove_unreferenced_files(db, filenames)
     
     return BatchDeleteResult(
         success=success,
@@ -0,0 +1,96 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from sqlalchemy.orm import Session
+from database import get_db, SessionLocal
+from datetime import datetime
+import asyncio
+import json
+from services import retention
+from services import scheduler as schedule_service
+
+router = APIRouter()
+
+class RetentionPolicyUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    keep_last: Optional[int] = None
+    keep_daily_days: Optional[int] = None
+    keep_monthly_months: Optional[int] = None
+    keep_changed: Optional[bool] = None
+    cron: Optional[str] = None
+
+class RetentionPolicy(BaseModel):
+    enabled: bool
+    keep_last: int
+    keep_daily_days: int
+    keep_monthly_months: int
+    keep_changed: bool
+    cron: str
+    next_run_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    last_status: Optional[str] = None
+
+class RetentionReport(BaseModel):
+    status: Optional[str] = None
+    report: Optional[Dict[str, Any]] = None
+
+def db_to_model(policy) -> RetentionPolicy:
+    return RetentionPolicy(
+        enabled=bool(policy.enabled),
+        keep_last=policy.keep_last,
+        keep_daily_days=policy.keep_daily_days or 0,
+        keep_monthly_months=policy.keep_monthly_months or 0,
+        keep_changed=bool(policy.keep_changed),
+        cron=policy.cron,
+        next_run_at=policy.next_run_at,
+        last_run_at=policy.last_run_at,
+        last_status=policy.last_status
+    )
+
+@router.get("/policy", response_model=RetentionPolicy)
+async def get_policy(db: Session = Depends(get_db)):
+    policy = retention.get_policy(db)
+    db.commit()
+    return db_to_model(policy)
+
+@router.put("/policy", response_model=RetentionPolicy)
+async def update_policy(policy_update: RetentionPolicyUpdate, db: Session = Depends(get_db)):
+    fields = {k: v for k, v in policy_update.model_dump(exclude_unset=True).items() if v is not None}
+    if "cron" in fields:
+        try:
+            schedule_service.next_run(fields["cron"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if fields.get("keep_last", 1) < 1:
+        raise HTTPException(status_code=400, detail="keep_last must be at least 1")
+    if fields.get("keep_daily_days", 0) < 0 or fields.get("keep_monthly_months", 0) < 0:
+        raise HTTPException(status_code=400, detail="keep_daily_days and keep_monthly_months must not be negative")
+
+    policy = retention.get_policy(db)
+    for field, value in fields.items():
+        setattr(policy, field, value)
+    policy.next_run_at = schedule_service.next_run(policy.cron) if policy.enabled else None
+    db.commit()
+    db.refresh(policy)
+    return db_to_model(policy)
+
+@router.post("/run")
+async def run_retention(
+    dry_run: bool = Query(True, description="only report what would be deleted"),
+    vacuum: bool = Query(False, description="run a full VACUUM afterwards (SQLite)")
+):
+    try:
+        report = await asyncio.to_thread(retention.run, SessionLocal, dry_run, vacuum and not dry_run)
+    except retention.RetentionBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await asyncio.to_thread(retention.save_report, SessionLocal, report, "dry_run" if dry_run else "completed")
+    return report
+
+@router.get("/report", response_model=RetentionReport)
+async def get_report(db: Session = Depends(get_db)):
+    policy = retention.get_policy(db)
+    db.commit()
+    return RetentionReport(
+        status=policy.last_status,
+        report=json.loads(policy.last_report) if policy.last_report else None
+    )
@@ -0,0 +1,185 @@
+from fastapi import APIRouter, HTTPException, Depends
+from pydantic import BaseModel
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from database import get_db
+from models import BackupSchedule as DBSchedule, Template as DBTemplate
+from datetime import datetime
+import uuid
+import json
+from services import scheduler as schedule_service
+
+router = APIRouter()
+
+class ScheduleCreate(BaseModel):
+    name: str
+    cron: str
+    template_id: str
+    commands: List[str]
+    location: Optional[str] = None
+    vendor: Optional[str] = None
+    device_ids: Optional[List[str]] = None
+    only_changed: bool = False
+    jitter_seconds: int = 300
+    enabled: bool = True
+
+class ScheduleUpdate(BaseModel):
+    name: Optional[str] = None
+    cron: Optional[str] = None
+    template_id: Optional[str] = None
+    commands: Optional[List[str]] = None
+    location: Optional[str] = None
+    vendor: Optional[str] = None
+    device_ids: Optional[List[str]] = None
+    only_changed: Optional[bool] = None
+    jitter_seconds: Optional[int] = None
+    enabled: Optional[bool] = None
+
+class Schedule(BaseModel):
+    id: str
+    name: str
+    cron: str
+    template_id: str
+    commands: List[str]
+    location: Optional[str] = None
+    vendor: Optional[str] = None
+    device_ids: List[str] = []
+    only_changed: bool
+    jitter_seconds: int
+    enabled: bool
+    next_run_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    last_job_id: Optional[str] = None
+    last_status: Optional[str] = None
+    last_error: Optional[str] = None
+
+def db_to_model(schedule: DBSchedule) -> Schedule:
+    return Schedule(
+        id=schedule.id,
+        name=schedule.name,
+        cron=schedule.cron,
+        template_id=schedule.template_id,
+        commands=json.loads(schedule.commands),
+        location=schedule.location,
+        vendor=schedule.vendor,
+        device_ids=json.loads(schedule.device_ids) if schedule.device_ids else [],
+        only_changed=bool(schedule.only_changed),
+        jitter_seconds=schedule.jitter_seconds or 0,
+        enabled=bool(schedule.enabled),
+        next_run_at=schedule.next_run_at,
+        last_run_at=schedule.last_run_at,
+        last_job_id=schedule.last_job_id,
+        last_status=schedule.last_status,
+        last_error=schedule.last_error
+    )
+
+def validate_schedule(db: Session, cron: str, template_id: str, commands: List[str], jitter_seconds: int):
+    try:
+        schedule_service.next_run(cron)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not commands:
+        raise HTTPException(status_code=400, detail="No commands provided")
+    if jitter_seconds < 0:
+        raise HTTPException(status_code=400, detail="jitter_seconds must not be negative")
+    if not db.query(DBTemplate).filter(DBTemplate.id == template_id).first():
+        raise HTTPException(status_code=404, detail="Template not found")
+
+@router.get("/", response_model=List[Schedule])
+async def get_all_schedules(db: Session = Depends(get_db)):
+    schedules = db.query(DBSchedule).order_by(DBSchedule.created_at).all()
+    return [db_to_model(s) for s in schedules]
+
+@router.get("/{schedule_id}", response_model=Schedule)
+async def get_schedule(schedule_id: str, db: Session = Depends(get_db)):
+    schedule = db.query(DBSchedule).filter(DBSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return db_to_model(schedule)
+
+@router.post("/", response_model=Schedule, status_code=201)
+async def create_schedule(schedule: ScheduleCreate, db: Session = Depends(get_db)):
+    validate_schedule(db, schedule.cron, schedule.template_id, schedule.commands, schedule.jitter_seconds)
+
+    db_schedule = DBSchedule(
+        id=str(uuid.uuid4()),
+        name=schedule.name,
+        cron=schedule.cron,
+        template_id=schedule.template_id,
+        commands=json.dumps(schedule.commands, ensure_ascii=False),
+        location=schedule.location,
+        vendor=schedule.vendor,
+        device_ids=json.dumps(schedule.device_ids) if schedule.device_ids else None,
+        only_changed=schedule.only_changed,
+        jitter_seconds=schedule.jitter_seconds,
+        enabled=schedule.enabled,
+        next_run_at=schedule_service.next_run(schedule.cron)
+    )
+    db.add(db_schedule)
+    db.commit()
+    db.refresh(db_schedule)
+    return db_to_model(db_schedule)
+
+@router.put("/{schedule_id}", response_model=Schedule)
+async def update_schedule(schedule_id: str, schedule_update: ScheduleUpdate, db: Session = Depends(get_db)):
+    schedule = db.query(DBSchedule).filter(DBSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    fields = schedule_update.model_dump(exclude_unset=True)
+    validate_schedule(
+        db,
+        fields.get("cron") or schedule.cron,
+        fields.get("template_id") or schedule.template_id,
+        fields["commands"] if fields.get("commands") is not None else json.loads(schedule.commands),
+        fields["jitter_seconds"] if fields.get("jitter_seconds") is not None else schedule.jitter_seconds or 0
+    )
+
+    if fields.get("name"):
+        schedule.name = fields["name"]
+    if fields.get("cron"):
+        schedule.cron = fields["cron"]
+    if fields.get("template_id"):
+        schedule.template_id = fields["template_id"]
+    if fields.get("commands") is not None:
+        schedule.commands = json.dumps(fields["commands"], ensure_ascii=False)
+    if "location" in fields:
+        schedule.location = fields["location"] or None
+    if "vendor" in fields:
+        schedule.vendor = fields["vendor"] or None
+    if "device_ids" in fields:
+        schedule.device_ids = json.dumps(fields["device_ids"]) if fields["device_ids"] else None
+    if fields.get("only_changed") is not None:
+        schedule.only_changed = fields["only_changed"]
+    if fields.get("jitter_seconds") is not None:
+        schedule.jitter_seconds = fields["jitter_seconds"]
+    if fields.get("enabled") is not None:
+        schedule.enabled = fields["enabled"]
+    schedule.next_run_at = schedule_service.next_run(schedule.cron)
+
+    db.commit()
+    db.refresh(schedule)
+    return db_to_model(schedule)
+
+@router.delete("/{schedule_id}", status_code=204)
+async def delete_schedule(schedule_id: str, db: Session = Depends(get_db)):
+    schedule = db.query(DBSchedule).filter(DBSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    db.delete(schedule)
+    db.commit()
+    return None
+
+@router.post("/{schedule_id}/run", response_model=Schedule, status_code=202)
+async def run_schedule(schedule_id: str, db: Session = Depends(get_db)):
+    schedule = db.query(DBSchedule).filter(DBSchedule.id == schedule_id).first()
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+
+    job_id = schedule_service.dispatch(db, schedule)
+    db.commit()
+    db.refresh(schedule)
+    if not job_id:
+        raise HTTPException(status_code=409, detail=schedule.last_error or "Schedule could not be started")
+    return db_to_model(schedule)
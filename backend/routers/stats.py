@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from database import get_read_db
+from datetime import datetime
+from services import stats as stats_service
+
+router = APIRouter()
+
+class GroupStats(BaseModel):
+    devices: int
+    backed_up: int
+    failing: int
+    stale: int
+    coverage: float
+
+class LocationStats(GroupStats):
+    location: str
+
+class VendorStats(GroupStats):
+    vendor: str
+
+class DailyStats(BaseModel):
+    day: str
+    backups: int
+    changes: int
+    failures: int
+
+class FailureClassStats(BaseModel):
+    error_class: str
+    count: int
+
+class DeviceStatus(BaseModel):
+    id: str
+    name: str
+    ip: str
+    vendor: str
+    location: Optional[str] = None
+    last_success: Optional[datetime] = None
+    last_failure: Optional[datetime] = None
+    last_error: Optional[str] = None
+    last_error_class: Optional[str] = None
+    age_hours: Optional[float] = None
+
+class FleetStats(BaseModel):
+    generated_at: datetime
+    window_days: int
+    stale_hours: float
+    devices: int
+    backed_up: int
+    coverage: float
+    failing: int
+    stale: int
+    backups: int
+    age: Dict[str, int]
+    by_location: List[LocationStats]
+    by_vendor: List[VendorStats]
+    daily: List[DailyStats]
+    failures_by_class: List[FailureClassStats]
+    attention: List[DeviceStatus]
+
+@router.get("/", response_model=FleetStats)
+async def get_stats(db: Session = Depends(get_read_db)):
+    return stats_service.stats_cache.get(lambda: stats_service.fleet_stats(db))
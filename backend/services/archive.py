@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+from models import Backup, Device
+from services import blobstore, diff, history, search, stats
+
+FINGERPRINT_BATCH_SIZE = 500
+
+# Batch jobs write one INSERT for blobs, one for backup rows and one executemany
+# UPDATE for the device columns per chunk, instead of a query/flush round-trip
+# per device.
+def add_backups(db: Session, entries: List[Dict]) -> List[Dict]:
+    if not entries:
+        return []
+    stored = blobstore.put_many(db, [entry["content"] for entry in entries])
+    
+    rows = []
+    texts: Dict[str, str] = {}
+    latest: Dict[str, Dict] = {}
+    created_at = datetime.utcnow()
+    # Dashboard counters: a backup counts as a change when its fingerprint differs
+    # from the device's previous one (see services/stats.py)
+    previous = dict(
+        db.query(Device.id, Device.last_config_hash)
+        .filter(Device.id.in_({entry["switch_id"] for entry in entries}))
+        .all()
+    )
+    added: Dict[str, int] = {}
+    daily: Dict[tuple, int] = {}
+    for entry, (digest, size, text) in sorted(zip(entries, stored), key=lambda item: item[0]["timestamp"]):
+        fingerprint = entry.get("fingerprint") or diff.fingerprint(text)
+        day = stats.day_key(entry["timestamp"])
+        daily[(day, "backups")] = daily.get((day, "backups"), 0) + 1
+        if previous.get(entry["switch_id"]) != fingerprint:
+            daily[(day, "changes")] = daily.get((day, "changes"), 0) + 1
+        previous[entry["switch_id"]] = fingerprint
+        added[entry["switch_id"]] = added.get(entry["switch_id"], 0) + 1
+        rows.append({
+            "id": entry["id"],
+            "switch_id": entry["switch_id"],
+            "timestamp": entry["timestamp"],
+            "content": "",
+            "content_hash": digest,
+            "fingerprint": fingerprint,
+            "size": size,
+            "filename": entry.get("filename"),
+            "commands": entry.get("commands"),
+            "template_name": entry.get("template_name"),
+            "created_at": created_at
+        })
+        texts[digest] = text
+        current = latest.get(entry["switch_id"])
+        if current is None or entry["timestamp"] > current["last_backup"]:
+            latest[entry["switch_id"]] = {
+                "id": entry["switch_id"],
+                "last_backup": entry["timestamp"],
+                "last_verified": entry["timestamp"],
+                "last_config_hash": fingerprint
+            }
+    
+    db.execute(insert(Backup), rows)
+    history.record_versions(db, rows)
+    search.index_many(db, texts)
+    db.execute(update(Device), list(latest.values()))
+    stats.adjust_backup_counts(db, added)
+    stats.add_daily(db, daily)
+    return rows
+
+# "Only store on change" mode: results whose volatile-stripped fingerprint
+# matches the device's last stored config just bump devices.last_verified.
+def store_results(db: Session, entries: List[Dict], only_changed: bool = False) -> Dict[str, str]:
+    for entry in entries:
+        entry["fingerprint"] = diff.fingerprint(blobstore.normalize(entry["content"]))
+    
+    known = {}
+    if only_changed:
+        known = dict(
+            db.query(Device.id, Device.last_config_hash)
+            .filter(Device.id.in_({entry["switch_id"] for entry in entries}))
+            .all()
+        )
+    changed, unchanged = [], []
+    for entry in entries:
+        if only_changed and known.get(entry["switch_id"]) == entry["fingerprint"]:
+            unchanged.append(entry)
+        else:
+            changed.append(entry)
+    
+    add_backups(db, changed)
+    if unchanged:
+        db.execute(update(Device), [{"id": e["switch_id"], "last_verified": e["timestamp"]} for e in unchanged])
+    
+    outcome = {e["switch_id"]: "changed" for e in changed}
+    outcome.update({e["switch_id"]: "unchanged" for e in unchanged})
+    return outcome
+
+def backfill_fingerprints(db: Session) -> int:
+    device_ids = [
+        row[0] for row in
+        db.query(Device.id).filter(Device.last_config_hash.is_(None), Device.last_backup.isnot(None)).all()
+    ]
+    for i in range(0, len(device_ids), FINGERPRINT_BATCH_SIZE):
+        for device in db.query(Device).filter(Device.id.in_(device_ids[i:i + FINGERPRINT_BATCH_SIZE])).all():
+            backup = (
+                db.query(Backup)
+                .filter(Backup.switch_id == device.id)
+                .order_by(Backup.timestamp.desc(), Backup.id.desc())
+                .first()
+            )
+            if backup is None:
+                continue
+            device.last_config_hash = diff.fingerprint(blobstore.normalize(blobstore.backup_content(db, backup)))
+            device.last_verified = device.last_verified or backup.timestamp
+        db.commit()
+    return len(device_ids)
+
+# Per-backup fingerprints only exist for rows written since the column was added;
+# older rows get theirs here, one blob decode per distinct content hash.
+def fill_backup_fingerprints(db: Session) -> int:
+    filled = 0
+    while True:
+        digests = [
+            row[0] for row in
+            db.query(Backup.content_hash)
+            .filter(Backup.fingerprint.is_(None), Backup.content_hash.isnot(None))
+            .distinct()
+            .limit(FINGERPRINT_BATCH_SIZE)
+            .all()
+        ]
+        if not digests:
+            return filled
+        db.execute(
+            update(Backup.__table__)
+            .where(Backup.__table__.c.content_hash == bindparam("digest"), Backup.__table__.c.fingerprint.is_(None))
+            .values(fingerprint=bindparam("value")),
+            [{"digest": d, "value": diff.fingerprint(blobstore.get(db, d) or "")} for d in digests]
+        )
+        db.commit()
+        filled += len(digests)
@@ -0,0 +1,473 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import paramiko
+from database import SessionLocal
+from models import Device, Template
+from services import archive, cli, metrics, retention, stats
+from services.breaker import CircuitOpen, breaker
+from services.collector import collector
+from services.jobs import Job, job_manager
+from services.taskqueue import task_queue
+
+BACKUP_DIR = os.getenv("NETGUARD_BACKUP_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "backups"))
+SPOOL_DIR = os.path.join(BACKUP_DIR, ".spool")
+os.makedirs(SPOOL_DIR, exist_ok=True)
+
+PERSIST_CHUNK_SIZE = int(os.getenv("NETGUARD_PERSIST_CHUNK_SIZE", 100))
+PERSIST_CHUNK_BYTES = int(os.getenv("NETGUARD_PERSIST_CHUNK_BYTES", 32 * 1024 * 1024))
+PERSIST_INTERVAL = float(os.getenv("NETGUARD_PERSIST_INTERVAL", 2))
+SSH_TIMEOUT = float(os.getenv("NETGUARD_SSH_TIMEOUT", 30))
+TCP_PRECHECK_TIMEOUT = float(os.getenv("NETGUARD_TCP_PRECHECK_TIMEOUT", 3))
+QUEUE_POLL_INTERVAL = float(os.getenv("NETGUARD_QUEUE_POLL_INTERVAL", 0.5))
+QUEUE_JOB_TIMEOUT = float(os.getenv("NETGUARD_QUEUE_JOB_TIMEOUT", 4 * 3600))
+
+def ssh_failure(device_name: str, host: str, error: str, retryable: bool = False) -> Dict:
+    return {
+        "device_name": device_name,
+        "device_ip": host,
+        "success": False,
+        "filename": None,
+        "filepath": None,
+        "spool": None,
+        "size": None,
+        "timestamp": None,
+        "error": error,
+        "retryable": retryable
+    }
+
+# A plain TCP connect fails a dead or filtered device in a few seconds instead of
+# the full paramiko connect/banner/auth timeouts; the socket is then reused for SSH.
+def tcp_precheck(host: str, port: int) -> Optional[socket.socket]:
+    if TCP_PRECHECK_TIMEOUT <= 0:
+        return None
+    sock = socket.create_connection((host, port), timeout=TCP_PRECHECK_TIMEOUT)
+    sock.settimeout(None)
+    # Pager answers are single keystrokes; don't let Nagle hold them back
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def execute_ssh_commands(host: str, username: str, password: str, port: int, commands: List[str], device_name: str, vendor: Optional[str] = None) -> Dict:
+    with metrics.ssh_sessions_in_flight.track():
+        result, outcome = collect_device(host, username, password, port, commands, device_name, vendor)
+    metrics.ssh_results.inc(result=outcome)
+    if not result["success"]:
+        result["error_class"] = outcome
+    return result
+
+# The breaker counts a collection run once, however often it is retried, so an
+# unreachable result only carries `breaker_error` and Collector.run records it
+# after the last attempt. A probe is not retried: the circuit has to be settled
+# by that one call.
+def unreachable(device_name: str, host: str, error: str, retryable: bool, probe: bool) -> Dict:
+    result = ssh_failure(device_name, host, error, retryable=retryable and not probe)
+    result["breaker_error"] = error
+    return result
+
+def collect_device(host: str, username: str, password: str, port: int, commands: List[str], device_name: str, vendor: Optional[str]) -> Tuple[Dict, str]:
+    vendor_label = getattr(cli.get_profile(vendor), "name", "Generic")
+    try:
+        probe = breaker.before_call(host)
+    except CircuitOpen as e:
+        return ssh_failure(device_name, host, str(e)), "circuit_open"
+    
+    started = time.perf_counter()
+    try:
+        sock = tcp_precheck(host, port)
+    except OSError as e:
+        error = f"TCP port {port} on {host} is not reachable - {str(e) or 'timed out'}"
+        return unreachable(device_name, host, error, isinstance(e, socket.timeout), probe), "unreachable"
+    if sock:
+        metrics.ssh_stage_seconds.observe(time.perf_counter() - started, stage="connect", vendor=vendor_label)
+    
+    ssh = None
+    transport = None
+    spool = None
+    try:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        
+        started = time.perf_counter()
+        ssh.connect(
+            hostname=host,
+            username=username,
+            password=password,
+            port=port,
+            sock=sock,
+            timeout=SSH_TIMEOUT,
+            auth_timeout=SSH_TIMEOUT,
+            banner_timeout=SSH_TIMEOUT,
+            allow_agent=False,
+            look_for_keys=False,
+            compress=True,
+            gss_auth=False,
+            gss_kex=False,
+            gss_deleg_creds=False
+        )
+        metrics.ssh_stage_seconds.observe(time.perf_counter() - started, stage="auth", vendor=vendor_label)
+        
+        transport = ssh.get_transport()
+        if transport:
+            transport.set_keepalive(30)
+        
+        # Each command's output is appended to a spool file as soon as it is read,
+        # so a session holds at most one command's output and the result carries
+        # only the path; persist_results loads it when the device is stored.
+        size = 0
+        spool = os.path.join(SPOOL_DIR, f"{uuid.uuid4()}.part")
+        with open(spool, 'w', encoding='utf-8') as f, cli.CliSession(ssh, vendor) as session:
+            for command, output, error in session.run_all(commands):
+                section = f"# Command: {command}\n# Error: {error}\n" if error else f"# Command: {command}\n{output}\n"
+                if size:
+                    section = "\n" + section
+                f.write(section)
+                size += len(section.encode("utf-8"))
+        
+        breaker.record_success(host)
+        metrics.collected_bytes.inc(size, vendor=vendor_label)
+        
+        timestamp = datetime.utcnow()
+        safe_hostname = device_name.replace(" ", "_").replace("/", "_").replace("\\", "_")
+        filename = f"{safe_hostname}_{host}.cfg"
+        filepath = os.path.join(BACKUP_DIR, filename)
+        
+        result = {
+            "device_name": device_name,
+            "device_ip": host,
+            "success": True,
+            "filename": filename,
+            "filepath": filepath,
+            "spool": spool,
+            "size": size,
+            "timestamp": timestamp.isoformat(),
+            "error": None
+        }
+        spool = None
+        return result, "success"
+    
+    except paramiko.AuthenticationException:
+        # The device answered, so it counts as reachable; wrong credentials are not retried
+        breaker.record_success(host)
+        return ssh_failure(device_name, host, f"SSH authentication failed for {username}@{host}:{port}"), "auth_failed"
+    except cli.PromptTimeout as e:
+        # Likewise reachable: logged in but the prompt is unknown, which a retry won't change
+        breaker.record_success(host)
+        return ssh_failure(device_name, host, f"CLI prompt not recognised on {host}:{port} - {str(e)}"), "prompt_timeout"
+    except paramiko.SSHException as e:
+        error = f"SSH connection error to {host}:{port} - {str(e)}"
+        return unreachable(device_name, host, error, True, probe), "ssh_error"
+    except socket.timeout:
+        error = f"SSH connection timeout to {host}:{port}"
+        return unreachable(device_name, host, error, True, probe), "timeout"
+    except socket.error as e:
+        error = f"Network error connecting to {host}:{port} - {str(e)}"
+        return unreachable(device_name, host, error, isinstance(e, ConnectionResetError), probe), "network_error"
+    except Exception as e:
+        error = f"SSH connection failed to {host}:{port} - {str(e)}"
+        return unreachable(device_name, host, error, isinstance(e, EOFError), probe), "error"
+    finally:
+        if ssh:
+            try:
+                ssh.close()
+            except:
+                pass
+        if sock:
+            sock.close()
+        if spool:
+            discard_spool(spool)
+
+def discard_spool(path: Optional[str]):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def read_spool(path: str) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# Spooled outputs are read back one chunk at a time and moved into place as the
+# device's backup file once the chunk is committed.
+def persist_results(results: List[Dict], commands: List[str], template_name: str, only_changed: bool) -> Dict[str, str]:
+    db = SessionLocal()
+    try:
+        outcome = archive.store_results(db, [
+            {
+                "id": r.setdefault("backup_id", str(uuid.uuid4())),
+                "switch_id": r["device_id"],
+                "timestamp": datetime.fromisoformat(r["timestamp"]),
+                "content": read_spool(r["spool"]),
+                "filename": r["filename"],
+                "commands": ','.join(commands),
+                "template_name": template_name
+            }
+            for r in results
+        ], only_changed=only_changed)
+        db.commit()
+        retention.mark_managed(r["filename"] for r in results)
+        for r in results:
+            os.replace(r.pop("spool"), r["filepath"])
+        return outcome
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        for r in results:
+            discard_spool(r.pop("spool", None))
+
+# Failures only touch the device columns and daily counters read by /api/stats;
+# they are recorded by the process that owns the job, also in worker mode.
+def persist_failures(results: List[Dict]):
+    if not results:
+        return
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        stats.record_failures(db, [
+            {"switch_id": r["device_id"], "timestamp": now, "error": r.get("error"), "error_class": r.get("error_class")}
+            for r in results
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+def record_result(job: Job, result: Dict, **fields):
+    if result["success"]:
+        job_manager.record(
+            job, result["device_id"],
+            status="success",
+            filename=result["filename"],
+            timestamp=result["timestamp"],
+            attempts=result.get("attempts", 1),
+            duration=result.get("duration"),
+            **fields
+        )
+    else:
+        job_manager.record(
+            job, result["device_id"],
+            status="failed",
+            error=result["error"],
+            attempts=result.get("attempts", 1),
+            duration=result.get("duration")
+        )
+
+def stored_template_id(template: Dict) -> Optional[str]:
+    if not template.get("id"):
+        return None
+    db = SessionLocal()
+    try:
+        stored = db.get(Template, template["id"])
+    finally:
+        db.close()
+    if stored is None or (stored.username, stored.password, stored.port) != (
+        template.get("username"), template.get("password"), template.get("port", 22)
+    ):
+        return None
+    return stored.id
+
+def template_credentials(template_id: str) -> Tuple[str, str]:
+    db = SessionLocal()
+    try:
+        template = db.get(Template, template_id)
+    finally:
+        db.close()
+    if template is None:
+        raise LookupError(f"Login template {template_id} no longer exists")
+    return template.username, template.password
+
+def execute_with_template(template_id: str, host: str, port: int, commands: List[str], device_name: str, vendor: Optional[str] = None) -> Dict:
+    username, password = template_credentials(template_id)
+    return execute_ssh_commands(host, username, password, port, commands, device_name, vendor)
+
+# Payloads sit in collection_tasks or Redis until a worker leases them. For a
+# stored login template only its id is queued and the worker reads the
+# credentials from the database; ad-hoc credentials have nowhere else to live
+# and travel in the payload.
+def queue_payload(task: Dict, template_name: str, only_changed: bool, template_id: Optional[str] = None) -> Dict:
+    args = list(task["args"])
+    if template_id:
+        args[1] = args[2] = None
+    return {
+        "device_id": task["device_id"],
+        "device_name": task["device_name"],
+        "device_ip": task["device_ip"],
+        "site": task.get("site"),
+        "delay": task.get("delay", 0),
+        "args": args,
+        "template_id": template_id,
+        "template_name": template_name,
+        "only_changed": only_changed
+    }
+
+def task_from_payload(payload: Dict) -> Dict:
+    task, args = execute_ssh_commands, tuple(payload["args"])
+    if payload.get("template_id"):
+        host, _, _, port, commands, device_name, vendor = args
+        task, args = execute_with_template, (payload["template_id"], host, port, commands, device_name, vendor)
+    return {
+        "device_id": payload["device_id"],
+        "device_name": payload["device_name"],
+        "device_ip": payload["device_ip"],
+        "site": payload.get("site"),
+        "delay": payload.get("delay", 0),
+        "task": task,
+        "args": args
+    }
+
+def queue_timeout_result(payload: Dict) -> Dict:
+    result = ssh_failure(
+        payload["device_name"], payload["device_ip"],
+        f"No worker reported a result within {QUEUE_JOB_TIMEOUT:.0f}s"
+    )
+    result["device_id"] = payload["device_id"]
+    result["error_class"] = "queue_timeout"
+    return result
+
+# With a shared task queue configured, the API process only enqueues device tasks
+# and aggregates what the workers report; collection and persistence happen in
+# worker.py. Devices without a result after QUEUE_JOB_TIMEOUT (no worker running,
+# or every worker stuck) are reported as failed. Tasks still queued when the job
+# ends, times out or is cancelled are dropped.
+async def collect_queued(job_id: str, payloads: List[Dict]) -> AsyncIterator[Dict]:
+    await asyncio.to_thread(task_queue.enqueue, job_id, payloads)
+    remaining = {p["device_id"]: p for p in payloads}
+    deadline = time.monotonic() + QUEUE_JOB_TIMEOUT if QUEUE_JOB_TIMEOUT > 0 else None
+    try:
+        while remaining:
+            if deadline is not None and time.monotonic() >= deadline:
+                for payload in remaining.values():
+                    yield queue_timeout_result(payload)
+                return
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+            for result in await asyncio.to_thread(task_queue.take_results, job_id):
+                if remaining.pop(result["device_id"], None) is not None:
+                    yield result
+    finally:
+        await asyncio.to_thread(task_queue.purge, job_id)
+
+async def run_queued_job(job: Job, backup_tasks: List[Dict], template: Dict, only_changed: bool):
+    template_id = await asyncio.to_thread(stored_template_id, template)
+    template_name = template.get("name", "Unknown")
+    payloads = [queue_payload(task, template_name, only_changed, template_id) for task in backup_tasks]
+    failures = []
+    async for result in collect_queued(job.id, payloads):
+        record_result(job, result)
+        if result.get("change"):
+            job_manager.record(job, result["device_id"], change=result["change"], worker=result.get("worker_id"))
+        if not result["success"]:
+            failures.append(result)
+        if len(failures) >= PERSIST_CHUNK_SIZE:
+            await asyncio.to_thread(persist_failures, failures)
+            failures = []
+    await asyncio.to_thread(persist_failures, failures)
+
+async def run_backup_job(job: Job, backup_tasks: List[Dict], commands: List[str], template: Dict, only_changed: bool = False):
+    if task_queue is not None:
+        return await run_queued_job(job, backup_tasks, template, only_changed)
+    template_name = template.get("name", "Unknown")
+    
+    pending = []
+    pending_bytes = 0
+    failures = []
+    last_flush = time.monotonic()
+    
+    # A device is reported as successful only once its chunk is committed
+    async def flush():
+        nonlocal pending_bytes, failures, last_flush
+        batch = pending[:]
+        pending.clear()
+        pending_bytes = 0
+        last_flush = time.monotonic()
+        failed, failures = failures, []
+        await asyncio.to_thread(persist_failures, failed)
+        if not batch:
+            return
+        try:
+            outcome = await asyncio.to_thread(persist_results, batch, commands, template_name, only_changed)
+        except Exception as e:
+            for result in batch:
+                record_result(job, {**result, "success": False, "error": f"Failed to store backup: {str(e)}"})
+            raise
+        for result in batch:
+            change = outcome.get(result["device_id"])
+            record_result(job, result, **({"change": change} if change else {}))
+    
+    try:
+        async for result in collector.collect(backup_tasks):
+            if result["success"]:
+                pending.append(result)
+                pending_bytes += result["size"]
+            else:
+                failures.append(result)
+                record_result(job, result)
+            
+            if (
+                len(pending) + len(failures) >= PERSIST_CHUNK_SIZE
+                or pending_bytes >= PERSIST_CHUNK_BYTES
+                or (pending and time.monotonic() - last_flush >= PERSIST_INTERVAL)
+            ):
+                await flush()
+        
+        if pending or failures:
+            await flush()
+    finally:
+        # A cancelled or failed job leaves no spool files behind
+        for result in pending:
+            discard_spool(result.get("spool"))
+
+def build_backup_tasks(devices: List[Device], template: Dict, commands: List[str], delays: Optional[Dict[str, float]] = None) -> List[Dict]:
+    username = template.get("username")
+    password = template.get("password")
+    port = template.get("port", 22)
+    
+    backup_tasks = []
+    for device in devices:
+        backup_tasks.append({
+            "device_id": device.id,
+            "device_name": device.name,
+            "device_ip": device.ip,
+            "site": device.location,
+            "delay": (delays or {}).get(device.id, 0),
+            "task": execute_ssh_commands,
+            "args": (device.ip, username, password, port, commands, device.name, device.vendor)
+        })
+    return backup_tasks
+
+# Single-device backups go through the same collector as batch jobs, so they share
+# its executor, concurrency limits, circuit breaker and retries; only the awaiting
+# request is held up while the session runs.
+async def backup_device(device: Device, template: Dict, commands: List[str]) -> Dict:
+    task = build_backup_tasks([device], template, commands)[0]
+    if task_queue is not None:
+        template_id = await asyncio.to_thread(stored_template_id, template)
+        payload = queue_payload(task, template.get("name", "Unknown"), False, template_id)
+        results = [result async for result in collect_queued(str(uuid.uuid4()), [payload])]
+        result = results[0]
+    else:
+        result = await collector.run(task)
+        if result["success"]:
+            await asyncio.to_thread(persist_results, [result], commands, template.get("name", "Unknown"), False)
+    if not result["success"]:
+        await asyncio.to_thread(persist_failures, [result])
+    return result
+
+def submit_backup_job(
+    devices: List[Device],
+    template: Dict,
+    commands: List[str],
+    only_changed: bool = False,
+    delays: Optional[Dict[str, float]] = None,
+    kind: str = "backup"
+) -> Job:
+    backup_tasks = build_backup_tasks(devices, template, commands, delays)
+    return job_manager.submit(
+        [{k: t[k] for k in ("device_id", "device_name", "device_ip")} for t in backup_tasks],
+        lambda job: run_backup_job(job, backup_tasks, commands, template, only_changed),
+        kind=kind
+    )
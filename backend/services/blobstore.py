@@ -0,0 +1,172 @@
+import hashlib
+import zlib
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from models import Backup, ConfigBlob
+from services import delta
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_LEVEL = 10
+ZLIB_LEVEL = 6
+LEGACY_BATCH_SIZE = 500
+IN_CLAUSE_SIZE = 500
+MAX_CHAIN_DEPTH = 1000
+
+def normalize(content: str) -> str:
+    lines = content.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    text = "\n".join(line.rstrip() for line in lines).strip("\n")
+    return text + "\n" if text else ""
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(normalize(content).encode("utf-8")).hexdigest()
+
+def compress(raw: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+def decompress(compression: str, data: bytes) -> bytes:
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == "zlib":
+        return zlib.decompress(data)
+    return data
+
+def insert_statement(db: Session):
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(ConfigBlob).on_conflict_do_nothing(index_elements=["hash"])
+
+# The existence check only saves compressing content that is already stored;
+# another transaction can still insert the same hash before this one commits,
+# which ON CONFLICT DO NOTHING absorbs. Other dialects keep the plain insert.
+def insert_blobs(db: Session, blobs: Dict[str, bytes]):
+    rows = []
+    for digest, raw in blobs.items():
+        compression, data = compress(raw)
+        rows.append({"hash": digest, "size": len(raw), "compression": compression, "data": data})
+    statement = insert_statement(db)
+    db.execute(statement if statement is not None else insert(ConfigBlob), rows)
+
+def put(db: Session, content: str) -> Tuple[str, int]:
+    text = normalize(content)
+    raw = text.encode("utf-8")
+    digest = hashlib.sha256(raw).hexdigest()
+    if db.get(ConfigBlob, digest) is None:
+        insert_blobs(db, {digest: raw})
+    return digest, len(raw)
+
+def existing_hashes(db: Session, digests: List[str]) -> set:
+    found = set()
+    for i in range(0, len(digests), IN_CLAUSE_SIZE):
+        chunk = digests[i:i + IN_CLAUSE_SIZE]
+        found.update(row[0] for row in db.query(ConfigBlob.hash).filter(ConfigBlob.hash.in_(chunk)))
+    return found
+
+def put_many(db: Session, contents: List[str]) -> List[Tuple[str, int, str]]:
+    stored = []
+    new_blobs: Dict[str, bytes] = {}
+    for content in contents:
+        text = normalize(content)
+        raw = text.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()
+        stored.append((digest, len(raw), text))
+        new_blobs.setdefault(digest, raw)
+    
+    for digest in existing_hashes(db, list(new_blobs)):
+        del new_blobs[digest]
+    if new_blobs:
+        insert_blobs(db, new_blobs)
+    return stored
+
+def get(db: Session, digest: str) -> Optional[str]:
+    chain = []
+    blob = db.get(ConfigBlob, digest)
+    while blob is not None and blob.base_hash:
+        chain.append(blob)
+        if len(chain) > MAX_CHAIN_DEPTH:
+            raise RuntimeError(f"Delta chain for {digest} exceeds {MAX_CHAIN_DEPTH} links")
+        blob = db.get(ConfigBlob, blob.base_hash)
+    if blob is None:
+        return None
+    
+    text = decompress(blob.compression, blob.data).decode("utf-8")
+    for link in reversed(chain):
+        text = delta.decode(text, decompress(link.compression, link.data))
+    return text
+
+def chain_depth(db: Session, digest: str) -> int:
+    depth = 0
+    blob = db.get(ConfigBlob, digest)
+    while blob is not None and blob.base_hash and depth <= MAX_CHAIN_DEPTH:
+        depth += 1
+        blob = db.get(ConfigBlob, blob.base_hash)
+    return depth
+
+def materialize(db: Session, digest: str):
+    blob = db.get(ConfigBlob, digest)
+    if blob is None or not blob.base_hash:
+        return
+    raw = get(db, digest).encode("utf-8")
+    blob.compression, blob.data = compress(raw)
+    blob.base_hash = None
+    db.flush()
+
+def store_as_delta(db: Session, digest: str, base_digest: str) -> bool:
+    blob = db.get(ConfigBlob, digest)
+    base = db.get(ConfigBlob, base_digest)
+    if blob is None or base is None or blob.base_hash or base.base_hash or digest == base_digest:
+        return False
+    
+    base_text = decompress(base.compression, base.data).decode("utf-8")
+    text = decompress(blob.compression, blob.data).decode("utf-8")
+    compression, data = compress(delta.encode(base_text, text))
+    if len(data) >= len(blob.data):
+        return False
+    
+    blob.compression, blob.data = compression, data
+    blob.base_hash = base_digest
+    db.flush()
+    return True
+
+def exists(db: Session, digest: str) -> bool:
+    return db.query(ConfigBlob.hash).filter(ConfigBlob.hash == digest).first() is not None
+
+def backup_content(db: Session, backup: Backup) -> str:
+    if backup.content_hash:
+        content = get(db, backup.content_hash)
+        if content is not None:
+            return content
+    return backup.content or ""
+
+def store_backup_content(db: Session, backup: Backup, content: str):
+    backup.content_hash, backup.size = put(db, content)
+    backup.content = ""
+
+def migrate_legacy_content(db: Session) -> int:
+    migrated = 0
+    while True:
+        rows = (
+            db.query(Backup)
+            .filter(Backup.content_hash.is_(None))
+            .limit(LEGACY_BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            return migrated
+        for backup in rows:
+            store_backup_content(db, backup, backup.content or "")
+        db.commit()
+        migrated += len(rows)
@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+BREAKER_THRESHOLD = int(os.getenv("NETGUARD_BREAKER_THRESHOLD", 3))
+BREAKER_PROBE_INTERVAL = float(os.getenv("NETGUARD_BREAKER_PROBE_INTERVAL", 900))
+
+class CircuitOpen(Exception):
+    pass
+
+class Circuit:
+    __slots__ = ("failures", "opened_at", "probing", "last_error")
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.last_error: Optional[str] = None
+
+# Keyed by device address. After `threshold` consecutive unreachable collection
+# runs (a run counts once however often it was retried) the circuit opens and
+# calls fail immediately; once every `probe_interval` seconds a single call is let
+# through as a probe, and a success closes the circuit again.
+# Methods are called from collector threads, so state changes hold a lock.
+class CircuitBreaker:
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, probe_interval: float = BREAKER_PROBE_INTERVAL):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self._circuits: Dict[str, Circuit] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def before_call(self, key: str) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return False
+            now = time.monotonic()
+            wait = circuit.opened_at + self.probe_interval - now
+            if wait > 0:
+                raise CircuitOpen(
+                    f"{key} skipped: unreachable for the last {circuit.failures} runs "
+                    f"({circuit.last_error}); next probe in {wait:.0f}s"
+                )
+            # Restarting the interval keeps other calls out while the probe runs,
+            # and lets a new probe through should this one never be recorded
+            # (its run was cancelled while the session thread carried on).
+            circuit.opened_at = now
+            circuit.probing = True
+            return True
+
+    def record_success(self, key: str):
+        with self._lock:
+            self._circuits.pop(key, None)
+
+    def record_failure(self, key: str, error: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            circuit = self._circuits.setdefault(key, Circuit())
+            circuit.failures += 1
+            circuit.last_error = error
+            if circuit.probing or circuit.failures >= self.threshold:
+                circuit.opened_at = time.monotonic()
+            circuit.probing = False
+
+    def state(self, key: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None or circuit.opened_at is None:
+                return "closed"
+            if circuit.probing:
+                return "half-open"
+            return "open"
+
+breaker = CircuitBreaker()
@@ -0,0 +1,233 @@
+import codecs
+import os
+import re
+import socket
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Pattern, Sequence, Tuple, Union
+from services import metrics
+
+COMMAND_TIMEOUT = float(os.getenv("NETGUARD_COMMAND_TIMEOUT", 120))
+PROMPT_TIMEOUT = float(os.getenv("NETGUARD_PROMPT_TIMEOUT", 15))
+IDLE_TIMEOUT = float(os.getenv("NETGUARD_IDLE_TIMEOUT", 5))
+READ_POLL = 0.05
+SHELL_WIDTH = 511
+TAIL_SIZE = 512
+
+# Answered pager lines are erased by moving the cursor back over them, writing
+# spaces and moving back again (ESC[nD on Comware/VRP, backspaces on IOS)
+PAGER_ERASE = re.compile(r"\x1b\[(\d+)D[ \t]+\x1b\[\1D|\x08+[ \t]+\x08+")
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]|\x1b[=>]|[\x07\x08]")
+PAGER_MARKER = re.compile(
+    r"[ \t]*(?:--More-- ?|-{2,} ?More ?-{2,}|<--- More --->|Press any key to continue[^\n]*)",
+    re.IGNORECASE
+)
+PAGER_AT_END = re.compile(PAGER_MARKER.pattern + r"[ \t]*\Z", re.IGNORECASE)
+
+@dataclass(frozen=True)
+class VendorProfile:
+    name: str
+    discover: Pattern
+    prompt_template: str
+    disable_paging: Tuple[str, ...] = ()
+    pager_answer: str = " "
+
+    def prompt_for(self, host: str) -> Pattern:
+        return re.compile(r"(?:^|\n)" + self.prompt_template.format(host=re.escape(host)) + r"[ \t]*\Z")
+
+VRP_DISCOVER = re.compile(r"(?:^|\n)[<\[]~?\*?(?P<host>[^<>\[\]\r\n]+?)[>\]][ \t]*\Z")
+VRP_TEMPLATE = r"[<\[]~?\*?{host}(?:-[^<>\[\]\r\n]*)?[>\]]"
+IOS_DISCOVER = re.compile(r"(?:^|\n)(?P<host>[\w.\-@/:]+)(?:\([^)\r\n]*\))?[>#][ \t]*\Z")
+IOS_TEMPLATE = r"{host}(?:\([^)\r\n]*\))?[>#]"
+JUNOS_DISCOVER = re.compile(r"(?:^|\n)(?:\{[^}\r\n]*\}\n)?(?P<host>[\w.\-]+@[\w.\-]+)[>#%][ \t]*\Z")
+JUNOS_TEMPLATE = r"{host}[>#%]"
+
+HUAWEI_VRP = VendorProfile("Huawei VRP", VRP_DISCOVER, VRP_TEMPLATE, ("screen-length 0 temporary",))
+HP_COMWARE = VendorProfile("HP Comware", VRP_DISCOVER, VRP_TEMPLATE, ("screen-length disable",))
+CISCO_IOS = VendorProfile("Cisco IOS", IOS_DISCOVER, IOS_TEMPLATE, ("terminal length 0",))
+ARISTA_EOS = VendorProfile("Arista EOS", IOS_DISCOVER, IOS_TEMPLATE, ("terminal length 0",))
+JUNIPER_JUNOS = VendorProfile("Juniper Junos", JUNOS_DISCOVER, JUNOS_TEMPLATE, ("set cli screen-length 0",))
+
+VENDOR_PROFILES = {
+    "huawei": HUAWEI_VRP,
+    "vrp": HUAWEI_VRP,
+    "h3c": HP_COMWARE,
+    "comware": HP_COMWARE,
+    "hp": HP_COMWARE,
+    "cisco": CISCO_IOS,
+    "arista": ARISTA_EOS,
+    "juniper": JUNIPER_JUNOS,
+    "junos": JUNIPER_JUNOS,
+}
+
+# Unknown vendors fall back to trying every prompt shape and answering pagers
+# instead of sending a paging command the device may not understand.
+GENERIC_PROFILES = (HUAWEI_VRP, CISCO_IOS, JUNIPER_JUNOS)
+
+def get_profile(vendor: Optional[str]) -> Optional[VendorProfile]:
+    key = (vendor or "").lower()
+    for token, profile in VENDOR_PROFILES.items():
+        if token in key:
+            return profile
+    return None
+
+def strip_terminal(text: str) -> str:
+    text = ANSI_ESCAPE.sub("", PAGER_ERASE.sub("", text))
+    return text.replace("\r\n", "\n").replace("\r", "")
+
+def clean_output(text: str) -> str:
+    return PAGER_MARKER.sub("", strip_terminal(text))
+
+# Not a socket.timeout: the device answered, it just never showed a prompt we recognise
+class PromptTimeout(Exception):
+    pass
+
+def read_until_prompt(
+    chan,
+    prompt: Union[Pattern, Sequence[Pattern], None],
+    pager_answer: str = " ",
+    timeout: float = COMMAND_TIMEOUT,
+    idle_timeout: Optional[float] = None
+) -> str:
+    prompts = (prompt,) if isinstance(prompt, re.Pattern) else tuple(prompt or ())
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunks: List[str] = []
+    tail = ""
+    deadline = time.monotonic() + timeout
+    last_data = time.monotonic()
+    chan.settimeout(READ_POLL)
+
+    while True:
+        try:
+            data = chan.recv(65536)
+        except socket.timeout:
+            data = None
+
+        now = time.monotonic()
+        if data == b"":
+            break
+
+        if data:
+            last_data = now
+            text = decoder.decode(data)
+            chunks.append(text)
+            # The pager check needs the marker itself, so it runs on the tail
+            # before clean_output removes markers for the prompt match.
+            tail = strip_terminal(tail + text)[-TAIL_SIZE:]
+
+            if PAGER_AT_END.search(tail):
+                chan.send(pager_answer)
+                tail = ""
+            elif prompts:
+                cleaned = clean_output(tail)
+                if any(p.search(cleaned) for p in prompts):
+                    break
+        elif idle_timeout is not None and now - last_data >= idle_timeout:
+            break
+
+        if now >= deadline:
+            raise PromptTimeout(f"Timed out after {timeout:.0f}s waiting for the device prompt")
+
+    chunks.append(decoder.decode(b"", final=True))
+    return clean_output("".join(chunks))
+
+def discover_prompt(chan, profile: Optional[VendorProfile], timeout: float = PROMPT_TIMEOUT) -> Tuple[VendorProfile, Pattern, str]:
+    candidates = (profile,) if profile else GENERIC_PROFILES
+    banner = ""
+    deadline = time.monotonic() + timeout
+    nudged = False
+
+    while time.monotonic() < deadline:
+        banner += read_until_prompt(
+            chan,
+            [candidate.discover for candidate in candidates],
+            timeout=max(deadline - time.monotonic(), READ_POLL),
+            idle_timeout=IDLE_TIMEOUT
+        )
+        for candidate in candidates:
+            match = candidate.discover.search(banner)
+            if match:
+                host = match.group("host")
+                return candidate, candidate.prompt_for(host), banner
+        if not nudged or not banner:
+            chan.send("\n")
+            nudged = True
+
+    raise PromptTimeout(f"No CLI prompt detected within {timeout:.0f}s")
+
+def strip_echo_and_prompt(output: str, command: str, prompt: Pattern) -> str:
+    match = prompt.search(output)
+    if match:
+        output = output[:match.start()]
+    lines = output.split("\n")
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    if lines and lines[0].strip().endswith(command.strip()):
+        lines.pop(0)
+    return "\n".join(lines).rstrip() + "\n"
+
+def run_command(chan, command: str, profile: VendorProfile, prompt: Pattern, timeout: float = COMMAND_TIMEOUT) -> str:
+    chan.send(command + "\n")
+    output = read_until_prompt(chan, prompt, pager_answer=profile.pager_answer, timeout=timeout)
+    return strip_echo_and_prompt(output, command, prompt)
+
+def disable_paging(chan, profile: VendorProfile, prompt: Pattern):
+    for command in profile.disable_paging:
+        run_command(chan, command, profile, prompt, timeout=PROMPT_TIMEOUT)
+
+class CliSession:
+    def __init__(self, client, vendor: Optional[str] = None):
+        self.client = client
+        self.profile = get_profile(vendor)
+        # A profile picked from the prompt shape of an unknown vendor only tells
+        # how to read the prompt, not which paging command the device accepts
+        self.guessed = self.profile is None
+        self.chan = None
+        self.prompt: Optional[Pattern] = None
+        self.banner = ""
+
+    @property
+    def vendor_label(self) -> str:
+        return self.profile.name if self.profile else "Generic"
+
+    def open(self):
+        started = time.perf_counter()
+        self.chan = self.client.invoke_shell(width=SHELL_WIDTH)
+        self.profile, self.prompt, self.banner = discover_prompt(self.chan, None if self.guessed else self.profile)
+        if not self.guessed:
+            disable_paging(self.chan, self.profile, self.prompt)
+        metrics.ssh_stage_seconds.observe(time.perf_counter() - started, stage="session", vendor=self.vendor_label)
+        return self
+
+    def run(self, command: str, timeout: float = COMMAND_TIMEOUT) -> str:
+        if self.chan is None or self.chan.closed:
+            self.open()
+        try:
+            with metrics.ssh_stage_seconds.time(stage="command", vendor=self.vendor_label):
+                return run_command(self.chan, command, self.profile, self.prompt, timeout=timeout)
+        except Exception:
+            # Output framing is lost once a command fails mid-read; start the
+            # next command on a fresh shell rather than parse leftovers.
+            self.close()
+            raise
+
+    def run_all(self, commands: List[str]) -> Iterator[Tuple[str, str, Optional[str]]]:
+        for command in commands:
+            try:
+                yield command, self.run(command), None
+            except Exception as e:
+                yield command, "", str(e)
+
+    def close(self):
+        if self.chan is not None:
+            try:
+                self.chan.close()
+            except Exception:
+                pass
+            self.chan = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,145 @@
+import asyncio
+import ipaddress
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+from services.breaker import breaker
+from services.ratelimit import TokenBucket
+
+MAX_CONCURRENCY = int(os.getenv("NETGUARD_MAX_CONCURRENCY", 200))
+SITE_CONCURRENCY = int(os.getenv("NETGUARD_SITE_CONCURRENCY", 32))
+SUBNET_CONCURRENCY = int(os.getenv("NETGUARD_SUBNET_CONCURRENCY", 16))
+SUBNET_PREFIX = int(os.getenv("NETGUARD_SUBNET_PREFIX", 24))
+LOGIN_RATE_PER_MINUTE = float(os.getenv("NETGUARD_LOGIN_RATE_PER_MINUTE", 300))
+LOGIN_BURST = int(os.getenv("NETGUARD_LOGIN_BURST", 0)) or None
+RETRY_ATTEMPTS = int(os.getenv("NETGUARD_RETRY_ATTEMPTS", 2))
+RETRY_BACKOFF = float(os.getenv("NETGUARD_RETRY_BACKOFF", 2))
+RETRY_BACKOFF_MAX = float(os.getenv("NETGUARD_RETRY_BACKOFF_MAX", 30))
+
+def subnet_key(ip: str, prefix: int = SUBNET_PREFIX) -> str:
+    try:
+        return str(ipaddress.ip_interface(f"{ip}/{prefix}").network)
+    except ValueError:
+        return ip
+
+def failed_result(task: Dict, error: str) -> Dict:
+    return {
+        "device_id": task.get("device_id"),
+        "device_name": task.get("device_name"),
+        "device_ip": task.get("device_ip"),
+        "success": False,
+        "filename": None,
+        "filepath": None,
+        "spool": None,
+        "size": None,
+        "timestamp": None,
+        "error": error,
+        "error_class": "task_error"
+    }
+
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF, cap: float = RETRY_BACKOFF_MAX) -> float:
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+# Blocking paramiko sessions run on a dedicated executor so the event loop stays
+# free. Concurrency is capped globally, per site (device location) and per subnet
+# so a single plant or distribution switch never sees hundreds of logins at once.
+# New SSH logins additionally pass a token bucket to spare the AAA servers.
+# Results flagged `retryable` are tried again after an exponential backoff, with
+# every slot released while waiting; an unreachable device is reported to the
+# circuit breaker once the last attempt has failed.
+class Collector:
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        site_concurrency: int = SITE_CONCURRENCY,
+        subnet_concurrency: int = SUBNET_CONCURRENCY,
+        subnet_prefix: int = SUBNET_PREFIX,
+        login_rate_per_minute: float = LOGIN_RATE_PER_MINUTE,
+        login_burst: Optional[int] = LOGIN_BURST,
+        retry_attempts: int = RETRY_ATTEMPTS
+    ):
+        self.max_concurrency = max_concurrency
+        self.site_concurrency = site_concurrency
+        self.subnet_concurrency = subnet_concurrency
+        self.subnet_prefix = subnet_prefix
+        self.logins = TokenBucket(login_rate_per_minute, login_burst)
+        self.retry_attempts = retry_attempts
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._sites: Dict[str, asyncio.Semaphore] = {}
+        self._subnets: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="ssh-collector"
+            )
+        return self._executor
+
+    def _global_slot(self) -> asyncio.Semaphore:
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        return self._global
+
+    def _site_slot(self, site: Optional[str]) -> asyncio.Semaphore:
+        key = site or ""
+        if key not in self._sites:
+            self._sites[key] = asyncio.Semaphore(self.site_concurrency)
+        return self._sites[key]
+
+    def _subnet_slot(self, ip: str) -> asyncio.Semaphore:
+        key = subnet_key(ip, self.subnet_prefix)
+        if key not in self._subnets:
+            self._subnets[key] = asyncio.Semaphore(self.subnet_concurrency)
+        return self._subnets[key]
+
+    async def _attempt(self, task: Dict) -> Dict:
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._site_slot(task.get("site")):
+                async with self._subnet_slot(task["device_ip"]):
+                    async with self._global_slot():
+                        await self.logins.acquire()
+                        return await loop.run_in_executor(self.executor, task["task"], *task["args"])
+        except Exception as e:
+            return failed_result(task, f"Task execution failed: {str(e)}")
+
+    async def run(self, task: Dict) -> Dict:
+        if task.get("delay"):
+            await asyncio.sleep(task["delay"])
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            result = await self._attempt(task)
+            if result["success"] or not result.get("retryable") or attempt >= self.retry_attempts:
+                break
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+        error = result.pop("breaker_error", None)
+        if error and not result["success"]:
+            breaker.record_failure(task["device_ip"], error)
+        result["device_id"] = task["device_id"]
+        result["attempts"] = attempt + 1
+        result["duration"] = round(time.monotonic() - started, 3)
+        return result
+
+    async def collect(self, tasks: List[Dict]) -> AsyncIterator[Dict]:
+        pending = [asyncio.ensure_future(self.run(task)) for task in tasks]
+        try:
+            for future in asyncio.as_completed(pending):
+                yield await future
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+collector = Collector()
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from models import ComplianceResult, ComplianceRule
+from services import blobstore, configtree
+
+COMPLIANCE_WORKERS = int(os.getenv("NETGUARD_COMPLIANCE_WORKERS", os.cpu_count() or 1))
+COMPLIANCE_POOL_MIN = int(os.getenv("NETGUARD_COMPLIANCE_POOL_MIN", 200))
+EVAL_BATCH_SIZE = 200
+IN_CLAUSE_SIZE = 500
+MAX_MATCHES_PER_RULE = 20
+
+SEVERITY_WEIGHTS = {"HIGH": 20, "MEDIUM": 10, "LOW": 5, "INFO": 0}
+RULE_FIELDS = (
+    "id", "name", "category", "severity", "kind", "pattern",
+    "section", "section_filter", "vendor", "description", "remediation"
+)
+# Only these fields change what an evaluation finds; names, severities and vendor
+# filters are applied when results are read, so editing them keeps the cache.
+MATCH_FIELDS = ("id", "kind", "pattern", "section", "section_filter")
+
+DEFAULT_RULES = [
+    {
+        "name": "Telnet 服务已启用", "category": "管理访问", "severity": "HIGH", "kind": "forbidden",
+        "pattern": r"^telnet (?:ipv6 )?server enable$",
+        "description": "Telnet 以明文传输账号和配置。", "remediation": "undo telnet server enable，改用 SSH（stelnet / ssh server enable）。"
+    },
+    {
+        "name": "VTY 允许 Telnet 登录", "category": "管理访问", "severity": "HIGH", "kind": "forbidden",
+        "section": r"^(?:user-interface|line) vty", "pattern": r"^protocol inbound (?:telnet|all)$|^transport input (?:all|.*\btelnet\b)",
+        "description": "远程登录线路接受 Telnet。", "remediation": "VRP/Comware: protocol inbound ssh；IOS: transport input ssh。"
+    },
+    {
+        "name": "VTY 无需认证", "category": "管理访问", "severity": "HIGH", "kind": "forbidden",
+        "section": r"^(?:user-interface|line) vty", "pattern": r"^authentication-mode none$|^no login$",
+        "description": "远程登录线路未启用认证。", "remediation": "authentication-mode aaa / scheme，IOS 使用 login local。"
+    },
+    {
+        "name": "VTY 未绑定 ACL", "category": "管理访问", "severity": "MEDIUM", "kind": "required",
+        "section": r"^(?:user-interface|line) vty", "pattern": r"^(?:acl|access-class) \S+",
+        "description": "远程登录未限制来源地址。", "remediation": "为 VTY 配置 acl <编号> inbound（IOS: access-class <ACL> in）。"
+    },
+    {
+        "name": "未启用 SSH 服务", "category": "管理访问", "severity": "MEDIUM", "kind": "required",
+        "pattern": r"^(?:stelnet server enable|ssh server enable|ip ssh version 2)$",
+        "description": "设备未开启 SSH，只能通过明文协议管理。", "remediation": "stelnet server enable（VRP）/ ssh server enable（Comware）/ ip ssh version 2（IOS）。"
+    },
+    {
+        "name": "HTTP 管理服务已启用", "category": "管理访问", "severity": "MEDIUM", "kind": "forbidden",
+        "pattern": r"^(?:ip http server|ip http enable|http server enable)$",
+        "description": "Web 管理以明文 HTTP 提供。", "remediation": "关闭 HTTP，必要时只保留 HTTPS。"
+    },
+    {
+        "name": "默认 SNMP 团体名", "category": "SNMP", "severity": "HIGH", "kind": "forbidden",
+        "pattern": r"^snmp-(?:agent|server) community (?:(?:read|write) )?(?:simple )?(?:public|private)\b",
+        "description": "使用 public / private 等默认团体名。", "remediation": "更换为强团体名并使用 cipher 存储，或改用 SNMPv3。"
+    },
+    {
+        "name": "明文保存的密码", "category": "账号安全", "severity": "HIGH", "kind": "forbidden",
+        "pattern": r"(?:^|\s)password simple\s|^username \S+ (?:privilege \d+ )?password (?:0 )?\S",
+        "description": "密码以明文形式保存在配置中。", "remediation": "使用 irreversible-cipher / hash / secret 方式配置密码。"
+    },
+    {
+        "name": "未配置 NTP", "category": "运维", "severity": "LOW", "kind": "required",
+        "pattern": r"^(?:ntp-service unicast-server|ntp unicast-server|ntp server) \S+",
+        "description": "设备时钟不同步，日志时间不可信。", "remediation": "配置 ntp-service unicast-server <地址>。"
+    },
+    {
+        "name": "未配置日志服务器", "category": "运维", "severity": "LOW", "kind": "required",
+        "pattern": r"^(?:info-center loghost|logging host|logging) \d",
+        "description": "日志只保存在本地，设备重启后丢失。", "remediation": "配置 info-center loghost <地址>（IOS: logging host <地址>）。"
+    },
+    {
+        "name": "Trunk 放行全部 VLAN", "category": "二层", "severity": "LOW", "kind": "forbidden",
+        "section": r"^interface ", "section_filter": r"^(?:port link-type trunk|switchport mode trunk)$",
+        "pattern": r"^port trunk (?:permit|allow-pass) vlan all$|^switchport trunk allowed vlan all$",
+        "description": "Trunk 口放行所有 VLAN，扩大广播域和攻击面。", "remediation": "只放行业务需要的 VLAN。"
+    },
+]
+
+def compile_pattern(pattern: str):
+    return re.compile(pattern, re.IGNORECASE)
+
+def rule_applies(rule: Dict, vendor: Optional[str], dialect: Optional[str]) -> bool:
+    wanted = (rule.get("vendor") or "").lower()
+    return not wanted or wanted == dialect or wanted in (vendor or "").lower()
+
+# Matches a group of rule patterns against a line in one regex call: each rule is
+# an optional lookahead at the start of the line with its own capture group, so
+# every rule that matches is reported, not just the first alternative. A plain
+# alternation of all patterns runs first as a cheap prefilter, and most lines
+# never reach the lookahead matcher.
+class LineMatcher:
+    def __init__(self, patterns: List[str]):
+        self.count = len(patterns)
+        self.prefilter = compile_pattern("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+        try:
+            self.matcher = compile_pattern("".join(f"(?:(?=.*?(?P<r{i}>{p})))?" for i, p in enumerate(patterns)))
+            self.separate = None
+        except re.error:
+            # e.g. two rules reuse a group name; fall back to one search per rule
+            self.matcher = None
+            self.separate = [compile_pattern(p) for p in patterns]
+
+    def matches(self, line: str) -> List[int]:
+        if self.prefilter is None or not self.prefilter.search(line):
+            return []
+        if self.matcher is None:
+            return [i for i, pattern in enumerate(self.separate) if pattern.search(line)]
+        found = self.matcher.match(line)
+        return [i for i in range(self.count) if found.group(f"r{i}") is not None]
+
+class SectionCheck:
+    def __init__(self, section: str, section_filter: Optional[str], rules: List[Dict]):
+        self.header = compile_pattern(section)
+        self.filter = compile_pattern(section_filter) if section_filter else None
+        self.rules = rules
+        self.lines = LineMatcher([rule["pattern"] for rule in rules])
+
+def walk(nodes: List[Dict]) -> Iterable[Dict]:
+    for node in nodes:
+        yield node
+        yield from walk(node["children"])
+
+def finding(rule: Dict, line: Optional[int], text: Optional[str], section: Optional[str] = None) -> Dict:
+    return {"rule_id": rule["id"], "line": line, "text": text, "section": section}
+
+# Findings also depend on how the config is parsed, so a parser change
+# invalidates stored results like a rule change does.
+def ruleset_fingerprint(rules: List[Dict]) -> str:
+    canonical = sorted(({k: rule.get(k) for k in MATCH_FIELDS} for rule in rules), key=lambda r: r["id"])
+    payload = {"parser": configtree.PARSER_VERSION, "rules": canonical}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class RuleSet:
+    def __init__(self, rules: List[Dict]):
+        self.rules = [{k: rule.get(k) for k in RULE_FIELDS} for rule in rules]
+        self.by_id = {rule["id"]: rule for rule in self.rules}
+        self.fingerprint = ruleset_fingerprint(self.rules)
+        self.global_rules = [rule for rule in self.rules if not rule["section"]]
+        self.global_lines = LineMatcher([rule["pattern"] for rule in self.global_rules])
+        sections: Dict[Tuple[str, Optional[str]], List[Dict]] = {}
+        for rule in self.rules:
+            if rule["section"]:
+                sections.setdefault((rule["section"], rule["section_filter"]), []).append(rule)
+        self.sections = [SectionCheck(section, section_filter, rules) for (section, section_filter), rules in sections.items()]
+
+    # Findings are recorded for every rule regardless of its vendor filter, and
+    # `dialect` holds only the hint taken from the text, so the cached result
+    # depends only on the config text and the rule set; the device's vendor is
+    # applied when results are read.
+    def evaluate(self, content: str) -> Dict:
+        text = configtree.config_text(content)
+        if not text.strip():
+            return {"dialect": None, "config_found": False, "findings": []}
+        dialect = configtree.dialect_hint(text)
+        nodes = list(walk(configtree.parse_tree(text)))
+        findings: List[Dict] = []
+
+        seen = [0] * len(self.global_rules)
+        for node in nodes:
+            for i in self.global_lines.matches(node["text"]):
+                rule = self.global_rules[i]
+                seen[i] += 1
+                if rule["kind"] == "forbidden" and seen[i] <= MAX_MATCHES_PER_RULE:
+                    findings.append(finding(rule, node["line"], node["text"]))
+        for i, rule in enumerate(self.global_rules):
+            if rule["kind"] == "required" and not seen[i]:
+                findings.append(finding(rule, None, None))
+
+        for check in self.sections:
+            for node in nodes:
+                if not node["children"] or not check.header.search(node["text"]):
+                    continue
+                children = list(walk(node["children"]))
+                if check.filter and not any(check.filter.search(child["text"]) for child in children):
+                    continue
+                matched = set()
+                for child in children:
+                    for i in check.lines.matches(child["text"]):
+                        matched.add(i)
+                        if check.rules[i]["kind"] == "forbidden":
+                            findings.append(finding(check.rules[i], child["line"], child["text"], node["text"]))
+                for i, rule in enumerate(check.rules):
+                    if rule["kind"] == "required" and i not in matched:
+                        findings.append(finding(rule, node["line"], None, node["text"]))
+
+        return {"dialect": dialect, "config_found": True, "findings": findings}
+
+def validate_rule(rule: Dict):
+    for field in ("pattern", "section", "section_filter"):
+        if rule.get(field):
+            try:
+                compile_pattern(rule[field])
+            except re.error as e:
+                raise ValueError(f"Invalid {field} regex: {e}")
+    if rule.get("section_filter") and not rule.get("section"):
+        raise ValueError("section_filter requires section")
+
+def rule_to_dict(rule: ComplianceRule) -> Dict:
+    return {field: getattr(rule, field) for field in RULE_FIELDS}
+
+def load_ruleset(db: Session) -> RuleSet:
+    rules = db.query(ComplianceRule).filter(ComplianceRule.enabled == True).order_by(ComplianceRule.id).all()
+    return RuleSet([rule_to_dict(rule) for rule in rules])
+
+def seed_default_rules(db: Session) -> int:
+    if db.query(ComplianceRule.id).first() is not None:
+        return 0
+    for i, rule in enumerate(DEFAULT_RULES, 1):
+        db.add(ComplianceRule(id=f"default-{i:02d}", enabled=True, **rule))
+    db.commit()
+    return len(DEFAULT_RULES)
+
+_worker_ruleset: Optional[RuleSet] = None
+
+def init_worker(rules: List[Dict]):
+    global _worker_ruleset
+    _worker_ruleset = RuleSet(rules)
+
+def evaluate_in_worker(item: Tuple[str, str]) -> Tuple[str, Dict]:
+    digest, content = item
+    return digest, _worker_ruleset.evaluate(content)
+
+def cached_results(db: Session, ruleset: RuleSet, digests: List[str]) -> Dict[str, Dict]:
+    found = {}
+    for i in range(0, len(digests), IN_CLAUSE_SIZE):
+        chunk = digests[i:i + IN_CLAUSE_SIZE]
+        rows = db.query(ComplianceResult).filter(
+            ComplianceResult.content_hash.in_(chunk),
+            ComplianceResult.ruleset_hash == ruleset.fingerprint
+        ).all()
+        for row in rows:
+            found[row.content_hash] = {
+                "dialect": row.dialect,
+                "config_found": row.config_found,
+                "findings": json.loads(row.findings)
+            }
+    return found
+
+# Only configs whose content hash has no stored result for the current rule set
+# are evaluated. Large batches are spread over a pool of spawned processes that
+# each compile the rule set once; small ones run inline, where pool start-up
+# would cost more than the scan.
+def evaluate_missing(db: Session, ruleset: RuleSet, digests: Iterable[str]) -> Dict[str, Dict]:
+    digests = list(dict.fromkeys(digests))
+    results = cached_results(db, ruleset, digests)
+    missing = [digest for digest in digests if digest not in results]
+    if not missing:
+        return results
+
+    pool = None
+    if len(missing) >= COMPLIANCE_POOL_MIN and COMPLIANCE_WORKERS > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=COMPLIANCE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(ruleset.rules,)
+        )
+    try:
+        for i in range(0, len(missing), EVAL_BATCH_SIZE):
+            batch = []
+            for digest in missing[i:i + EVAL_BATCH_SIZE]:
+                content = blobstore.get(db, digest)
+                if content is not None:
+                    batch.append((digest, content))
+            if pool is not None:
+                evaluated = pool.map(evaluate_in_worker, batch, chunksize=max(len(batch) // (COMPLIANCE_WORKERS * 4), 1))
+            else:
+                evaluated = ((digest, ruleset.evaluate(content)) for digest, content in batch)
+            for digest, result in evaluated:
+                results[digest] = result
+                db.merge(ComplianceResult(
+                    content_hash=digest,
+                    ruleset_hash=ruleset.fingerprint,
+                    dialect=result["dialect"],
+                    config_found=result["config_found"],
+                    findings=json.dumps(result["findings"], ensure_ascii=False, separators=(",", ":")),
+                    created_at=datetime.utcnow()
+                ))
+            db.commit()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+def prune_stale_results(db: Session, ruleset: RuleSet) -> int:
+    removed = db.query(ComplianceResult).filter(
+        ComplianceResult.ruleset_hash != ruleset.fingerprint
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+def device_report(ruleset: RuleSet, result: Dict, vendor: Optional[str]) -> Dict:
+    if not result["config_found"]:
+        return {"status": "no_config", "dialect": None, "score": None, "counts": {}, "issues": []}
+    dialect = configtree.resolve_dialect(result["dialect"], vendor)
+    issues = []
+    for item in result["findings"]:
+        rule = ruleset.by_id.get(item["rule_id"])
+        if rule is None or not rule_applies(rule, vendor, dialect):
+            continue
+        issues.append({
+            "rule_id": rule["id"],
+            "severity": rule["severity"],
+            "category": rule["category"] or rule["name"],
+            "description": rule["name"] + (f"：{rule['description']}" if rule["description"] else ""),
+            "remediation": rule["remediation"] or "",
+            "lineContent": item["text"],
+            "line": item["line"],
+            "section": item["section"],
+        })
+    counts: Dict[str, int] = {}
+    penalty = 0
+    for rule_id in {issue["rule_id"] for issue in issues}:
+        severity = ruleset.by_id[rule_id]["severity"]
+        counts[severity] = counts.get(severity, 0) + 1
+        penalty += SEVERITY_WEIGHTS.get(severity, 0)
+    return {
+        "status": "compliant" if not issues else "violations",
+        "dialect": dialect,
+        "score": max(100 - penalty, 0),
+        "counts": counts,
+        "issues": issues
+    }
@@ -0,0 +1,559 @@
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from models import ParsedConfig
+from services import blobstore, cli, diff
+
+# Bump whenever the tree or summary layout changes so stored parses are redone
+PARSER_VERSION = 3
+PARSE_CACHE_BYTES = int(os.getenv("NETGUARD_PARSE_CACHE_BYTES", 16 * 1024 * 1024))
+IN_CLAUSE_SIZE = 500
+MAX_VLAN = 4094
+
+SECTION = re.compile(r"^# Command: (.*)$", re.MULTILINE)
+CONFIG_COMMAND = re.compile(r"^(?:dis\S*\s+(?:cu|sa)|sh\S*\s+(?:ru|st))\S*$", re.IGNORECASE)
+PROMPT_LINE = re.compile(r"^\s*(?:[<\[][^<>\[\]]+[>\]]|[\w.\-]+[>#])\s*\S*.*$")
+SEPARATOR = re.compile(r"^\s*[#!]\s*$")
+END_LINE = re.compile(r"^(?:return|end)\s*$")
+
+def config_text(content: str) -> str:
+    parts = SECTION.split(content)
+    if len(parts) == 1:
+        return content
+    sections = list(zip(parts[1::2], parts[2::2]))
+    for command, body in sections:
+        if CONFIG_COMMAND.match(command.strip()):
+            lines = body.strip("\n").split("\n")
+            # drop the echoed command and the trailing prompt left by the shell
+            if lines and lines[0].strip() == command.strip():
+                lines = lines[1:]
+            while lines and (not lines[-1].strip() or PROMPT_LINE.match(lines[-1])):
+                lines.pop()
+            return "\n".join(lines)
+    return ""
+
+# What the config text alone says about its dialect: explicit Comware / VRP
+# port and filter syntax, a VRP-style `sysname`, IOS-style `hostname` /
+# `switchport`, or nothing. Kept apart from the vendor so results cached per
+# content hash can be resolved for any device that has the same config.
+def dialect_hint(text: str) -> Optional[str]:
+    if re.search(r"^\s*port trunk permit vlan|^\s*port access vlan|^\s*packet-filter ", text, re.MULTILINE):
+        return "comware"
+    if re.search(r"^\s*port trunk allow-pass vlan|^\s*port default vlan|^\s*traffic-filter ", text, re.MULTILINE):
+        return "vrp"
+    if re.search(r"^\s*sysname ", text, re.MULTILINE):
+        return "sysname"
+    if re.search(r"^hostname |^\s*switchport ", text, re.MULTILINE):
+        return "ios"
+    return None
+
+def resolve_dialect(hint: Optional[str], vendor: Optional[str] = None) -> str:
+    profile = cli.get_profile(vendor)
+    if profile is cli.CISCO_IOS or profile is cli.ARISTA_EOS:
+        return "ios"
+    if hint in ("comware", "vrp"):
+        return hint
+    if profile is cli.HP_COMWARE:
+        return "comware"
+    if profile is cli.HUAWEI_VRP or hint == "sysname":
+        return "vrp"
+    return hint or "vrp"
+
+def detect_dialect(text: str, vendor: Optional[str] = None) -> str:
+    return resolve_dialect(dialect_hint(text), vendor)
+
+# The tree mirrors the indentation of the running config: every line is a node
+# and the more deeply indented lines that follow it are its children. A `#` / `!`
+# separator closes every open block, since Comware and VRP indent global
+# commands by one space; comments, pager leftovers and `return` / `end` are
+# dropped.
+def parse_tree(text: str) -> List[Dict]:
+    root: List[Dict] = []
+    stack: List[Tuple[int, List[Dict]]] = [(-1, root)]
+    preamble = True
+    for number, raw in enumerate(text.split("\n"), 1):
+        line = raw.rstrip()
+        if SEPARATOR.match(line):
+            del stack[1:]
+            preamble = False
+            continue
+        if not line.strip() or line.lstrip().startswith("!") or END_LINE.match(line) or cli.PAGER_MARKER.fullmatch(line):
+            continue
+        # banners such as "Building configuration..." only precede the first separator
+        if preamble and diff.VOLATILE_LINE.match(line):
+            continue
+        indent = len(line) - len(line.lstrip(" "))
+        while stack[-1][0] >= indent:
+            stack.pop()
+        node = {"text": line.strip(), "line": number, "children": []}
+        stack[-1][1].append(node)
+        stack.append((indent, node["children"]))
+    return root
+
+def vlan_tokens(tokens: Iterable[str]) -> Set[int]:
+    vlans: Set[int] = set()
+    last = None
+    pending_range = False
+    for token in (t.lower() for token in tokens for t in token.replace(",", " ").split()):
+        if token == "all":
+            return set(range(1, MAX_VLAN + 1))
+        if token == "to":
+            pending_range = True
+            continue
+        low, dash, high = token.partition("-")
+        if dash and low.isdigit() and high.isdigit():
+            vlans.update(range(int(low), int(high) + 1))
+            last = None
+        elif token.isdigit():
+            vlan = int(token)
+            vlans.update(range(last, vlan + 1) if pending_range and last is not None else (vlan,))
+            last = vlan
+        pending_range = False
+    return {v for v in vlans if 1 <= v <= MAX_VLAN}
+
+def vlan_number(words: List[str]) -> Optional[int]:
+    return int(words[-1]) if words and words[-1].isdigit() else None
+
+def vlan_ranges(vlans: Set[int]) -> List[List[int]]:
+    ranges: List[List[int]] = []
+    for vlan in sorted(vlans):
+        if ranges and vlan == ranges[-1][1] + 1:
+            ranges[-1][1] = vlan
+        else:
+            ranges.append([vlan, vlan])
+    return ranges
+
+def in_ranges(vlan: int, ranges: Optional[List[List[int]]]) -> bool:
+    return any(low <= vlan <= high for low, high in ranges or ())
+
+def after(text: str, prefix: str) -> List[str]:
+    return text[len(prefix):].split()
+
+def child_texts(node: Dict) -> List[str]:
+    return [child["text"] for child in node["children"]]
+
+def parse_interface(node: Dict, dialect: str) -> Dict:
+    name = node["text"].split(None, 1)[1] if " " in node["text"] else node["text"]
+    iface = {
+        "name": name,
+        "line": node["line"],
+        "description": None,
+        "shutdown": False,
+        "mode": None,
+        "access_vlan": None,
+        "native_vlan": None,
+        "trunk_vlans": None,
+        "ip_addresses": [],
+        "acls": [],
+    }
+    trunk: Optional[Set[int]] = None
+    trunk_removed: Set[int] = set()
+    untagged: Set[int] = set()
+    for text in child_texts(node):
+        lower = text.lower()
+        if lower.startswith("description "):
+            iface["description"] = text.split(None, 1)[1]
+        elif lower == "shutdown":
+            iface["shutdown"] = True
+        elif lower.startswith("ip address ") and "dhcp" not in lower:
+            iface["ip_addresses"].append(" ".join(after(text, "ip address ")[:2]))
+        elif lower.startswith("ipv6 address "):
+            iface["ip_addresses"].append(after(text, "ipv6 address ")[0])
+        elif dialect == "ios":
+            if lower == "no switchport":
+                iface["mode"] = "routed"
+            elif lower.startswith("switchport mode "):
+                iface["mode"] = after(lower, "switchport mode ")[0]
+            elif lower.startswith("switchport access vlan "):
+                iface["access_vlan"] = vlan_number(after(lower, "switchport access vlan ")[:1])
+            elif lower.startswith("switchport trunk native vlan "):
+                iface["native_vlan"] = vlan_number(after(lower, "switchport trunk native vlan ")[:1])
+            elif lower.startswith("switchport trunk allowed vlan "):
+                args = after(lower, "switchport trunk allowed vlan ")
+                if not args:
+                    continue
+                if args[0] == "none":
+                    trunk = set()
+                elif args[0] == "add":
+                    trunk = (trunk if trunk is not None else set()) | vlan_tokens(args[1:])
+                elif args[0] == "remove":
+                    trunk_removed |= vlan_tokens(args[1:])
+                elif args[0] == "except":
+                    trunk = set(range(1, MAX_VLAN + 1)) - vlan_tokens(args[1:])
+                else:
+                    trunk = vlan_tokens(args)
+            elif lower.startswith("ip access-group "):
+                args = after(text, "ip access-group ")
+                iface["acls"].append(" ".join(args[:2]))
+        else:
+            if lower.startswith("port link-type "):
+                iface["mode"] = after(lower, "port link-type ")[0]
+            elif lower.startswith(("port default vlan ", "port access vlan ")):
+                iface["access_vlan"] = vlan_number(lower.split())
+            elif lower.startswith(("port trunk allow-pass vlan ", "port trunk permit vlan ")):
+                trunk = (trunk or set()) | vlan_tokens(lower.split(" vlan ", 1)[1].split())
+            elif lower.startswith(("undo port trunk allow-pass vlan ", "undo port trunk permit vlan ")):
+                trunk_removed |= vlan_tokens(lower.split(" vlan ", 1)[1].split())
+            elif lower.startswith(("port trunk pvid vlan ", "port hybrid pvid vlan ")):
+                iface["native_vlan"] = vlan_number(lower.split())
+            elif lower.startswith("port hybrid tagged vlan "):
+                trunk = (trunk or set()) | vlan_tokens(after(lower, "port hybrid tagged vlan "))
+            elif lower.startswith("port hybrid untagged vlan "):
+                untagged |= vlan_tokens(after(lower, "port hybrid untagged vlan "))
+            elif lower.startswith("port hybrid vlan "):
+                args = after(lower, "port hybrid vlan ")
+                target = untagged if args and args[-1] == "untagged" else None
+                vlans = vlan_tokens(args[:-1] if args and args[-1] in ("tagged", "untagged") else args)
+                if target is not None:
+                    untagged |= vlans
+                else:
+                    trunk = (trunk or set()) | vlans
+            elif lower.startswith("traffic-filter "):
+                args = after(text, "traffic-filter ")
+                iface["acls"].append(" ".join([args[-1], args[0]]) if len(args) >= 3 else " ".join(args))
+            elif lower.startswith("packet-filter "):
+                args = [a for a in after(text, "packet-filter ") if a.lower() not in ("ipv6", "name")]
+                iface["acls"].append(" ".join(args[:2]))
+
+    mode = iface["mode"]
+    if mode is None and iface["access_vlan"] is not None:
+        mode = iface["mode"] = "access"
+    if mode == "access":
+        iface["access_vlan"] = iface["access_vlan"] or 1
+    elif mode in ("trunk", "hybrid"):
+        if dialect == "ios":
+            allowed = set(range(1, MAX_VLAN + 1)) if trunk is None else trunk
+            iface["native_vlan"] = iface["native_vlan"] or 1
+        else:
+            # VRP and Comware trunks carry VLAN 1 unless it is explicitly removed
+            allowed = {1} | (trunk or set()) | untagged
+            iface["native_vlan"] = iface["native_vlan"] or 1
+        iface["trunk_vlans"] = vlan_ranges(allowed - trunk_removed)
+    return iface
+
+def parse_acl(node: Dict, dialect: str) -> Dict:
+    words = node["text"].split()
+    if dialect == "ios":
+        name = words[-1]
+        kind = words[2] if len(words) > 3 else "standard"
+    else:
+        args = words[1:]
+        kind = args[0] if args and args[0] in ("basic", "advanced", "ipv6", "mac", "user-defined") else None
+        if "name" in args:
+            name = args[args.index("name") + 1]
+        else:
+            name = next((a for a in args if a.isdigit()), " ".join(args))
+        if kind is None and name.isdigit():
+            number = int(name)
+            kind = "basic" if 2000 <= number < 3000 else "advanced" if 3000 <= number < 4000 else "layer2" if 4000 <= number < 5000 else None
+    rules = [text for text in child_texts(node) if text.lower().split()[0] in ("rule", "permit", "deny", "remark") or text[0].isdigit()]
+    return {"name": name, "type": kind, "line": node["line"], "rules": rules}
+
+def password_kind(words: List[str]) -> Optional[str]:
+    for i, word in enumerate(words):
+        if word in ("password", "secret"):
+            following = words[i + 1] if i + 1 < len(words) else ""
+            if word == "secret":
+                return "secret"
+            if following in ("simple", "0"):
+                return "simple"
+            if following in ("cipher", "irreversible-cipher", "hash", "7", "5", "8", "9"):
+                return following if following in ("cipher", "irreversible-cipher", "hash") else f"type{following}"
+            return "simple" if following else None
+    return None
+
+def user_entry(users: Dict[str, Dict], name: str) -> Dict:
+    return users.setdefault(name, {"name": name, "privilege": None, "password": None, "services": []})
+
+def summarize(tree: List[Dict], dialect: str) -> Dict:
+    summary = {
+        "dialect": dialect,
+        "hostname": None,
+        "interfaces": [],
+        "vlans": [],
+        "acls": [],
+        "aaa": {"users": [], "radius_servers": [], "tacacs_servers": [], "domains": []},
+        "snmp": {"versions": [], "communities": [], "trap_hosts": []},
+        "management": {
+            "telnet": None, "ssh": None, "http": None,
+            "vty": [], "ntp_servers": [], "syslog_hosts": [], "stp_mode": None
+        },
+    }
+    vlans: Dict[int, Dict] = {}
+    users: Dict[str, Dict] = {}
+    aaa, snmp, mgmt = summary["aaa"], summary["snmp"], summary["management"]
+
+    def add_vlans(ids: Iterable[int]):
+        for vlan in ids:
+            vlans.setdefault(vlan, {"id": vlan, "name": None})
+
+    for node in tree:
+        text = node["text"]
+        lower = text.lower()
+        words = text.split()
+        first = words[0].lower()
+
+        if first in ("sysname", "hostname") and len(words) > 1:
+            summary["hostname"] = words[1]
+        elif first == "interface":
+            summary["interfaces"].append(parse_interface(node, dialect))
+        elif lower.startswith("vlan batch "):
+            add_vlans(vlan_tokens(words[2:]))
+        elif first == "vlan" and len(words) > 1:
+            ids = vlan_tokens(words[1:])
+            add_vlans(ids)
+            for child in child_texts(node):
+                if child.lower().startswith(("name ", "description ")) and len(ids) == 1:
+                    vlans[next(iter(ids))]["name"] = child.split(None, 1)[1]
+        elif first == "acl" or lower.startswith(("ip access-list ", "ipv6 access-list ")):
+            summary["acls"].append(parse_acl(node, dialect))
+        elif first == "access-list" and len(words) > 2:
+            acl = next((a for a in summary["acls"] if a["name"] == words[1]), None)
+            if acl is None:
+                acl = {"name": words[1], "type": "standard" if words[1].isdigit() and int(words[1]) < 100 else "extended", "line": node["line"], "rules": []}
+                summary["acls"].append(acl)
+            acl["rules"].append(" ".join(words[2:]))
+
+        elif first == "aaa":
+            for child in node["children"]:
+                child_words = child["text"].split()
+                if child_words[0] == "local-user" and len(child_words) > 2:
+                    user = user_entry(users, child_words[1])
+                    if child_words[2] == "privilege" and child_words[-1].isdigit():
+                        user["privilege"] = int(child_words[-1])
+                    elif child_words[2] == "service-type":
+                        user["services"] = child_words[3:]
+                    elif child_words[2] == "password":
+                        user["password"] = password_kind(child_words[2:])
+                elif child_words[0] == "domain" and len(child_words) > 1:
+                    aaa["domains"].append(child_words[1])
+        elif first == "local-user" and len(words) > 1:
+            user = user_entry(users, words[1])
+            for child in child_texts(node):
+                child_words = child.split()
+                if child_words[0] == "password":
+                    user["password"] = password_kind(child_words)
+                elif child_words[0] == "service-type":
+                    user["services"] = sorted(set(user["services"]) | set(child_words[1:]))
+                elif child_words[0] == "authorization-attribute" and "user-role" in child_words:
+                    user["privilege"] = child_words[child_words.index("user-role") + 1]
+        elif first == "username" and len(words) > 1:
+            user = user_entry(users, words[1])
+            if "privilege" in words:
+                user["privilege"] = vlan_number(words[words.index("privilege") + 1:][:1])
+            user["password"] = password_kind(words)
+        elif lower.startswith(("radius-server host ", "radius scheme ", "radius-server template ")):
+            aaa["radius_servers"].append(" ".join(words[2:3]) or words[-1])
+        elif lower.startswith(("tacacs-server host ", "hwtacacs scheme ", "hwtacacs-server template ")):
+            aaa["tacacs_servers"].append(" ".join(words[2:3]) or words[-1])
+        elif first == "domain" and len(words) > 1:
+            aaa["domains"].append(words[-1])
+
+        elif lower.startswith("snmp-agent sys-info version "):
+            snmp["versions"] = sorted(set(snmp["versions"]) | {w for w in words[3:] if w.startswith("v") or w == "all"})
+        elif lower.startswith("snmp-agent community "):
+            args = words[2:]
+            access = args[0].lower() if args else None
+            secret = args[1:]
+            encrypted = bool(secret) and secret[0].lower() in ("cipher", "encrypted")
+            name = secret[1] if secret and secret[0].lower() in ("cipher", "simple", "encrypted") and len(secret) > 1 else (secret[0] if secret else "")
+            acl = words[words.index("acl") + 1] if "acl" in words[:-1] else None
+            snmp["communities"].append({"access": access, "encrypted": encrypted, "default_name": name.lower() in ("public", "private"), "acl": acl})
+        elif lower.startswith("snmp-server community "):
+            args = words[2:]
+            name = args[0] if args else ""
+            access = next((a.lower() for a in args[1:] if a.lower() in ("ro", "rw")), "ro")
+            acl = next((a for a in args[1:] if a.lower() not in ("ro", "rw", "view")), None)
+            snmp["communities"].append({"access": "read" if access == "ro" else "write", "encrypted": False, "default_name": name.lower() in ("public", "private"), "acl": acl})
+        elif lower.startswith("snmp-agent target-host ") and "address" in words:
+            index = words.index("address") + 1
+            host = words[index + 1] if index < len(words) and words[index] == "udp-domain" else words[index] if index < len(words) else None
+            if host:
+                snmp["trap_hosts"].append(host)
+        elif lower.startswith("snmp-server host ") and len(words) > 2:
+            snmp["trap_hosts"].append(words[2])
+        elif lower.startswith("snmp-server group ") and "v3" in words:
+            snmp["versions"] = sorted(set(snmp["versions"]) | {"v3"})
+
+        elif lower in ("telnet server enable", "telnet ipv6 server enable"):
+            mgmt["telnet"] = True
+        elif lower.startswith("undo telnet server enable"):
+            mgmt["telnet"] = False
+        elif lower in ("stelnet server enable", "ssh server enable") or lower.startswith("ip ssh version"):
+            mgmt["ssh"] = True
+        elif lower in ("undo stelnet server enable", "undo ssh server enable"):
+            mgmt["ssh"] = False
+        elif lower in ("ip http server", "ip http secure-server", "ip http enable", "ip https enable", "http server enable", "http secure-server enable"):
+            mgmt["http"] = True
+        elif lower in ("no ip http server", "undo ip http enable", "undo http server enable"):
+            mgmt["http"] = mgmt["http"] or False
+        elif first in ("user-interface", "line") and ("vty" in lower or "con" in lower or "aux" in lower):
+            vty = {"name": " ".join(words[1:]), "authentication": None, "protocols": None, "acl": None, "line": node["line"]}
+            for child in child_texts(node):
+                child_lower = child.lower()
+                child_words = child.split()
+                if child_lower.startswith("authentication-mode "):
+                    vty["authentication"] = child_words[1]
+                elif child_lower in ("login local", "login authentication default") or child_lower.startswith("login authentication"):
+                    vty["authentication"] = "aaa" if "authentication" in child_lower else "local"
+                elif child_lower == "login":
+                    vty["authentication"] = vty["authentication"] or "password"
+                elif child_lower == "no login":
+                    vty["authentication"] = "none"
+                elif child_lower.startswith("protocol inbound "):
+                    vty["protocols"] = child_words[2:]
+                elif child_lower.startswith("transport input "):
+                    vty["protocols"] = child_words[2:]
+                elif child_lower.startswith(("acl ", "access-class ")):
+                    vty["acl"] = child_words[1]
+            mgmt["vty"].append(vty)
+        elif lower.startswith(("ntp-service unicast-server ", "ntp unicast-server ", "ntp server ")):
+            mgmt["ntp_servers"].append(words[2])
+        elif lower.startswith("info-center loghost ") and len(words) > 2:
+            mgmt["syslog_hosts"].append(words[2] if words[2] not in ("vpn-instance", "source") else words[-1])
+        elif lower.startswith("logging host ") and len(words) > 2:
+            mgmt["syslog_hosts"].append(words[2])
+        elif lower.startswith(("stp mode ", "spanning-tree mode ")):
+            mgmt["stp_mode"] = words[2]
+        elif lower in ("stp disable", "undo stp enable", "no spanning-tree vlan 1-4094"):
+            mgmt["stp_mode"] = "disabled"
+
+    if snmp["communities"] and not snmp["versions"]:
+        snmp["versions"] = ["v1", "v2c"]
+    summary["vlans"] = [vlans[vlan] for vlan in sorted(vlans)]
+    aaa["users"] = list(users.values())
+    return summary
+
+def parse(content: str, vendor: Optional[str] = None) -> Dict:
+    text = config_text(content)
+    hint = dialect_hint(text)
+    dialect = resolve_dialect(hint, vendor)
+    tree = parse_tree(text)
+    return {"dialect": dialect, "dialect_hint": hint, "tree": tree, "summary": summarize(tree, dialect)}
+
+summary_cache = diff.DiffCache(PARSE_CACHE_BYTES)
+
+def summary_key(digest: str, dialect: str) -> tuple:
+    return (digest, PARSER_VERSION, dialect)
+
+def hint_key(digest: str) -> tuple:
+    return ("hint", digest, PARSER_VERSION)
+
+def cache_summary(digest: str, hint: Optional[str], dialect: str, summary: Dict, size: int):
+    summary_cache.put(hint_key(digest), (hint,), 64)
+    summary_cache.put(summary_key(digest, dialect), summary, size * 4)
+
+def store(db: Session, digest: str, parsed: Dict) -> ParsedConfig:
+    row = db.get(ParsedConfig, digest)
+    if row is None:
+        row = ParsedConfig(content_hash=digest)
+        db.add(row)
+    row.parser_version = PARSER_VERSION
+    row.dialect = parsed["dialect"]
+    row.dialect_hint = parsed["dialect_hint"]
+    row.summary = json.dumps(parsed["summary"], ensure_ascii=False, separators=(",", ":"))
+    row.tree = json.dumps(parsed["tree"], ensure_ascii=False, separators=(",", ":"))
+    db.flush()
+    return row
+
+# Each distinct config is parsed once and stored under its content hash. The
+# tree and the dialect hint depend only on the text; the summary depends on the
+# dialect, which also takes the device's vendor into account. The row keeps the
+# summary for the dialect it was first parsed with, and devices of a vendor that
+# resolves to another dialect get theirs built from the stored tree. Decoded
+# summaries used by fleet queries are kept per (hash, dialect) in a byte-bounded
+# LRU.
+def parsed_for(db: Session, digest: str, vendor: Optional[str] = None) -> Optional[Dict]:
+    row = db.get(ParsedConfig, digest)
+    if row is not None and row.parser_version == PARSER_VERSION:
+        tree = json.loads(row.tree)
+        dialect = resolve_dialect(row.dialect_hint, vendor)
+        summary = json.loads(row.summary) if dialect == row.dialect else summarize(tree, dialect)
+        return {"dialect": dialect, "dialect_hint": row.dialect_hint, "summary": summary, "tree": tree}
+    content = blobstore.get(db, digest)
+    if content is None:
+        return None
+    parsed = parse(content, vendor)
+    store(db, digest, parsed)
+    return parsed
+
+def summaries_for(db: Session, targets: Iterable[Tuple[str, Optional[str]]]) -> Dict[Tuple[str, Optional[str]], Dict]:
+    targets = list(dict.fromkeys(targets))
+    hints: Dict[str, Optional[str]] = {}
+    for digest, _ in targets:
+        cached = summary_cache.get(hint_key(digest)) if digest not in hints else None
+        if cached is not None:
+            hints[digest] = cached[0]
+
+    unknown = list(dict.fromkeys(digest for digest, _ in targets if digest not in hints))
+    for i in range(0, len(unknown), IN_CLAUSE_SIZE):
+        chunk = unknown[i:i + IN_CLAUSE_SIZE]
+        rows = db.query(ParsedConfig.content_hash, ParsedConfig.dialect_hint).filter(
+            ParsedConfig.content_hash.in_(chunk),
+            ParsedConfig.parser_version == PARSER_VERSION
+        ).all()
+        for digest, hint in rows:
+            hints[digest] = hint
+            summary_cache.put(hint_key(digest), (hint,), 64)
+
+    found: Dict[Tuple[str, Optional[str]], Dict] = {}
+    wanted: Dict[Tuple[str, str], List[Optional[str]]] = {}
+    unparsed: Dict[str, List[Optional[str]]] = {}
+    for digest, vendor in targets:
+        if digest not in hints:
+            unparsed.setdefault(digest, []).append(vendor)
+            continue
+        dialect = resolve_dialect(hints[digest], vendor)
+        cached = summary_cache.get(summary_key(digest, dialect))
+        if cached is not None:
+            found[(digest, vendor)] = cached
+        else:
+            wanted.setdefault((digest, dialect), []).append(vendor)
+
+    digests = list(dict.fromkeys(digest for digest, _ in wanted))
+    stored = set()
+    for i in range(0, len(digests), IN_CLAUSE_SIZE):
+        chunk = digests[i:i + IN_CLAUSE_SIZE]
+        rows = db.query(ParsedConfig.content_hash, ParsedConfig.dialect, ParsedConfig.summary).filter(
+            ParsedConfig.content_hash.in_(chunk),
+            ParsedConfig.parser_version == PARSER_VERSION
+        ).all()
+        for digest, dialect, raw in rows:
+            stored.add(digest)
+            if (digest, dialect) in wanted:
+                summary = json.loads(raw)
+                cache_summary(digest, hints[digest], dialect, summary, len(raw))
+                for vendor in wanted.pop((digest, dialect)):
+                    found[(digest, vendor)] = summary
+
+    trees: Dict[str, List[Dict]] = {}
+    for (digest, dialect), vendors in wanted.items():
+        if digest not in stored:
+            # the row was pruned while its hint stayed cached
+            unparsed.setdefault(digest, []).extend(vendors)
+            continue
+        if digest not in trees:
+            trees[digest] = json.loads(db.query(ParsedConfig.tree).filter(ParsedConfig.content_hash == digest).scalar())
+        summary = summarize(trees[digest], dialect)
+        cache_summary(digest, hints[digest], dialect, summary, len(json.dumps(summary)))
+        for vendor in vendors:
+            found[(digest, vendor)] = summary
+
+    for digest, vendors in unparsed.items():
+        content = blobstore.get(db, digest)
+        if content is None:
+            continue
+        parsed = parse(content, vendors[0])
+        row = store(db, digest, parsed)
+        hint = parsed["dialect_hint"]
+        summaries = {parsed["dialect"]: parsed["summary"]}
+        cache_summary(digest, hint, parsed["dialect"], parsed["summary"], len(row.summary))
+        for vendor in vendors:
+            dialect = resolve_dialect(hint, vendor)
+            if dialect not in summaries:
+                summaries[dialect] = summarize(parsed["tree"], dialect)
+                cache_summary(digest, hint, dialect, summaries[dialect], len(json.dumps(summaries[dialect])))
+            found[(digest, vendor)] = summaries[dialect]
+    return found
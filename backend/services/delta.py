@@ -0,0 +1,29 @@
+import difflib
+import json
+from typing import List
+
+def diff_ops(base: List[str], target: List[str]) -> List[list]:
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base, target, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif tag in ("replace", "insert"):
+            ops.append(["+", target[j1:j2]])
+    return ops
+
+def apply_ops(base: List[str], ops: List[list]) -> List[str]:
+    lines = []
+    for op in ops:
+        if op[0] == "=":
+            lines.extend(base[op[1]:op[2]])
+        else:
+            lines.extend(op[1])
+    return lines
+
+def encode(base_text: str, target_text: str) -> bytes:
+    ops = diff_ops(base_text.splitlines(keepends=True), target_text.splitlines(keepends=True))
+    return json.dumps(ops, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode(base_text: str, delta: bytes) -> str:
+    return "".join(apply_ops(base_text.splitlines(keepends=True), json.loads(delta)))
@@ -0,0 +1,215 @@
+import codecs
+import csv
+import ipaddress
+import json
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+from models import Device
+
+IMPORT_CHUNK_SIZE = 500
+DEFAULT_LOCATION = "未知"
+NAME_MAX = 100
+VENDOR_MAX = 50
+LOCATION_MAX = 100
+
+# CSV headers are matched case-insensitively; the Chinese names follow the
+# column titles of the device list in the UI.
+COLUMN_ALIASES = {
+    "name": "name", "hostname": "name", "名称": "name", "设备名称": "name",
+    "ip": "ip", "address": "ip", "ip地址": "ip", "管理ip": "ip",
+    "vendor": "vendor", "厂商": "vendor", "品牌": "vendor",
+    "location": "location", "site": "location", "位置": "location", "区域": "location",
+}
+
+JSON_VALUE_START = set('{["-0123456789tfn')
+
+class ImportFormatError(Exception):
+    pass
+
+async def iter_text(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    pending = ""
+    async for text in iter_text(chunks):
+        pending += text
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict]:
+    columns: Optional[List[str]] = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if columns is None:
+            columns = [COLUMN_ALIASES.get(v.strip().lower(), v.strip().lower()) for v in values]
+            missing = {"name", "ip", "vendor"} - set(columns)
+            if missing:
+                raise ImportFormatError(f"CSV header is missing column(s): {', '.join(sorted(missing))}")
+            continue
+        yield dict(zip(columns, (v.strip() for v in values)))
+
+# Accepts either a JSON array of objects or newline-delimited objects. Items are
+# decoded one at a time as soon as they are complete, so the request body is
+# never held in memory as a whole; non-object items are reported per row.
+async def iter_json(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    state = "start"
+    async for text in iter_text(chunks):
+        buffer += text
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                break
+            if state == "start":
+                if buffer[0] == "[":
+                    buffer = buffer[1:]
+                    state = "array"
+                else:
+                    state = "lines"
+                continue
+            if state == "array" and buffer[0] in ",]":
+                if buffer[0] == "]":
+                    state = "done"
+                buffer = buffer[1:]
+                continue
+            if state == "done":
+                raise ImportFormatError("Unexpected data after the end of the JSON array")
+            if buffer[0] not in JSON_VALUE_START:
+                raise ImportFormatError(f"Invalid JSON near {buffer[:20]!r}")
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break
+            buffer = buffer[end:]
+            yield item
+    if buffer.strip():
+        raise ImportFormatError("Truncated or invalid JSON body")
+    if state == "array":
+        raise ImportFormatError("JSON array is not closed")
+
+def validate_row(raw: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    if not isinstance(raw, dict):
+        return None, "Row is not an object"
+    name = str(raw.get("name") or "").strip()
+    ip = str(raw.get("ip") or "").strip()
+    vendor = str(raw.get("vendor") or "").strip()
+    location = str(raw.get("location") or "").strip() or DEFAULT_LOCATION
+    if not name:
+        return None, "name is required"
+    if not vendor:
+        return None, "vendor is required"
+    if len(name) > NAME_MAX or len(vendor) > VENDOR_MAX or len(location) > LOCATION_MAX:
+        return None, "name, vendor or location is too long"
+    try:
+        ip = str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None, f"Invalid IP address: {ip!r}"
+    return {"name": name, "ip": ip, "vendor": vendor, "location": location}, None
+
+def existing_ids(db: Session, ips: List[str]) -> Dict[str, str]:
+    return dict(db.query(Device.ip, Device.id).filter(Device.ip.in_(ips)).all())
+
+def upsert_statement(db: Session, on_conflict: str):
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    statement = dialect_insert(Device)
+    if on_conflict == "skip":
+        return statement.on_conflict_do_nothing(index_elements=["ip"])
+    return statement.on_conflict_do_update(
+        index_elements=["ip"],
+        set_={
+            "name": statement.excluded.name,
+            "vendor": statement.excluded.vendor,
+            "location": statement.excluded.location,
+        }
+    )
+
+# One INSERT ... ON CONFLICT (ip) executemany per chunk; the caller commits once
+# after the last chunk. Databases without ON CONFLICT get a plain executemany
+# INSERT for new addresses and an executemany UPDATE keyed by id for the rest.
+def upsert_chunk(db: Session, rows: List[Dict], on_conflict: str) -> List[Dict]:
+    known = existing_ids(db, [row["ip"] for row in rows])
+    now = datetime.utcnow()
+    params = []
+    results = []
+    for row in rows:
+        device_id = known.get(row["ip"])
+        if device_id is None:
+            status, device_id = "created", str(uuid.uuid4())
+        else:
+            status = "skipped" if on_conflict == "skip" else "updated"
+        params.append({"id": device_id, "created_at": now, **row})
+        results.append({"row": row["row"], "ip": row["ip"], "name": row["name"], "status": status, "id": device_id, "error": None})
+    for item in params:
+        item.pop("row")
+
+    statement = upsert_statement(db, on_conflict)
+    if statement is not None:
+        db.execute(statement, params)
+        return results
+
+    new = [p for p in params if p["ip"] not in known]
+    if new:
+        db.execute(insert(Device), new)
+    if on_conflict != "skip":
+        changed = [
+            {"_id": p["id"], "name": p["name"], "vendor": p["vendor"], "location": p["location"]}
+            for p in params if p["ip"] in known
+        ]
+        if changed:
+            db.execute(
+                update(Device.__table__).where(Device.__table__.c.id == bindparam("_id")).values(
+                    name=bindparam("name"), vendor=bindparam("vendor"), location=bindparam("location")
+                ),
+                changed
+            )
+    return results
+
+async def import_devices(db: Session, items: AsyncIterator[Dict], on_conflict: str = "update") -> List[Dict]:
+    results: List[Dict] = []
+    pending: List[Dict] = []
+    seen: Dict[str, int] = {}
+    row_number = 0
+    async for raw in items:
+        row_number += 1
+        row, error = validate_row(raw)
+        if error is None and row["ip"] in seen:
+            error = f"Duplicate IP address, already given in row {seen[row['ip']]}"
+        if error:
+            results.append({
+                "row": row_number,
+                "ip": str(raw.get("ip") or "") if isinstance(raw, dict) else "",
+                "name": str(raw.get("name") or "") if isinstance(raw, dict) else "",
+                "status": "failed", "id": None, "error": error
+            })
+            continue
+        seen[row["ip"]] = row_number
+        pending.append({"row": row_number, **row})
+        if len(pending) >= IMPORT_CHUNK_SIZE:
+            results.extend(upsert_chunk(db, pending, on_conflict))
+            pending = []
+    if pending:
+        results.extend(upsert_chunk(db, pending, on_conflict))
+    results.sort(key=lambda r: r["row"])
+    return results
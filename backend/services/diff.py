@@ -0,0 +1,137 @@
+import difflib
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+DIFF_CACHE_BYTES = int(os.getenv("NETGUARD_DIFF_CACHE_BYTES", 32 * 1024 * 1024))
+DEFAULT_CONTEXT = 3
+
+# Lines that change on every collection without a configuration change:
+# uptimes, clocks, login notices, "last changed" stamps and version banners.
+VOLATILE_LINE = re.compile(
+    r"""^\s*(?:
+        .*\buptime\s+is\b.*
+      | uptime\s+is\b.*
+      | last\s+reboot\b.*
+      | current\s+time\b.*
+      | system\s+time\b.*
+      | copyright\b.*
+      | \*.*\bcopyright\b.*\*?
+      | compiled\s.*
+      | .*\blogin\s+time\s+is\b.*
+      | .*\blast(?:est)?\s+accessed\s+ip\b.*
+      | .*\bvty\s+users\b.*
+      | building\s+configuration.*
+      | current\s+configuration\s*:\s*\d+\s+bytes.*
+      | !\s*last\s+configuration\s+change\b.*
+      | !\s*nvram\s+config\s+last\s+updated\b.*
+      | !\s*time:.*
+      | ntp\s+clock-period\b.*
+    )$""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+def stable_lines(text: str) -> List[str]:
+    return [line for line in text.splitlines() if not VOLATILE_LINE.match(line)]
+
+def strip_volatile(text: str) -> str:
+    lines = stable_lines(text)
+    return "\n".join(lines) + "\n" if lines else ""
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha256(strip_volatile(normalized).encode("utf-8")).hexdigest()
+
+def hunks_for(old: List[str], new: List[str], context: int) -> List[Dict]:
+    hunks = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for group in matcher.get_grouped_opcodes(context):
+        first, last = group[0], group[-1]
+        lines = []
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                lines.extend({"op": " ", "text": line} for line in old[i1:i2])
+                continue
+            if tag in ("replace", "delete"):
+                lines.extend({"op": "-", "text": line} for line in old[i1:i2])
+            if tag in ("replace", "insert"):
+                lines.extend({"op": "+", "text": line} for line in new[j1:j2])
+        old_lines, new_lines = last[2] - first[1], last[4] - first[3]
+        hunks.append({
+            "old_start": first[1] + 1 if old_lines else first[1],
+            "old_lines": old_lines,
+            "new_start": first[3] + 1 if new_lines else first[3],
+            "new_lines": new_lines,
+            "lines": lines
+        })
+    return hunks
+
+def render_unified(hunks: List[Dict], old_label: str, new_label: str) -> str:
+    out = [f"--- {old_label}", f"+++ {new_label}"]
+    for hunk in hunks:
+        out.append(f"@@ -{hunk['old_start']},{hunk['old_lines']} +{hunk['new_start']},{hunk['new_lines']} @@")
+        out.extend(line["op"] + line["text"] for line in hunk["lines"])
+    return "\n".join(out)
+
+class DiffCache:
+    def __init__(self, max_bytes: int = DIFF_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, Tuple[Dict, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, value: Dict, size: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def stats(self) -> Dict:
+        return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+diff_cache = DiffCache()
+
+def estimate_size(result: Dict) -> int:
+    size = 256 + len(result.get("diff") or "")
+    for hunk in result.get("hunks") or ():
+        size += 64 + sum(len(line["text"]) + 48 for line in hunk["lines"])
+    return size
+
+def diff_contents(old_hash: str, old_text: str, new_hash: str, new_text: str, fmt: str = "unified", context: int = DEFAULT_CONTEXT) -> Dict:
+    key = (old_hash, new_hash, fmt, context)
+    cached = diff_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    hunks = hunks_for(stable_lines(old_text), stable_lines(new_text), context) if old_hash != new_hash else []
+    added = sum(1 for hunk in hunks for line in hunk["lines"] if line["op"] == "+")
+    removed = sum(1 for hunk in hunks for line in hunk["lines"] if line["op"] == "-")
+    result = {"changed": bool(hunks), "added": added, "removed": removed, "diff": None, "hunks": None}
+    if hunks:
+        if fmt == "structured":
+            result["hunks"] = hunks
+        else:
+            result["diff"] = render_unified(hunks, old_hash[:12], new_hash[:12])
+    
+    diff_cache.put(key, result, estimate_size(result))
+    return result
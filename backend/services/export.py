@@ -0,0 +1,144 @@
+import io
+import json
+import re
+import tarfile
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Backup, Device
+from services import blobstore
+
+ARCHIVE_FORMATS = {
+    "tar.gz": ("application/gzip", "tar.gz"),
+    "zip": ("application/zip", "zip"),
+}
+UNSAFE_NAME = re.compile(r"[^\w.\-]+", re.UNICODE)
+
+def safe_name(value: str) -> str:
+    return UNSAFE_NAME.sub("_", value).strip("._") or "unnamed"
+
+def selected_backups(
+    db: Session,
+    at: Optional[datetime] = None,
+    switch_ids: Optional[List[str]] = None,
+    location: Optional[str] = None,
+    vendor: Optional[str] = None
+) -> List:
+    rank = func.row_number().over(
+        partition_by=Backup.switch_id,
+        order_by=(Backup.timestamp.desc(), Backup.id.desc())
+    ).label("rank")
+    ranked = db.query(Backup.id, rank)
+    if at:
+        ranked = ranked.filter(Backup.timestamp <= at)
+    if switch_ids:
+        ranked = ranked.filter(Backup.switch_id.in_(switch_ids))
+    ranked = ranked.subquery()
+
+    query = (
+        db.query(
+            Backup.id,
+            Backup.switch_id,
+            Backup.timestamp,
+            Backup.content_hash,
+            Backup.size,
+            Device.name,
+            Device.ip,
+            Device.location,
+            Device.vendor
+        )
+        .join(ranked, Backup.id == ranked.c.id)
+        .outerjoin(Device, Device.id == Backup.switch_id)
+        .filter(ranked.c.rank == 1)
+    )
+    if location:
+        query = query.filter(Device.location == location)
+    if vendor:
+        query = query.filter(Device.vendor == vendor)
+    return query.order_by(Device.location, Device.name, Backup.switch_id).all()
+
+def member_name(row) -> str:
+    folder = safe_name(row.location) if row.location else "unassigned"
+    stem = f"{safe_name(row.name)}_{row.ip}" if row.name else safe_name(row.switch_id)
+    return f"{folder}/{stem}.cfg"
+
+class ChunkBuffer(io.RawIOBase):
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if data:
+            self.chunks.append(bytes(data))
+            self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+# The archive writer only ever appends to ChunkBuffer, which is drained after
+# every member: gzip/deflate output leaves as soon as it is produced and at most
+# one decompressed config is held in memory, however many devices are exported.
+def stream_archive(session_factory, fmt: str, rows: List, at: Optional[datetime] = None) -> Iterator[bytes]:
+    buffer = ChunkBuffer()
+    if fmt == "zip":
+        archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+    else:
+        archive = tarfile.open(fileobj=buffer, mode="w|gz")
+
+    def add(name: str, data: bytes, mtime: float):
+        if fmt == "zip":
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(mtime)
+            archive.addfile(info, io.BytesIO(data))
+
+    manifest: List[Dict] = []
+    db = session_factory()
+    try:
+        for row in rows:
+            backup = db.get(Backup, row.id)
+            if backup is None:
+                continue
+            data = blobstore.backup_content(db, backup).encode("utf-8")
+            db.expunge_all()
+            name = member_name(row)
+            add(name, data, row.timestamp.replace(tzinfo=timezone.utc).timestamp() if row.timestamp else time.time())
+            manifest.append({
+                "path": name,
+                "switch_id": row.switch_id,
+                "device_name": row.name,
+                "device_ip": row.ip,
+                "backup_id": row.id,
+                "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+                "content_hash": row.content_hash,
+                "size": len(data)
+            })
+            yield buffer.drain()
+    finally:
+        db.close()
+
+    summary = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "at": at.isoformat() if at else None,
+        "count": len(manifest),
+        "backups": manifest
+    }
+    add("manifest.json", json.dumps(summary, ensure_ascii=False, indent=2).encode("utf-8"), time.time())
+    archive.close()
+    yield buffer.drain()
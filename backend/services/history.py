@@ -0,0 +1,102 @@
+import os
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import Backup, ConfigBlob
+from services import blobstore
+
+KEYFRAME_INTERVAL = int(os.getenv("NETGUARD_KEYFRAME_INTERVAL", 30))
+
+def device_versions(db: Session, switch_id: str) -> List[Backup]:
+    return (
+        db.query(Backup)
+        .filter(Backup.switch_id == switch_id)
+        .order_by(Backup.timestamp.asc(), Backup.id.asc())
+        .all()
+    )
+
+# Older versions are kept as reverse deltas against the version that replaced
+# them, so the newest config of every device is always a full blob. Every
+# KEYFRAME_INTERVAL-th version also stays full to bound reconstruction chains.
+def record_versions(db: Session, backups: List[Dict]):
+    backups = [b for b in backups if b.get("content_hash")]
+    if not backups:
+        return
+    
+    new_hashes = list({b["content_hash"] for b in backups})
+    for (digest,) in db.query(ConfigBlob.hash).filter(ConfigBlob.hash.in_(new_hashes), ConfigBlob.base_hash.isnot(None)).all():
+        blobstore.materialize(db, digest)
+    
+    new_ids = {b["id"] for b in backups}
+    order = (Backup.timestamp.desc(), Backup.id.desc())
+    ranked = (
+        db.query(
+            Backup.id,
+            Backup.switch_id,
+            Backup.content_hash,
+            func.row_number().over(partition_by=Backup.switch_id, order_by=order).label("rank"),
+            func.count(Backup.id).over(partition_by=Backup.switch_id).label("versions")
+        )
+        .filter(Backup.switch_id.in_({b["switch_id"] for b in backups}))
+        .subquery()
+    )
+    heads: Dict[str, Dict[int, tuple]] = {}
+    for row in db.query(ranked).filter(ranked.c.rank <= 2).all():
+        heads.setdefault(row.switch_id, {})[row.rank] = row
+    
+    candidates = {}
+    for switch_id, head in heads.items():
+        latest, previous = head.get(1), head.get(2)
+        if latest is None or previous is None or latest.id not in new_ids:
+            continue
+        if not previous.content_hash or previous.content_hash == latest.content_hash:
+            continue
+        if KEYFRAME_INTERVAL > 0 and (previous.versions - 1) % KEYFRAME_INTERVAL == 0:
+            continue
+        candidates[previous.content_hash] = (switch_id, latest.content_hash)
+    if not candidates:
+        return
+    
+    latest_rank = func.row_number().over(partition_by=Backup.switch_id, order_by=order).label("rank")
+    latest = db.query(Backup.switch_id, Backup.content_hash, latest_rank).subquery()
+    pinned = set()
+    for row in db.query(latest).filter(latest.c.rank == 1, latest.c.content_hash.in_(list(candidates))).all():
+        if row.switch_id != candidates[row.content_hash][0]:
+            pinned.add(row.content_hash)
+    
+    for digest, (_, base_digest) in candidates.items():
+        if digest not in pinned:
+            blobstore.store_as_delta(db, digest, base_digest)
+
+def record_version(db: Session, backup: Backup):
+    record_versions(db, [{
+        "id": backup.id,
+        "switch_id": backup.switch_id,
+        "content_hash": backup.content_hash
+    }])
+
+def describe_versions(db: Session, switch_id: str) -> List[Dict]:
+    versions = []
+    for number, backup in enumerate(device_versions(db, switch_id), start=1):
+        depth = blobstore.chain_depth(db, backup.content_hash) if backup.content_hash else 0
+        versions.append({
+            "version": number,
+            "backup_id": backup.id,
+            "timestamp": backup.timestamp.isoformat() if backup.timestamp else "",
+            "content_hash": backup.content_hash,
+            "size": backup.size,
+            "storage": "delta" if depth else "full",
+            "chain_depth": depth
+        })
+    return versions
+
+def get_version(db: Session, switch_id: str, version: int) -> Optional[Backup]:
+    if version < 1:
+        return None
+    return (
+        db.query(Backup)
+        .filter(Backup.switch_id == switch_id)
+        .order_by(Backup.timestamp.asc(), Backup.id.asc())
+        .offset(version - 1)
+        .first()
+    )
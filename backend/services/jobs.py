@@ -0,0 +1,340 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from services import metrics
+
+JOB_WORKERS = int(os.getenv("NETGUARD_JOB_WORKERS", 4))
+JOB_QUEUE_SIZE = int(os.getenv("NETGUARD_JOB_QUEUE_SIZE", 100))
+JOB_HISTORY = int(os.getenv("NETGUARD_JOB_HISTORY", 200))
+JOB_STORE = os.getenv("NETGUARD_JOB_STORE", "memory")
+JOB_EVENT_HISTORY = int(os.getenv("NETGUARD_JOB_EVENT_HISTORY", 1000))
+STORE_FLUSH_INTERVAL = 1.0
+EVENT_HEARTBEAT = 15.0
+
+TERMINAL_STATES = ("completed", "failed", "interrupted")
+
+class JobQueueFull(Exception):
+    pass
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class Job:
+    def __init__(self, job_id: str, kind: str, devices: List[Dict]):
+        self.id = job_id
+        self.kind = kind
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.devices: Dict[str, Dict] = OrderedDict(
+            (d["device_id"], {**d, "status": "pending"}) for d in devices
+        )
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Only the latest events are kept for Last-Event-ID replay; the full
+        # per-device state is in `devices`.
+        self.events: "deque[Dict]" = deque(maxlen=JOB_EVENT_HISTORY)
+        self.event_count = 0
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def total(self) -> int:
+        return len(self.devices)
+
+    @property
+    def success(self) -> int:
+        return sum(1 for d in self.devices.values() if d["status"] == "success")
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for d in self.devices.values() if d["status"] == "failed")
+
+    @property
+    def changed(self) -> int:
+        return sum(1 for d in self.devices.values() if d.get("change") == "changed")
+
+    @property
+    def unchanged(self) -> int:
+        return sum(1 for d in self.devices.values() if d.get("change") == "unchanged")
+
+    @property
+    def pending(self) -> int:
+        return sum(1 for d in self.devices.values() if d["status"] == "pending")
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATES
+
+    def record(self, device_id: str, **fields):
+        device = self.devices.setdefault(device_id, {"device_id": device_id})
+        device.update(fields)
+        # A copy, so replayed and queued events show the state as it was when sent
+        self.publish("device", dict(device))
+
+    def publish(self, event: str, data: Dict):
+        message = {"id": self.event_count, "event": event, "data": data}
+        self.event_count += 1
+        self.events.append(message)
+        for queue in self._subscribers:
+            queue.put_nowait(message)
+
+    def summary(self) -> Dict:
+        return {k: v for k, v in self.to_dict().items() if k != "devices"}
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "total": self.total,
+            "success": self.success,
+            "failed": self.failed,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "pending": self.pending,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "devices": list(self.devices.values()),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Job":
+        job = cls(data["job_id"], data.get("kind", "backup"), [])
+        job.status = data["status"]
+        job.error = data.get("error")
+        job.devices = OrderedDict((d["device_id"], d) for d in data.get("devices", []))
+        job.created_at = parse_time(data["created_at"])
+        job.started_at = parse_time(data.get("started_at"))
+        job.finished_at = parse_time(data.get("finished_at"))
+        return job
+
+    # Device entries are copied so the snapshot can be serialized in a thread
+    # while the job keeps updating them on the event loop.
+    def snapshot(self) -> Dict:
+        state = self.to_dict()
+        state["devices"] = [dict(d) for d in state["devices"]]
+        return state
+
+class MemoryJobStore:
+    persistent = False
+
+    def save(self, state: Dict):
+        pass
+
+    def load(self, job_id: str) -> Optional[Job]:
+        return None
+
+    def mark_interrupted(self):
+        pass
+
+class SqliteJobStore:
+    persistent = True
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+    def save(self, state: Dict):
+        from models import BackupJob
+        db = self.session_factory()
+        try:
+            row = db.query(BackupJob).filter(BackupJob.id == state["job_id"]).first()
+            if not row:
+                row = BackupJob(id=state["job_id"], kind=state["kind"], created_at=parse_time(state["created_at"]))
+                db.add(row)
+            row.status = state["status"]
+            row.total = state["total"]
+            row.success = state["success"]
+            row.failed = state["failed"]
+            row.started_at = parse_time(state["started_at"])
+            row.finished_at = parse_time(state["finished_at"])
+            row.state = json.dumps(state, ensure_ascii=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def load(self, job_id: str) -> Optional[Job]:
+        from models import BackupJob
+        db = self.session_factory()
+        try:
+            row = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+            if not row or not row.state:
+                return None
+            return Job.from_dict(json.loads(row.state))
+        finally:
+            db.close()
+
+    def mark_interrupted(self):
+        from models import BackupJob
+        db = self.session_factory()
+        try:
+            db.query(BackupJob).filter(BackupJob.status.in_(["queued", "running"])).update(
+                {BackupJob.status: "interrupted", BackupJob.finished_at: datetime.utcnow()},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+def create_store(kind: str = JOB_STORE):
+    if kind == "sqlite":
+        return SqliteJobStore()
+    return MemoryJobStore()
+
+Runner = Callable[[Job], Awaitable[None]]
+
+class JobManager:
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, history: int = JOB_HISTORY, store=None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.history = history
+        self.store = store if store is not None else create_store()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_flush: Dict[str, float] = {}
+        self._store_lock: Optional[asyncio.Lock] = None
+        self._writes: Set[asyncio.Task] = set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self.store.mark_interrupted()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job in self._jobs.values():
+            if not job.done:
+                job.status = "interrupted"
+                job.finished_at = datetime.utcnow()
+                self.save(job)
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+    def submit(self, devices: List[Dict], runner: Runner, kind: str = "backup") -> Job:
+        if self._queue is None:
+            self.start()
+        job = Job(str(uuid.uuid4()), kind, devices)
+        try:
+            self._queue.put_nowait((job, runner))
+        except asyncio.QueueFull:
+            raise JobQueueFull("Job queue is full, try again later")
+        metrics.jobs_queued.set(self._queue.qsize())
+        self._jobs[job.id] = job
+        self._evict()
+        self.save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            job = self.store.load(job_id)
+        return job
+
+    def list(self) -> List[Job]:
+        return list(reversed(self._jobs.values()))
+
+    def record(self, job: Job, device_id: str, **fields):
+        job.record(device_id, **fields)
+        now = time.monotonic()
+        if now - self._last_flush.get(job.id, 0) >= STORE_FLUSH_INTERVAL:
+            self._last_flush[job.id] = now
+            self.save(job)
+
+    # Store writes run in a thread so job updates never block the event loop. The
+    # snapshot is taken when save is called and writes go through one lock in
+    # call order, so an older state never overwrites a newer one.
+    def save(self, job: Job) -> Optional[asyncio.Task]:
+        if not self.store.persistent:
+            return None
+        if self._store_lock is None:
+            self._store_lock = asyncio.Lock()
+        task = asyncio.ensure_future(self._write(job.snapshot()))
+        self._writes.add(task)
+        task.add_done_callback(self._write_done)
+        return task
+
+    async def _write(self, state: Dict):
+        async with self._store_lock:
+            await asyncio.to_thread(self.store.save, state)
+
+    def _write_done(self, task: asyncio.Task):
+        self._writes.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Failed to save job state: {task.exception()}")
+
+    async def events(self, job: Job, last_event_id: int = -1) -> AsyncIterator[Optional[Dict]]:
+        queue: asyncio.Queue = asyncio.Queue()
+        backlog = [e for e in job.events if e["id"] > last_event_id]
+        job._subscribers.append(queue)
+        try:
+            for message in backlog:
+                yield message
+            if job.done:
+                if not any(e["event"] == "done" for e in job.events):
+                    yield {"id": job.event_count, "event": "done", "data": job.summary()}
+                return
+            seen = backlog[-1]["id"] if backlog else last_event_id
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if message["id"] <= seen:
+                    continue
+                yield message
+                if message["event"] == "done":
+                    return
+        finally:
+            job._subscribers.remove(queue)
+
+    async def _worker(self):
+        while True:
+            job, runner = await self._queue.get()
+            metrics.jobs_queued.set(self._queue.qsize())
+            try:
+                await self._run(job, runner)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, runner: Runner):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        self.save(job)
+        job.publish("status", {"status": job.status})
+        try:
+            await runner(job)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "interrupted"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._last_flush.pop(job.id, None)
+            self.save(job)
+            metrics.jobs_finished.inc(kind=job.kind, status=job.status)
+            job.publish("done", job.summary())
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(len(self._jobs) - self.history, 0)]:
+            del self._jobs[job_id]
+
+job_manager = JobManager()
@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value)
+
+# Minimal Prometheus text-format metrics. Each metric keeps one small record per
+# label set behind its own lock, so recording is a dict lookup plus an addition
+# and the hot path never formats strings; rendering happens only on scrape.
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, key)} {format_value(value)}" for key, value in items
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            record = self._values.get(key)
+            if record is None:
+                # per-bucket counts (last slot is +Inf), then sum
+                record = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            record[index] += 1
+            record[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, record[:]) for key, record in self._values.items())
+        lines = self.header()
+        for key, record in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), record[:-1]):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {format_value(record[-1])}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+ssh_stage_seconds = registry.register(Histogram(
+    "netguard_ssh_stage_seconds",
+    "Time spent in each SSH collection stage (connect: TCP, auth: SSH handshake and login, session: shell setup, command: one command until the prompt returns)",
+    ("stage", "vendor")
+))
+ssh_results = registry.register(Counter(
+    "netguard_ssh_results_total",
+    "SSH collection attempts by outcome",
+    ("result",)
+))
+ssh_sessions_in_flight = registry.register(Gauge(
+    "netguard_ssh_sessions_in_flight",
+    "SSH collection attempts currently running"
+))
+collected_bytes = registry.register(Counter(
+    "netguard_collected_bytes_total",
+    "Bytes of device output collected",
+    ("vendor",)
+))
+db_commit_seconds = registry.register(Histogram(
+    "netguard_db_commit_seconds",
+    "Database commit latency",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+))
+http_request_seconds = registry.register(Histogram(
+    "netguard_http_request_duration_seconds",
+    "HTTP request latency by router",
+    ("router", "method", "status")
+))
+jobs_finished = registry.register(Counter(
+    "netguard_jobs_total",
+    "Finished background jobs by kind and final status",
+    ("kind", "status")
+))
+jobs_queued = registry.register(Gauge(
+    "netguard_jobs_queued",
+    "Jobs waiting for a worker"
+))
+
+# Plain ASGI middleware: the router stores the matched endpoint in the shared
+# scope, and requests are labelled by the module that defines it (devices,
+# backups, ...) instead of by raw path, keeping the label set small.
+class RequestMetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            module = getattr(endpoint, "__module__", None) or "unmatched"
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                router=module.rsplit(".", 1)[-1],
+                method=scope["method"],
+                status=str(status["code"])
+            )
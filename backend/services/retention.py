@@ -0,0 +1,472 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from models import Backup, ComplianceResult, ConfigBlob, ParsedConfig, RetentionPolicy
+from services import archive, blobstore, search, stats
+
+BACKUP_DIR = os.getenv("NETGUARD_BACKUP_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "backups"))
+SPOOL_DIR = os.path.join(BACKUP_DIR, ".spool")
+MANAGED_LIST = os.path.join(BACKUP_DIR, ".managed")
+
+RETENTION_BATCH_SIZE = int(os.getenv("NETGUARD_RETENTION_BATCH_SIZE", 500))
+ORPHAN_GRACE_SECONDS = int(os.getenv("NETGUARD_ORPHAN_GRACE_SECONDS", 3600))
+SPOOL_MAX_AGE = int(os.getenv("NETGUARD_SPOOL_MAX_AGE", 86400))
+VACUUM_PAGES = int(os.getenv("NETGUARD_VACUUM_PAGES", 0))
+DEVICE_BATCH_SIZE = 200
+REPORT_DEVICES = 100
+BACKUP_FILE_SUFFIXES = (".cfg", ".txt")
+DEFAULT_POLICY_ID = "default"
+POLICY_FIELDS = ("enabled", "keep_last", "keep_daily_days", "keep_monthly_months", "keep_changed", "cron")
+
+run_lock = threading.Lock()
+managed_lock = threading.Lock()
+
+class RetentionBusy(Exception):
+    pass
+
+def get_policy(db: Session) -> RetentionPolicy:
+    policy = db.get(RetentionPolicy, DEFAULT_POLICY_ID)
+    if policy is None:
+        policy = RetentionPolicy(id=DEFAULT_POLICY_ID)
+        db.add(policy)
+        db.flush()
+    return policy
+
+def policy_to_dict(policy: RetentionPolicy) -> Dict:
+    return {field: getattr(policy, field) for field in POLICY_FIELDS}
+
+def month_index(moment: datetime) -> int:
+    return moment.year * 12 + moment.month - 1
+
+# `versions` is one device's backups, newest first. The newest keep_last are kept,
+# then the newest backup of each of the last keep_daily_days days and of each of
+# the last keep_monthly_months calendar months; keep_changed additionally keeps
+# every backup whose volatile-stripped fingerprint differs from the one before it.
+def kept_versions(versions: List, policy: Dict, now: datetime) -> Set[str]:
+    keep = {v.id for v in versions[:max(policy["keep_last"] or 0, 1)]}
+
+    if policy["keep_daily_days"]:
+        since = now - timedelta(days=policy["keep_daily_days"])
+        days = set()
+        for v in versions:
+            if v.timestamp < since:
+                break
+            if v.timestamp.date() not in days:
+                days.add(v.timestamp.date())
+                keep.add(v.id)
+
+    if policy["keep_monthly_months"]:
+        first_month = month_index(now) - policy["keep_monthly_months"] + 1
+        months = set()
+        for v in versions:
+            month = month_index(v.timestamp)
+            if month < first_month:
+                break
+            if month not in months:
+                months.add(month)
+                keep.add(v.id)
+
+    if policy["keep_changed"]:
+        previous = None
+        for v in reversed(versions):
+            if v.fingerprint is None or v.fingerprint != previous:
+                keep.add(v.id)
+            previous = v.fingerprint
+    return keep
+
+def backed_up_devices(db: Session):
+    last = None
+    while True:
+        query = db.query(Backup.switch_id).distinct().order_by(Backup.switch_id)
+        if last is not None:
+            query = query.filter(Backup.switch_id > last)
+        batch = [row[0] for row in query.limit(DEVICE_BATCH_SIZE).all()]
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+def plan_batch(db: Session, switch_ids: List[str], policy: Dict, now: datetime) -> Dict[str, List]:
+    rows = (
+        db.query(Backup.id, Backup.switch_id, Backup.timestamp, Backup.fingerprint, Backup.content_hash, Backup.filename)
+        .filter(Backup.switch_id.in_(switch_ids))
+        .order_by(Backup.switch_id, Backup.timestamp.desc(), Backup.id.desc())
+        .all()
+    )
+    by_device: Dict[str, List] = {}
+    for row in rows:
+        by_device.setdefault(row.switch_id, []).append(row)
+    plan = {}
+    for switch_id, versions in by_device.items():
+        keep = kept_versions(versions, policy, now)
+        plan[switch_id] = (versions, [v for v in versions if v.id not in keep])
+    return plan
+
+# Device backup counters (services/stats.py) drop in the same transaction; with
+# RETURNING only rows that were still there are counted.
+def delete_backups(db: Session, doomed: List) -> int:
+    statement = delete(Backup).where(Backup.id.in_([backup_id for backup_id, _ in doomed]))
+    if db.bind.dialect.delete_returning:
+        switch_ids = [row[0] for row in db.execute(statement.returning(Backup.switch_id)).all()]
+    else:
+        db.execute(statement)
+        switch_ids = [switch_id for _, switch_id in doomed]
+    removed: Dict[str, int] = {}
+    for switch_id in switch_ids:
+        removed[switch_id] = removed.get(switch_id, 0) - 1
+    stats.adjust_backup_counts(db, removed)
+    return len(switch_ids)
+
+def referenced_hashes():
+    return select(Backup.content_hash).where(Backup.content_hash.isnot(None))
+
+def delta_bases():
+    return select(ConfigBlob.base_hash).where(ConfigBlob.base_hash.isnot(None))
+
+# Older versions are stored as deltas against newer blobs (see history.py), so a
+# blob can lose its last backup while still being the base of a kept version.
+# Those kept versions are rebuilt as full blobs before anything is deleted.
+def materialize_orphaned_chains(db: Session) -> int:
+    digests = [
+        row[0] for row in
+        db.query(ConfigBlob.hash).filter(
+            ConfigBlob.base_hash.isnot(None),
+            ConfigBlob.hash.in_(referenced_hashes()),
+            ConfigBlob.base_hash.notin_(referenced_hashes())
+        ).all()
+    ]
+    for i in range(0, len(digests), RETENTION_BATCH_SIZE):
+        for digest in digests[i:i + RETENTION_BATCH_SIZE]:
+            blobstore.materialize(db, digest)
+        db.commit()
+    return len(digests)
+
+def collect_blobs(db: Session) -> Dict[str, int]:
+    materialized = materialize_orphaned_chains(db)
+    deleted = freed = 0
+    while True:
+        # A blob that is still the base of another delta is kept until that delta
+        # goes, so an unreferenced chain is removed from its newest end inward.
+        chunk = [
+            row[0] for row in
+            db.query(ConfigBlob.hash).filter(
+                ConfigBlob.hash.notin_(referenced_hashes()),
+                ConfigBlob.hash.notin_(delta_bases())
+            ).limit(RETENTION_BATCH_SIZE).all()
+        ]
+        if not chunk:
+            break
+        freed += db.query(func.coalesce(func.sum(func.length(ConfigBlob.data)), 0)).filter(ConfigBlob.hash.in_(chunk)).scalar()
+        search.remove_content(db, chunk)
+        # Both conditions are re-checked at delete time in case a backup written
+        # meanwhile reuses one of these blobs, or a delta stored on top of it.
+        removed = db.execute(
+            delete(ConfigBlob).where(
+                ConfigBlob.hash.in_(chunk),
+                ConfigBlob.hash.notin_(referenced_hashes()),
+                ConfigBlob.hash.notin_(delta_bases())
+            )
+        ).rowcount
+        db.commit()
+        if not removed:
+            break
+        deleted += removed
+
+    derived = 0
+    for model in (ParsedConfig, ComplianceResult):
+        derived += db.execute(delete(model).where(model.content_hash.notin_(referenced_hashes()))).rowcount
+    db.commit()
+    return {"blobs_deleted": deleted, "blob_bytes_freed": freed, "materialized": materialized, "derived_rows_deleted": derived}
+
+def estimate_blobs(db: Session, doomed: Dict[str, int], doomed_ids: Set[str]) -> Dict[str, int]:
+    orphaned = set(row[0] for row in db.query(ConfigBlob.hash).filter(ConfigBlob.hash.notin_(referenced_hashes())).all())
+    digests = list(doomed)
+    for i in range(0, len(digests), blobstore.IN_CLAUSE_SIZE):
+        chunk = digests[i:i + blobstore.IN_CLAUSE_SIZE]
+        survivors = {
+            row.content_hash for row in
+            db.query(Backup.id, Backup.content_hash).filter(Backup.content_hash.in_(chunk)).all()
+            if row.id not in doomed_ids
+        }
+        orphaned.update(d for d in chunk if d not in survivors)
+    freed = 0
+    orphaned = list(orphaned)
+    for i in range(0, len(orphaned), blobstore.IN_CLAUSE_SIZE):
+        freed += db.query(func.coalesce(func.sum(func.length(ConfigBlob.data)), 0)).filter(
+            ConfigBlob.hash.in_(orphaned[i:i + blobstore.IN_CLAUSE_SIZE])
+        ).scalar()
+    return {"blobs_deleted": len(orphaned), "blob_bytes_freed": freed}
+
+def file_age(path: str, now: float) -> float:
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+def read_managed() -> Set[str]:
+    try:
+        with open(MANAGED_LIST, 'r', encoding='utf-8') as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+# Only files this app wrote are ever removed. persist_results lists every backup
+# filename it creates in BACKUP_DIR/.managed, so sample captures and anything
+# else placed in the directory are left alone. The API and workers append to the
+# list as single short writes; a name lost to a concurrent rewrite only leaves
+# its file on disk.
+def mark_managed(filenames: Iterable[str]):
+    with managed_lock:
+        managed = read_managed()
+        new = [f for f in dict.fromkeys(filenames) if f and "\n" not in f and f not in managed]
+        if not new:
+            return
+        with open(MANAGED_LIST, 'a', encoding='utf-8') as f:
+            f.write("".join(name + "\n" for name in new))
+
+def forget_managed(filenames: Iterable[str]):
+    gone = set(filenames)
+    if not gone:
+        return
+    with managed_lock:
+        managed = read_managed()
+        if not managed & gone:
+            return
+        partial = MANAGED_LIST + ".tmp"
+        with open(partial, 'w', encoding='utf-8') as f:
+            f.write("".join(name + "\n" for name in sorted(managed - gone)))
+        os.replace(partial, MANAGED_LIST)
+
+# Databases from before the list existed: every file a backup row names was
+# written by this app.
+def seed_managed(db: Session):
+    if os.path.exists(MANAGED_LIST):
+        return
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    mark_managed(row[0] for row in db.query(Backup.filename).filter(Backup.filename.isnot(None)).distinct())
+    if not os.path.exists(MANAGED_LIST):
+        open(MANAGED_LIST, 'a').close()
+
+def remove_managed(paths: List[str]) -> int:
+    removed = remove_files(paths)
+    forget_managed(os.path.basename(path) for path in paths)
+    return removed
+
+# Backup files are only deleted once no backup row names them: batch backups
+# overwrite one <name>_<ip>.cfg per device, so many rows share a file.
+def orphan_files(db: Session, released: Optional[Dict[str, int]] = None) -> List[str]:
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    managed = read_managed()
+    counts = dict(
+        db.query(Backup.filename, func.count(Backup.id)).filter(Backup.filename.isnot(None)).group_by(Backup.filename).all()
+    )
+    for filename, count in (released or {}).items():
+        counts[filename] = counts.get(filename, 0) - count
+    now = time.time()
+    orphans = []
+    for entry in os.scandir(BACKUP_DIR):
+        if not entry.is_file() or not entry.name.endswith(BACKUP_FILE_SUFFIXES) or entry.name not in managed:
+            continue
+        if counts.get(entry.name, 0) <= 0 and file_age(entry.path, now) >= ORPHAN_GRACE_SECONDS:
+            orphans.append(entry.path)
+    return orphans
+
+def stale_spool_files() -> List[str]:
+    if not os.path.isdir(SPOOL_DIR):
+        return []
+    now = time.time()
+    return [
+        entry.path for entry in os.scandir(SPOOL_DIR)
+        if entry.is_file() and file_age(entry.path, now) >= SPOOL_MAX_AGE
+    ]
+
+def remove_files(paths: List[str]) -> int:
+    removed = 0
+    for path in paths:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def remove_unreferenced_files(db: Session, filenames: List[str]) -> int:
+    filenames = [f for f in set(filenames) if f]
+    if not filenames:
+        return 0
+    still_used = {
+        row[0] for row in
+        db.query(Backup.filename).filter(Backup.filename.in_(filenames)).distinct().all()
+    }
+    managed = read_managed()
+    return remove_managed([
+        os.path.join(BACKUP_DIR, f) for f in filenames
+        if f not in still_used and f in managed and os.path.basename(f) == f
+    ])
+
+def database_path(engine) -> Optional[str]:
+    if engine.dialect.name != "sqlite" or not engine.url.database or engine.url.database == ":memory:":
+        return None
+    return engine.url.database
+
+def database_bytes(engine) -> Optional[int]:
+    path = database_path(engine)
+    if path is None:
+        return None
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+# Deleted rows only become free pages; with auto_vacuum=INCREMENTAL they are handed
+# back to the file system here, and the WAL is checkpointed and truncated. Databases
+# created before auto_vacuum was enabled need one full VACUUM to switch modes.
+def compact(engine, full: bool = False) -> Dict:
+    if engine.dialect.name != "sqlite":
+        return {}
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if full:
+            conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("VACUUM")
+        mode = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+        free_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if mode == 2 and free_before:
+            # The pragma frees one page per step; executescript steps it to the end
+            # where a plain execute stops after the first page.
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({VACUUM_PAGES});" if VACUUM_PAGES else "PRAGMA incremental_vacuum;"
+            )
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return {
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode)),
+            "freelist_pages": conn.exec_driver_sql("PRAGMA freelist_count").scalar(),
+            "pages_released": free_before - conn.exec_driver_sql("PRAGMA freelist_count").scalar() if mode == 2 else 0
+        }
+
+def run(session_factory, dry_run: bool = True, full_vacuum: bool = False, policy: Optional[Dict] = None) -> Dict:
+    if not run_lock.acquire(blocking=False):
+        raise RetentionBusy("A retention run is already in progress")
+    started = time.perf_counter()
+    db = session_factory()
+    try:
+        engine = db.get_bind()
+        if policy is None:
+            policy = policy_to_dict(get_policy(db))
+            db.commit()
+        report = {
+            "dry_run": dry_run,
+            "started_at": datetime.utcnow().isoformat(),
+            "policy": policy,
+            "db_bytes_before": database_bytes(engine)
+        }
+        if policy["keep_changed"]:
+            archive.fill_backup_fingerprints(db)
+
+        now = datetime.utcnow()
+        devices = scanned = 0
+        pending: List = []
+        doomed_hashes: Dict[str, int] = {}
+        doomed_ids: Set[str] = set()
+        released: Dict[str, int] = {}
+        per_device = []
+        deleted = 0
+        for switch_ids in backed_up_devices(db):
+            for switch_id, (versions, doomed) in plan_batch(db, switch_ids, policy, now).items():
+                devices += 1
+                scanned += len(versions)
+                if not doomed:
+                    continue
+                per_device.append({"switch_id": switch_id, "kept": len(versions) - len(doomed), "deleted": len(doomed)})
+                for v in doomed:
+                    pending.append((v.id, v.switch_id))
+                    if v.filename:
+                        released[v.filename] = released.get(v.filename, 0) + 1
+                    if dry_run:
+                        doomed_ids.add(v.id)
+                        if v.content_hash:
+                            doomed_hashes[v.content_hash] = doomed_hashes.get(v.content_hash, 0) + 1
+            if not dry_run:
+                # One transaction per RETENTION_BATCH_SIZE rows keeps write locks short
+                for i in range(0, len(pending), RETENTION_BATCH_SIZE):
+                    deleted += delete_backups(db, pending[i:i + RETENTION_BATCH_SIZE])
+                    db.commit()
+                pending = []
+            db.rollback()
+
+        report.update(devices=devices, backups_scanned=scanned, backups_deleted=deleted if not dry_run else len(pending))
+        report["devices_affected"] = len(per_device)
+        report["by_device"] = sorted(per_device, key=lambda d: -d["deleted"])[:REPORT_DEVICES]
+
+        if dry_run:
+            report.update(estimate_blobs(db, doomed_hashes, doomed_ids))
+            report["files_deleted"] = len(orphan_files(db, released))
+            report["spool_files_deleted"] = len(stale_spool_files())
+        else:
+            report.update(collect_blobs(db))
+            report["files_deleted"] = remove_managed(orphan_files(db))
+            report["spool_files_deleted"] = remove_files(stale_spool_files())
+            db.close()
+            report.update(compact(engine, full_vacuum))
+        report["db_bytes_after"] = database_bytes(engine)
+        report["finished_at"] = datetime.utcnow().isoformat()
+        report["duration_s"] = round(time.perf_counter() - started, 3)
+        return report
+    finally:
+        db.close()
+        run_lock.release()
+
+def save_report(session_factory, report: Dict, status: str):
+    db = session_factory()
+    try:
+        policy = get_policy(db)
+        if status != "dry_run":
+            policy.last_run_at = datetime.utcnow()
+        policy.last_status = status
+        policy.last_report = json.dumps(report, ensure_ascii=False)
+        db.commit()
+    finally:
+        db.close()
+
+# Called from the scheduler loop in a worker thread. The run is claimed by moving
+# next_run_at forward first, like backup schedules, so only one process applies it.
+def run_if_due(session_factory=None, now: Optional[datetime] = None) -> Optional[Dict]:
+    from services.scheduler import next_run
+    if session_factory is None:
+        from database import SessionLocal
+        session_factory = SessionLocal
+    now = now or datetime.utcnow()
+    db = session_factory()
+    try:
+        policy = get_policy(db)
+        if not policy.enabled:
+            db.commit()
+            return None
+        if policy.next_run_at is None:
+            policy.next_run_at = next_run(policy.cron, now)
+            db.commit()
+            return None
+        if policy.next_run_at > now:
+            return None
+        claimed = db.query(RetentionPolicy).filter(
+            RetentionPolicy.id == policy.id,
+            RetentionPolicy.next_run_at == policy.next_run_at
+        ).update({RetentionPolicy.next_run_at: next_run(policy.cron, now)}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return None
+    finally:
+        db.close()
+
+    try:
+        report = run(session_factory, dry_run=False)
+    except RetentionBusy:
+        return None
+    except Exception as e:
+        save_report(session_factory, {"error": str(e)}, "failed")
+        raise
+    save_report(session_factory, report, "completed")
+    return report
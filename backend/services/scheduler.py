@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from sqlalchemy.orm import Session
+from models import BackupSchedule, Device, Template
+from services.jobs import JobQueueFull, job_manager
+
+SCHEDULER_ENABLED = os.getenv("NETGUARD_SCHEDULER_ENABLED", "1") not in ("0", "false", "no")
+SCHEDULER_INTERVAL = float(os.getenv("NETGUARD_SCHEDULER_INTERVAL", 30))
+
+FIELD_RANGES = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day", 1, 31),
+    ("month", 1, 12),
+    ("weekday", 0, 7),
+)
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+)}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(("sun", "mon", "tue", "wed", "thu", "fri", "sat"))}
+MACROS = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+# Stop searching after a few years so impossible dates like "0 0 31 2 *" fail fast
+MAX_LOOKAHEAD_DAYS = 366 * 4
+
+def parse_value(token: str, names: Dict[str, int]) -> int:
+    token = token.lower()
+    if token in names:
+        return names[token]
+    return int(token)
+
+def parse_field(spec: str, low: int, high: int, names: Dict[str, int]) -> Set[int]:
+    values: Set[int] = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in '{spec}'")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = parse_value(start_text, names), parse_value(end_text, names)
+        else:
+            start = parse_value(part, names)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Value out of range in '{spec}' ({low}-{high})")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronExpression:
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        fields = MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression must have 5 fields: minute hour day month weekday")
+        parsed = []
+        for spec, (name, low, high) in zip(fields, FIELD_RANGES):
+            names = MONTH_NAMES if name == "month" else WEEKDAY_NAMES if name == "weekday" else {}
+            try:
+                parsed.append(parse_field(spec, low, high, names))
+            except ValueError as e:
+                raise ValueError(f"Invalid {name} field: {e}")
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def matches_day(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        # cron weekdays count from Sunday, Python's from Monday
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=MAX_LOOKAHEAD_DAYS)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = (candidate.year + 1, 1) if candidate.month == 12 else (candidate.year, candidate.month + 1)
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self.matches_day(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+                continue
+            return candidate
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+def local_to_utc(moment: datetime) -> datetime:
+    return datetime.utcfromtimestamp(moment.timestamp())
+
+def utc_to_local(moment: datetime) -> datetime:
+    return datetime.fromtimestamp((moment - datetime(1970, 1, 1)).total_seconds())
+
+# Cron fields are read in the server's local time; all stored timestamps stay UTC
+# like the rest of the schema.
+def next_run(expression: str, after_utc: Optional[datetime] = None) -> datetime:
+    after_utc = after_utc or datetime.utcnow()
+    return local_to_utc(CronExpression(expression).next_after(utc_to_local(after_utc)))
+
+def device_delay(schedule_id: str, device_id: str, jitter_seconds: int) -> float:
+    if jitter_seconds <= 0:
+        return 0.0
+    digest = hashlib.sha1(f"{schedule_id}:{device_id}".encode()).digest()
+    return int.from_bytes(digest[:4], "big") % (jitter_seconds * 1000) / 1000.0
+
+def schedule_devices(db: Session, schedule: BackupSchedule) -> List[Device]:
+    query = db.query(Device)
+    device_ids = json.loads(schedule.device_ids) if schedule.device_ids else []
+    if device_ids:
+        query = query.filter(Device.id.in_(device_ids))
+    if schedule.location:
+        query = query.filter(Device.location == schedule.location)
+    if schedule.vendor:
+        query = query.filter(Device.vendor == schedule.vendor)
+    return query.order_by(Device.id).all()
+
+def dispatch(db: Session, schedule: BackupSchedule) -> Optional[str]:
+    from services.backup_runner import submit_backup_job
+
+    previous = job_manager.get(schedule.last_job_id) if schedule.last_job_id else None
+    if previous is not None and not previous.done:
+        schedule.last_error = "Previous run is still in progress"
+        return None
+
+    schedule.last_run_at = datetime.utcnow()
+    schedule.last_error = None
+
+    template = db.query(Template).filter(Template.id == schedule.template_id).first()
+    if not template:
+        schedule.last_status = "failed"
+        schedule.last_error = "Template not found"
+        return None
+
+    devices = schedule_devices(db, schedule)
+    if not devices:
+        schedule.last_status = "failed"
+        schedule.last_error = "No devices matched the schedule"
+        return None
+
+    delays = {d.id: device_delay(schedule.id, d.id, schedule.jitter_seconds or 0) for d in devices}
+    try:
+        job = submit_backup_job(
+            devices,
+            {"id": template.id, "name": template.name, "username": template.username, "password": template.password, "port": template.port},
+            json.loads(schedule.commands),
+            only_changed=bool(schedule.only_changed),
+            delays=delays,
+            kind="scheduled"
+        )
+    except JobQueueFull as e:
+        schedule.last_status = "skipped"
+        schedule.last_error = str(e)
+        return None
+
+    schedule.last_job_id = job.id
+    schedule.last_status = job.status
+    return job.id
+
+def refresh_status(db: Session):
+    active = db.query(BackupSchedule).filter(
+        BackupSchedule.last_job_id.isnot(None),
+        BackupSchedule.last_status.in_(["queued", "running"])
+    ).all()
+    for schedule in active:
+        job = job_manager.get(schedule.last_job_id)
+        schedule.last_status = job.status if job else "interrupted"
+
+def retention_finished(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Retention run failed: {task.exception()}")
+
+class Scheduler:
+    def __init__(self, interval: float = SCHEDULER_INTERVAL, session_factory=None):
+        self.interval = interval
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._retention: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._retention is not None:
+            # A running prune is finished by its thread; only the wait is dropped
+            self._retention.cancel()
+            self._retention = None
+
+    def tick(self, now: Optional[datetime] = None) -> List[str]:
+        if self.session_factory is None:
+            from database import SessionLocal
+            self.session_factory = SessionLocal
+        now = now or datetime.utcnow()
+        dispatched = []
+        db = self.session_factory()
+        try:
+            refresh_status(db)
+            db.commit()
+            due = db.query(BackupSchedule).filter(
+                BackupSchedule.enabled == True,
+                BackupSchedule.next_run_at <= now
+            ).all()
+            for schedule in due:
+                # Claim the run by moving next_run_at forward first so a second
+                # process sharing the database cannot dispatch it again. A run
+                # missed while the server was down fires once, not once per slot.
+                claimed = db.query(BackupSchedule).filter(
+                    BackupSchedule.id == schedule.id,
+                    BackupSchedule.next_run_at == schedule.next_run_at
+                ).update({BackupSchedule.next_run_at: next_run(schedule.cron, now)}, synchronize_session=False)
+                db.commit()
+                if not claimed:
+                    continue
+                db.refresh(schedule)
+                job_id = dispatch(db, schedule)
+                db.commit()
+                if job_id:
+                    dispatched.append(job_id)
+        finally:
+            db.close()
+        return dispatched
+
+    # Retention runs can take minutes on a large archive, so they get their own
+    # thread and never hold up dispatching backup schedules.
+    def check_retention(self):
+        from services import retention
+        if self._retention is not None and not self._retention.done():
+            return
+        self._retention = asyncio.ensure_future(asyncio.to_thread(retention.run_if_due, self.session_factory))
+        self._retention.add_done_callback(retention_finished)
+
+    async def _loop(self):
+        while True:
+            try:
+                self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Scheduler tick failed: {e}")
+            self.check_retention()
+            await asyncio.sleep(self.interval)
+
+scheduler = Scheduler()
@@ -0,0 +1,156 @@
+import re
+from typing import Dict, List, Optional
+from sqlalchemy import func, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import Backup, Device, SearchDocument
+from services import blobstore
+
+FTS_TABLE = "config_fts"
+MIN_QUERY_LENGTH = 3
+MAX_LINES_PER_HIT = 20
+SNIPPET_LENGTH = 200
+REINDEX_BATCH_SIZE = 200
+
+def is_supported(bind) -> bool:
+    return bind.dialect.name == "sqlite"
+
+# Each distinct config blob is indexed once (trigram tokens, so IPs, ACL names
+# and partial words match); backups are joined back through content_hash.
+def create_index(engine: Engine):
+    if not is_supported(engine):
+        return
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                "body, content='', contentless_delete=1, tokenize='trigram')"
+            ))
+        except OperationalError:
+            conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, tokenize='trigram')"))
+
+def index_content(db: Session, digest: str, content: str):
+    index_many(db, {digest: content})
+
+def index_many(db: Session, contents: Dict[str, str]):
+    if not contents or not is_supported(db.get_bind()):
+        return
+    digests = list(contents)
+    known = {
+        row[0] for row in
+        db.query(SearchDocument.content_hash).filter(SearchDocument.content_hash.in_(digests)).all()
+    }
+    documents = [SearchDocument(content_hash=digest) for digest in digests if digest not in known]
+    if not documents:
+        return
+    db.add_all(documents)
+    db.flush()
+    db.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (:id, :body)"),
+        [{"id": document.id, "body": contents[document.content_hash]} for document in documents]
+    )
+
+def remove_content(db: Session, digests: List[str]):
+    if not digests or not is_supported(db.get_bind()):
+        return
+    documents = db.query(SearchDocument).filter(SearchDocument.content_hash.in_(digests)).all()
+    for document in documents:
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": document.id})
+        db.delete(document)
+
+def reindex_missing(db: Session) -> int:
+    if not is_supported(db.get_bind()):
+        return 0
+    indexed = 0
+    while True:
+        digests = [
+            row[0] for row in
+            db.query(Backup.content_hash)
+            .outerjoin(SearchDocument, SearchDocument.content_hash == Backup.content_hash)
+            .filter(Backup.content_hash.isnot(None), SearchDocument.id.is_(None))
+            .distinct()
+            .limit(REINDEX_BATCH_SIZE)
+            .all()
+        ]
+        if not digests:
+            return indexed
+        index_many(db, {digest: blobstore.get(db, digest) or "" for digest in digests})
+        db.commit()
+        indexed += len(digests)
+
+def match_expression(query: str) -> str:
+    return '"' + query.replace('"', '""') + '"'
+
+def matching_lines(content: str, query: str) -> List[Dict]:
+    needle = query.lower()
+    lines = []
+    for number, line in enumerate(content.splitlines(), start=1):
+        if needle in line.lower():
+            lines.append({"line": number, "text": line.strip()[:SNIPPET_LENGTH]})
+    return lines
+
+def search(
+    db: Session,
+    query: str,
+    latest_only: bool = True,
+    switch_id: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict]:
+    digests = [
+        row[0] for row in db.execute(
+            text(
+                f"SELECT d.content_hash FROM {FTS_TABLE} f "
+                "JOIN search_documents d ON d.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH :q"
+            ),
+            {"q": match_expression(query)}
+        )
+    ]
+    if not digests:
+        return []
+    
+    backups = db.query(Backup.id, Backup.switch_id, Backup.timestamp, Backup.content_hash)
+    if latest_only:
+        rank = func.row_number().over(
+            partition_by=Backup.switch_id,
+            order_by=(Backup.timestamp.desc(), Backup.id.desc())
+        ).label("rank")
+        latest = db.query(Backup.id, rank).subquery()
+        backups = backups.join(latest, Backup.id == latest.c.id).filter(latest.c.rank == 1)
+    if switch_id:
+        backups = backups.filter(Backup.switch_id == switch_id)
+    rows = (
+        backups.filter(Backup.content_hash.in_(digests))
+        .order_by(Backup.timestamp.desc(), Backup.id.desc())
+        .limit(limit)
+        .all()
+    )
+    
+    devices = {
+        d.id: d for d in
+        db.query(Device.id, Device.name, Device.ip).filter(Device.id.in_({r.switch_id for r in rows})).all()
+    }
+    lines_by_hash: Dict[str, List[Dict]] = {}
+    hits = []
+    for row in rows:
+        if row.content_hash not in lines_by_hash:
+            lines_by_hash[row.content_hash] = matching_lines(blobstore.get(db, row.content_hash) or "", query)
+        lines = lines_by_hash[row.content_hash]
+        device = devices.get(row.switch_id)
+        hits.append({
+            "backup_id": row.id,
+            "switch_id": row.switch_id,
+            "device_name": device.name if device else None,
+            "device_ip": device.ip if device else None,
+            "timestamp": row.timestamp.isoformat() if row.timestamp else "",
+            "match_count": len(lines),
+            "matches": lines[:MAX_LINES_PER_HIT]
+        })
+    return hits
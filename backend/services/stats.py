@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import and_, bindparam, case, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from models import Backup, DailyStat, Device
+
+STATS_TTL = float(os.getenv("NETGUARD_STATS_TTL", 10))
+STATS_DAYS = int(os.getenv("NETGUARD_STATS_DAYS", 30))
+STATS_STALE_HOURS = float(os.getenv("NETGUARD_STATS_STALE_HOURS", 24))
+STATS_DEVICE_LIMIT = 50
+ERROR_MAX = 500
+FAILED_PREFIX = "failed:"
+
+def day_key(moment: datetime) -> str:
+    return moment.date().isoformat()
+
+def counter_statement(db: Session):
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    statement = dialect_insert(DailyStat)
+    return statement.on_conflict_do_update(
+        index_elements=["day", "metric"],
+        set_={"count": DailyStat.count + statement.excluded.count}
+    )
+
+# Counters are bumped in the caller's transaction, so they commit or roll back
+# together with the backup rows and device columns they describe.
+def add_daily(db: Session, counts: Dict[Tuple[str, str], int]):
+    params = [{"day": day, "metric": metric, "count": count} for (day, metric), count in counts.items() if count]
+    if not params:
+        return
+    statement = counter_statement(db)
+    if statement is not None:
+        db.execute(statement, params)
+        return
+
+    known = {
+        (row.day, row.metric) for row in
+        db.query(DailyStat.day, DailyStat.metric).filter(DailyStat.day.in_({p["day"] for p in params})).all()
+    }
+    new = [p for p in params if (p["day"], p["metric"]) not in known]
+    if new:
+        db.execute(insert(DailyStat), new)
+    bumped = [{"_day": p["day"], "_metric": p["metric"], "added": p["count"]} for p in params if (p["day"], p["metric"]) in known]
+    if bumped:
+        table = DailyStat.__table__
+        db.execute(
+            update(table)
+            .where(table.c.day == bindparam("_day"), table.c.metric == bindparam("_metric"))
+            .values(count=table.c.count + bindparam("added")),
+            bumped
+        )
+
+def adjust_backup_counts(db: Session, deltas: Dict[str, int]):
+    params = [{"_id": switch_id, "delta": delta} for switch_id, delta in deltas.items() if delta]
+    if not params:
+        return
+    table = Device.__table__
+    count = func.coalesce(table.c.backup_count, 0) + bindparam("delta")
+    db.execute(
+        update(table).where(table.c.id == bindparam("_id")).values(backup_count=case((count < 0, 0), else_=count)),
+        params
+    )
+
+def record_failures(db: Session, failures: List[Dict]):
+    if not failures:
+        return
+    latest: Dict[str, Dict] = {}
+    counts: Dict[Tuple[str, str], int] = {}
+    for failure in failures:
+        error_class = failure.get("error_class") or "error"
+        key = (day_key(failure["timestamp"]), FAILED_PREFIX + error_class)
+        counts[key] = counts.get(key, 0) + 1
+        current = latest.get(failure["switch_id"])
+        if current is None or failure["timestamp"] >= current["last_failure"]:
+            latest[failure["switch_id"]] = {
+                "id": failure["switch_id"],
+                "last_failure": failure["timestamp"],
+                "last_error": (failure.get("error") or "")[:ERROR_MAX],
+                "last_error_class": error_class
+            }
+    known = {row[0] for row in db.query(Device.id).filter(Device.id.in_(latest)).all()}
+    updates = [values for switch_id, values in latest.items() if switch_id in known]
+    if updates:
+        db.execute(update(Device), updates)
+    add_daily(db, counts)
+
+# Seeds the counters for databases that predate them: per-device backup counts
+# from one GROUP BY, and the daily table from the stored history, where a change
+# is a backup whose fingerprint (or content hash) differs from the one before.
+def backfill(db: Session):
+    missing = [row[0] for row in db.query(Device.id).filter(Device.backup_count.is_(None)).all()]
+    if missing:
+        counts = dict(db.query(Backup.switch_id, func.count(Backup.id)).group_by(Backup.switch_id).all())
+        table = Device.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("_id")).values(backup_count=bindparam("count")),
+            [{"_id": device_id, "count": counts.get(device_id, 0)} for device_id in missing]
+        )
+        db.commit()
+
+    if db.query(DailyStat.day).first() is not None or db.query(Backup.id).first() is None:
+        return
+    state = func.coalesce(Backup.fingerprint, Backup.content_hash)
+    ranked = select(
+        Backup.timestamp,
+        state.label("state"),
+        func.lag(state).over(partition_by=Backup.switch_id, order_by=(Backup.timestamp, Backup.id)).label("previous")
+    ).subquery()
+    day = func.date(ranked.c.timestamp)
+    changed = or_(ranked.c.previous.is_(None), ranked.c.previous != ranked.c.state)
+    counts = {}
+    for row in db.query(day, func.count(), func.sum(case((changed, 1), else_=0))).group_by(day).all():
+        counts[(str(row[0]), "backups")] = row[1]
+        counts[(str(row[0]), "changes")] = row[2] or 0
+    add_daily(db, counts)
+    db.commit()
+
+def group_totals() -> Dict:
+    return {"devices": 0, "backed_up": 0, "failing": 0, "stale": 0}
+
+def coverage(totals: Dict) -> float:
+    return round(totals["backed_up"] * 100.0 / totals["devices"], 1) if totals["devices"] else 0.0
+
+# Every figure comes from the device columns and the daily counters maintained by
+# archive.add_backups / record_failures, so the cost depends on the number of
+# devices and days, never on the number of stored backups.
+def fleet_stats(db: Session, now: Optional[datetime] = None) -> Dict:
+    now = now or datetime.utcnow()
+    last_success = func.coalesce(Device.last_verified, Device.last_backup)
+    failing = and_(Device.last_failure.isnot(None), or_(last_success.is_(None), Device.last_failure > last_success))
+    stale_since = now - timedelta(hours=STATS_STALE_HOURS)
+    stale = or_(last_success.is_(None), last_success < stale_since)
+    ages = {
+        "24h": last_success >= now - timedelta(days=1),
+        "7d": and_(last_success < now - timedelta(days=1), last_success >= now - timedelta(days=7)),
+        "30d": and_(last_success < now - timedelta(days=7), last_success >= now - timedelta(days=30)),
+        "older": last_success < now - timedelta(days=30),
+    }
+
+    rows = db.query(
+        Device.location,
+        Device.vendor,
+        func.count(Device.id),
+        func.count(last_success),
+        func.sum(case((failing, 1), else_=0)),
+        func.sum(case((stale, 1), else_=0)),
+        func.coalesce(func.sum(Device.backup_count), 0),
+        *(func.sum(case((condition, 1), else_=0)) for condition in ages.values())
+    ).group_by(Device.location, Device.vendor).all()
+
+    totals = group_totals()
+    totals["backups"] = 0
+    age = {name: 0 for name in ages}
+    by_location: Dict[str, Dict] = {}
+    by_vendor: Dict[str, Dict] = {}
+    for row in rows:
+        location, vendor, devices, backed_up, failing_count, stale_count, backups = row[:7]
+        values = {"devices": devices, "backed_up": backed_up, "failing": failing_count or 0, "stale": stale_count or 0}
+        for group in (totals, by_location.setdefault(location or "", group_totals()), by_vendor.setdefault(vendor, group_totals())):
+            for key, value in values.items():
+                group[key] += value
+        totals["backups"] += backups or 0
+        for name, count in zip(ages, row[7:]):
+            age[name] += count or 0
+    age["never"] = totals["devices"] - totals["backed_up"]
+
+    first_day = (now - timedelta(days=STATS_DAYS - 1)).date()
+    days = {(first_day + timedelta(days=i)).isoformat(): {"backups": 0, "changes": 0, "failures": 0} for i in range(STATS_DAYS)}
+    failures_by_class: Dict[str, int] = {}
+    for stat in db.query(DailyStat).filter(DailyStat.day >= first_day.isoformat()).all():
+        day = days.get(stat.day)
+        if day is None:
+            continue
+        if stat.metric.startswith(FAILED_PREFIX):
+            day["failures"] += stat.count
+            error_class = stat.metric[len(FAILED_PREFIX):]
+            failures_by_class[error_class] = failures_by_class.get(error_class, 0) + stat.count
+        elif stat.metric in day:
+            day[stat.metric] += stat.count
+
+    attention = (
+        db.query(Device, last_success.label("last_success"))
+        .filter(or_(failing, stale))
+        .order_by(case((failing, 0), else_=1), last_success.is_(None).desc(), last_success.asc(), Device.name)
+        .limit(STATS_DEVICE_LIMIT)
+        .all()
+    )
+
+    return {
+        "generated_at": now,
+        "window_days": STATS_DAYS,
+        "stale_hours": STATS_STALE_HOURS,
+        "devices": totals["devices"],
+        "backed_up": totals["backed_up"],
+        "coverage": coverage(totals),
+        "failing": totals["failing"],
+        "stale": totals["stale"],
+        "backups": totals["backups"],
+        "age": age,
+        "by_location": [{"location": k, **v, "coverage": coverage(v)} for k, v in sorted(by_location.items())],
+        "by_vendor": [{"vendor": k, **v, "coverage": coverage(v)} for k, v in sorted(by_vendor.items())],
+        "daily": [{"day": k, **v} for k, v in days.items()],
+        "failures_by_class": [
+            {"error_class": k, "count": v} for k, v in sorted(failures_by_class.items(), key=lambda item: -item[1])
+        ],
+        "attention": [
+            {
+                "id": device.id,
+                "name": device.name,
+                "ip": device.ip,
+                "vendor": device.vendor,
+                "location": device.location,
+                "last_success": success,
+                "last_failure": device.last_failure,
+                "last_error": device.last_error,
+                "last_error_class": device.last_error_class,
+                "age_hours": round((now - success).total_seconds() / 3600, 1) if success else None
+            }
+            for device, success in attention
+        ]
+    }
+
+# The dashboard polls this; concurrent misses wait for the one computing instead
+# of all running the aggregate queries.
+class StatsCache:
+    def __init__(self, ttl: float = STATS_TTL):
+        self.ttl = ttl
+        self.value: Optional[Dict] = None
+        self.expires = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, compute: Callable[[], Dict]) -> Dict:
+        with self._lock:
+            if self.value is None or time.monotonic() >= self.expires:
+                self.value = compute()
+                self.expires = time.monotonic() + self.ttl
+            return self.value
+
+    def invalidate(self):
+        with self._lock:
+            self.value = None
+
+stats_cache = StatsCache()
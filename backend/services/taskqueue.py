@@ -0,0 +1,366 @@
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Set
+from sqlalchemy import and_, delete, func, or_, select, update
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+TASK_QUEUE = os.getenv("NETGUARD_TASK_QUEUE", "")
+REDIS_URL = os.getenv("NETGUARD_REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("NETGUARD_REDIS_PREFIX", "netguard")
+LEASE_SECONDS = float(os.getenv("NETGUARD_TASK_LEASE_SECONDS", 120))
+MAX_LEASES = int(os.getenv("NETGUARD_TASK_MAX_LEASES", 3))
+
+def lost_result(task: Dict, leases: int) -> Dict:
+    return {
+        "device_id": task.get("device_id"),
+        "device_name": task.get("device_name"),
+        "device_ip": task.get("device_ip"),
+        "success": False,
+        "filename": None,
+        "timestamp": None,
+        "error": f"Task was abandoned by its worker {leases} times",
+        "error_class": "abandoned",
+        "attempts": leases,
+        "duration": None,
+        "change": None,
+        "backup_id": None,
+        "worker_id": None
+    }
+
+# Device tasks are leased, not popped: a worker owns a task until its lease runs
+# out, and extends it with heartbeats while the SSH session is in progress. A task
+# whose worker died becomes leasable again once the lease expires, up to
+# MAX_LEASES times, after which it is reported as failed.
+class SqliteTaskQueue:
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+    def enqueue(self, job_id: str, tasks: List[Dict]):
+        from models import CollectionTask
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            db.execute(CollectionTask.__table__.insert(), [
+                {
+                    "id": str(uuid.uuid4()),
+                    "job_id": job_id,
+                    "device_id": task["device_id"],
+                    "site": task.get("site"),
+                    "status": "queued",
+                    "payload": json.dumps(task, ensure_ascii=False),
+                    "leases": 0,
+                    "reported": False,
+                    "created_at": now
+                }
+                for task in tasks
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail_abandoned(self, db, now: datetime):
+        from models import CollectionTask
+        abandoned = (
+            db.query(CollectionTask)
+            .filter(CollectionTask.status == "leased", CollectionTask.lease_expires < now, CollectionTask.leases >= MAX_LEASES)
+            .all()
+        )
+        for task in abandoned:
+            task.status = "failed"
+            task.result = json.dumps(lost_result(json.loads(task.payload or "{}"), task.leases), ensure_ascii=False)
+            task.payload = None
+            task.finished_at = now
+        # Sessions don't autoflush, and the lease UPDATE below must not see these
+        # rows as leasable.
+        db.flush()
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS, sites: Optional[Sequence[str]] = None) -> List[Dict]:
+        from models import CollectionTask
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            self._fail_abandoned(db, now)
+            leasable = or_(
+                CollectionTask.status == "queued",
+                and_(CollectionTask.status == "leased", CollectionTask.lease_expires < now)
+            )
+            candidates = select(CollectionTask.id).where(leasable)
+            if sites:
+                candidates = candidates.where(CollectionTask.site.in_(list(sites)))
+            candidates = candidates.order_by(CollectionTask.created_at).limit(limit)
+            token = str(uuid.uuid4())
+            # The condition is repeated on the outer UPDATE so a concurrent leaser
+            # re-checks it against the row it actually locked.
+            db.execute(
+                update(CollectionTask)
+                .where(CollectionTask.id.in_(candidates.scalar_subquery()), leasable)
+                .values(
+                    status="leased",
+                    worker_id=worker_id,
+                    lease_token=token,
+                    lease_expires=now + timedelta(seconds=lease_seconds),
+                    leases=CollectionTask.leases + 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            rows = db.query(CollectionTask.id, CollectionTask.payload).filter(CollectionTask.lease_token == token).all()
+            db.commit()
+            return [{**json.loads(payload), "task_id": task_id} for task_id, payload in rows]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def heartbeat(self, worker_id: str, task_ids: List[str], lease_seconds: float = LEASE_SECONDS) -> Set[str]:
+        from models import CollectionTask
+        if not task_ids:
+            return set()
+        db = self.session_factory()
+        try:
+            owned = CollectionTask.id.in_(task_ids), CollectionTask.worker_id == worker_id, CollectionTask.status == "leased"
+            db.query(CollectionTask).filter(*owned).update(
+                {CollectionTask.lease_expires: datetime.utcnow() + timedelta(seconds=lease_seconds)},
+                synchronize_session=False
+            )
+            kept = {row[0] for row in db.query(CollectionTask.id).filter(*owned).all()}
+            db.commit()
+            return kept
+        finally:
+            db.close()
+
+    def complete(self, worker_id: str, results: Dict[str, Dict]) -> Set[str]:
+        from models import CollectionTask
+        if not results:
+            return set()
+        db = self.session_factory()
+        try:
+            owned = {
+                row[0] for row in
+                db.query(CollectionTask.id).filter(
+                    CollectionTask.id.in_(list(results)),
+                    CollectionTask.worker_id == worker_id,
+                    CollectionTask.status == "leased"
+                ).all()
+            }
+            now = datetime.utcnow()
+            for task_id in owned:
+                result = results[task_id]
+                db.query(CollectionTask).filter(CollectionTask.id == task_id).update({
+                    CollectionTask.status: "done" if result["success"] else "failed",
+                    CollectionTask.result: json.dumps(result, ensure_ascii=False),
+                    CollectionTask.payload: None,
+                    CollectionTask.finished_at: now
+                }, synchronize_session=False)
+            db.commit()
+            return owned
+        finally:
+            db.close()
+
+    def release(self, worker_id: str, task_ids: List[str]):
+        from models import CollectionTask
+        if not task_ids:
+            return
+        db = self.session_factory()
+        try:
+            db.query(CollectionTask).filter(
+                CollectionTask.id.in_(task_ids),
+                CollectionTask.worker_id == worker_id,
+                CollectionTask.status == "leased"
+            ).update({
+                CollectionTask.status: "queued",
+                CollectionTask.worker_id: None,
+                CollectionTask.lease_expires: None,
+                CollectionTask.leases: CollectionTask.leases - 1
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def take_results(self, job_id: str) -> List[Dict]:
+        from models import CollectionTask
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            self._fail_abandoned(db, now)
+            rows = (
+                db.query(CollectionTask.id, CollectionTask.result)
+                .filter(
+                    CollectionTask.job_id == job_id,
+                    CollectionTask.status.in_(["done", "failed"]),
+                    CollectionTask.reported.is_(False)
+                )
+                .all()
+            )
+            if rows:
+                db.query(CollectionTask).filter(CollectionTask.id.in_([r[0] for r in rows])).update(
+                    {CollectionTask.reported: True}, synchronize_session=False
+                )
+            db.commit()
+            return [json.loads(result) for _, result in rows]
+        finally:
+            db.close()
+
+    def purge(self, job_id: str):
+        from models import CollectionTask
+        db = self.session_factory()
+        try:
+            db.execute(delete(CollectionTask).where(CollectionTask.job_id == job_id))
+            db.commit()
+        finally:
+            db.close()
+
+    def depth(self) -> Dict[str, int]:
+        from models import CollectionTask
+        db = self.session_factory()
+        try:
+            return dict(db.query(CollectionTask.status, func.count()).group_by(CollectionTask.status).all())
+        finally:
+            db.close()
+
+# Same lease protocol on Redis: one pending list per site, a sorted set of lease
+# deadlines, and a result list per job that the API drains.
+class RedisTaskQueue:
+    def __init__(self, url: str = REDIS_URL, prefix: str = REDIS_PREFIX):
+        if redis is None:
+            raise RuntimeError("NETGUARD_TASK_QUEUE=redis requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def enqueue(self, job_id: str, tasks: List[Dict]):
+        pipe = self.client.pipeline()
+        for task in tasks:
+            task_id = str(uuid.uuid4())
+            site = task.get("site") or ""
+            pipe.hset(self.key("task", task_id), mapping={
+                "job_id": job_id,
+                "site": site,
+                "status": "queued",
+                "payload": json.dumps(task, ensure_ascii=False),
+                "leases": 0
+            })
+            pipe.sadd(self.key("job", job_id), task_id)
+            pipe.sadd(self.key("sites"), site)
+            pipe.rpush(self.key("pending", site), task_id)
+        pipe.execute()
+
+    def _finish(self, task_id: str, job_id: str, status: str, result: Dict):
+        pipe = self.client.pipeline()
+        pipe.hset(self.key("task", task_id), mapping={"status": status, "payload": ""})
+        pipe.rpush(self.key("results", job_id), json.dumps(result, ensure_ascii=False))
+        pipe.execute()
+
+    def _reclaim(self):
+        for task_id in self.client.zrangebyscore(self.key("leases"), 0, time.time()):
+            # ZREM succeeds for exactly one caller, which then owns the expired task
+            if not self.client.zrem(self.key("leases"), task_id):
+                continue
+            task = self.client.hgetall(self.key("task", task_id))
+            if not task or task.get("status") != "leased":
+                continue
+            leases = int(task.get("leases") or 0)
+            if leases >= MAX_LEASES:
+                self._finish(task_id, task["job_id"], "failed", lost_result(json.loads(task["payload"]), leases))
+            else:
+                self.client.hset(self.key("task", task_id), mapping={"status": "queued", "worker_id": ""})
+                self.client.lpush(self.key("pending", task.get("site", "")), task_id)
+
+    def lease(self, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS, sites: Optional[Sequence[str]] = None) -> List[Dict]:
+        self._reclaim()
+        leased = []
+        for site in (sites or sorted(self.client.smembers(self.key("sites")))):
+            while len(leased) < limit:
+                task_id = self.client.lpop(self.key("pending", site))
+                if task_id is None:
+                    break
+                task_key = self.key("task", task_id)
+                if self.client.hget(task_key, "status") != "queued":
+                    continue
+                pipe = self.client.pipeline()
+                pipe.hset(task_key, mapping={"status": "leased", "worker_id": worker_id})
+                pipe.hincrby(task_key, "leases", 1)
+                pipe.zadd(self.key("leases"), {task_id: time.time() + lease_seconds})
+                pipe.hget(task_key, "payload")
+                payload = pipe.execute()[-1]
+                leased.append({**json.loads(payload), "task_id": task_id})
+        return leased
+
+    def heartbeat(self, worker_id: str, task_ids: List[str], lease_seconds: float = LEASE_SECONDS) -> Set[str]:
+        kept = set()
+        for task_id in task_ids:
+            if self.client.hget(self.key("task", task_id), "worker_id") != worker_id:
+                continue
+            if self.client.zscore(self.key("leases"), task_id) is None:
+                continue
+            self.client.zadd(self.key("leases"), {task_id: time.time() + lease_seconds}, xx=True)
+            kept.add(task_id)
+        return kept
+
+    def complete(self, worker_id: str, results: Dict[str, Dict]) -> Set[str]:
+        owned = set()
+        for task_id, result in results.items():
+            task_key = self.key("task", task_id)
+            if self.client.hget(task_key, "worker_id") != worker_id or not self.client.zrem(self.key("leases"), task_id):
+                continue
+            job_id = self.client.hget(task_key, "job_id")
+            if job_id is None:
+                continue
+            self._finish(task_id, job_id, "done" if result["success"] else "failed", result)
+            owned.add(task_id)
+        return owned
+
+    def release(self, worker_id: str, task_ids: List[str]):
+        for task_id in task_ids:
+            task_key = self.key("task", task_id)
+            if self.client.hget(task_key, "worker_id") != worker_id or not self.client.zrem(self.key("leases"), task_id):
+                continue
+            self.client.hset(task_key, mapping={"status": "queued", "worker_id": ""})
+            self.client.hincrby(task_key, "leases", -1)
+            self.client.lpush(self.key("pending", self.client.hget(task_key, "site") or ""), task_id)
+
+    def take_results(self, job_id: str) -> List[Dict]:
+        self._reclaim()
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(self.key("results", job_id), 0, -1)
+        pipe.delete(self.key("results", job_id))
+        raw, _ = pipe.execute()
+        return [json.loads(item) for item in raw]
+
+    def purge(self, job_id: str):
+        task_ids = self.client.smembers(self.key("job", job_id))
+        pipe = self.client.pipeline()
+        for task_id in task_ids:
+            # Tasks still sitting in a pending list are skipped once their hash is gone
+            pipe.delete(self.key("task", task_id))
+            pipe.zrem(self.key("leases"), task_id)
+        pipe.delete(self.key("job", job_id), self.key("results", job_id))
+        pipe.execute()
+
+    def depth(self) -> Dict[str, int]:
+        sites = self.client.smembers(self.key("sites"))
+        return {
+            "queued": sum(self.client.llen(self.key("pending", site)) for site in sites),
+            "leased": self.client.zcard(self.key("leases"))
+        }
+
+def create_queue(kind: str = TASK_QUEUE):
+    if kind == "redis":
+        return RedisTaskQueue()
+    if kind == "sqlite":
+        return SqliteTaskQueue()
+    return None
+
+task_queue = create_queue()
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Modules read their settings at import time, so the scratch locations have to be
+# in place before anything from the app is imported.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="netguard-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'netguard.db')}"
+os.environ["NETGUARD_BACKUP_DIR"] = os.path.join(SCRATCH_DIR, "backups")
+
+from sqlalchemy.orm import sessionmaker
+from database import build_engine
+from models import Base, Device
+from services import archive, search
+
+START = datetime(2026, 1, 1, 8, 0, 0)
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'netguard.db'}")
+    Base.metadata.create_all(bind=engine)
+    search.create_index(engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+def add_device(db, device_id: str = "sw1", ip: str = "10.0.0.1", vendor: str = "Cisco") -> Device:
+    device = Device(id=device_id, name=device_id, ip=ip, vendor=vendor, backup_count=0)
+    db.add(device)
+    db.commit()
+    return device
+
+# A config large enough for deltas to beat full blobs, with `version` changing a
+# couple of lines in the middle.
+def config_text(version: int, interfaces: int = 60) -> str:
+    lines = ["hostname core-sw1", "!"]
+    for port in range(1, interfaces + 1):
+        lines += [f"interface GigabitEthernet1/0/{port}", f" description access port {port}", " switchport mode access"]
+        if port == interfaces // 2:
+            lines.append(f" switchport access vlan {100 + version}")
+        lines.append("!")
+    lines.append(f"snmp-server location rack-{version}")
+    return "\n".join(lines) + "\n"
+
+def store_versions(db, switch_id: str, texts, start: datetime = START, step: timedelta = timedelta(hours=1)):
+    entries = [
+        {
+            "id": f"{switch_id}-{number}",
+            "switch_id": switch_id,
+            "timestamp": start + step * number,
+            "content": text,
+            "filename": f"{switch_id}.cfg"
+        }
+        for number, text in enumerate(texts)
+    ]
+    for entry in entries:
+        archive.add_backups(db, [entry])
+        db.commit()
+    return entries
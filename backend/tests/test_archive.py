@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from conftest import START, add_device, config_text
+from models import Backup, Device
+from services import archive
+
+def result(n: int, text: str, switch_id: str = "sw1"):
+    return {"id": f"{switch_id}-{n}", "switch_id": switch_id, "timestamp": START + timedelta(hours=n), "content": text, "filename": f"{switch_id}.cfg"}
+
+def with_uptime(text: str, uptime: str) -> str:
+    return f"core-sw1 uptime is {uptime}\n" + text
+
+def test_only_changed_skips_volatile_differences(db):
+    add_device(db)
+    text = config_text(1)
+    assert archive.store_results(db, [result(0, with_uptime(text, "1 day"))], only_changed=True) == {"sw1": "changed"}
+    db.commit()
+
+    outcome = archive.store_results(db, [result(1, with_uptime(text, "2 days"))], only_changed=True)
+    db.commit()
+    assert outcome == {"sw1": "unchanged"}
+    assert db.query(Backup).count() == 1
+    device = db.get(Device, "sw1")
+    assert device.last_verified == START + timedelta(hours=1)
+    assert device.last_backup == START
+
+    outcome = archive.store_results(db, [result(2, with_uptime(config_text(2), "3 days"))], only_changed=True)
+    db.commit()
+    assert outcome == {"sw1": "changed"}
+    assert db.query(Backup).count() == 2
+    assert db.get(Device, "sw1").last_backup == START + timedelta(hours=2)
+
+def test_store_results_keeps_every_result_by_default(db):
+    add_device(db)
+    text = config_text(1)
+    archive.store_results(db, [result(0, with_uptime(text, "1 day"))])
+    archive.store_results(db, [result(1, with_uptime(text, "2 days"))])
+    db.commit()
+    backups = db.query(Backup).order_by(Backup.timestamp).all()
+    assert len(backups) == 2
+    assert backups[0].fingerprint == backups[1].fingerprint
+    assert backups[0].content_hash != backups[1].content_hash
+
+def test_only_changed_compares_per_device(db):
+    add_device(db)
+    add_device(db, "sw2", "10.0.0.2")
+    text = config_text(1)
+    archive.store_results(db, [result(0, text)], only_changed=True)
+    db.commit()
+    outcome = archive.store_results(db, [result(1, text), result(1, text, "sw2")], only_changed=True)
+    assert outcome == {"sw1": "unchanged", "sw2": "changed"}
@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import config_text
+from models import ConfigBlob
+from services import blobstore
+
+def test_put_deduplicates_normalized_content(db):
+    first = blobstore.put(db, "hostname sw1  \r\ninterface vlan1\r\n\r\n")
+    second = blobstore.put(db, "hostname sw1\ninterface vlan1\n")
+    assert first == second
+    assert db.query(ConfigBlob).count() == 1
+    assert blobstore.get(db, first[0]) == "hostname sw1\ninterface vlan1\n"
+
+def test_get_follows_delta_chain(db):
+    digests = [blobstore.put(db, config_text(n))[0] for n in range(4)]
+    # As in history.py, each version becomes a delta against the next once that
+    # one is stored, so only the newest stays full
+    for older, newer in zip(digests, digests[1:]):
+        assert blobstore.store_as_delta(db, older, newer)
+
+    assert blobstore.chain_depth(db, digests[0]) == 3
+    assert blobstore.chain_depth(db, digests[-1]) == 0
+    for n, digest in enumerate(digests):
+        assert blobstore.get(db, digest) == blobstore.normalize(config_text(n))
+
+def test_store_as_delta_refuses_delta_base(db):
+    a, b, c = (blobstore.put(db, config_text(n))[0] for n in range(3))
+    assert blobstore.store_as_delta(db, b, c)
+    assert not blobstore.store_as_delta(db, a, b)
+    assert not blobstore.store_as_delta(db, a, a)
+
+def test_materialize_keeps_dependents_readable(db):
+    digests = [blobstore.put(db, config_text(n))[0] for n in range(3)]
+    blobstore.store_as_delta(db, digests[0], digests[1])
+    blobstore.store_as_delta(db, digests[1], digests[2])
+
+    blobstore.materialize(db, digests[1])
+    assert db.get(ConfigBlob, digests[1]).base_hash is None
+    assert blobstore.chain_depth(db, digests[0]) == 1
+    for n, digest in enumerate(digests):
+        assert blobstore.get(db, digest) == blobstore.normalize(config_text(n))
+
+def test_get_rejects_cyclic_chain(db, monkeypatch):
+    monkeypatch.setattr(blobstore, "MAX_CHAIN_DEPTH", 5)
+    a, b = (blobstore.put(db, config_text(n))[0] for n in range(2))
+    db.get(ConfigBlob, a).base_hash = b
+    db.get(ConfigBlob, b).base_hash = a
+    db.flush()
+    with pytest.raises(RuntimeError):
+        blobstore.get(db, a)
+
+def test_get_missing_blob(db):
+    assert blobstore.get(db, "0" * 64) is None
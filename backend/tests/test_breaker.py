@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from services import collector as collector_module
+from services.breaker import CircuitBreaker, CircuitOpen
+from services.collector import Collector
+
+def test_circuit_opens_after_threshold():
+    breaker = CircuitBreaker(threshold=2, probe_interval=60)
+    assert breaker.before_call("10.0.0.1") is False
+    breaker.record_failure("10.0.0.1", "timed out")
+    assert breaker.state("10.0.0.1") == "closed"
+    breaker.record_failure("10.0.0.1", "timed out")
+    assert breaker.state("10.0.0.1") == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call("10.0.0.1")
+    assert breaker.before_call("10.0.0.2") is False
+
+def test_probe_success_closes_circuit():
+    breaker = CircuitBreaker(threshold=1, probe_interval=0.05)
+    breaker.record_failure("10.0.0.1", "timed out")
+    time.sleep(0.06)
+    assert breaker.before_call("10.0.0.1") is True
+    assert breaker.state("10.0.0.1") == "half-open"
+    # Only one probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.before_call("10.0.0.1")
+    breaker.record_success("10.0.0.1")
+    assert breaker.state("10.0.0.1") == "closed"
+    assert breaker.before_call("10.0.0.1") is False
+
+def test_probe_failure_reopens_circuit():
+    breaker = CircuitBreaker(threshold=3, probe_interval=0.05)
+    for _ in range(3):
+        breaker.record_failure("10.0.0.1", "timed out")
+    time.sleep(0.06)
+    assert breaker.before_call("10.0.0.1") is True
+    breaker.record_failure("10.0.0.1", "still down")
+    assert breaker.state("10.0.0.1") == "open"
+    with pytest.raises(CircuitOpen, match="still down"):
+        breaker.before_call("10.0.0.1")
+
+def test_lost_probe_expires():
+    breaker = CircuitBreaker(threshold=1, probe_interval=0.05)
+    breaker.record_failure("10.0.0.1", "timed out")
+    time.sleep(0.06)
+    assert breaker.before_call("10.0.0.1") is True
+    # The probe's run never reports back; the next interval grants a new one
+    time.sleep(0.06)
+    assert breaker.before_call("10.0.0.1") is True
+
+def test_disabled_breaker():
+    breaker = CircuitBreaker(threshold=0)
+    for _ in range(5):
+        breaker.record_failure("10.0.0.1", "timed out")
+    assert breaker.before_call("10.0.0.1") is False
+    assert breaker.state("10.0.0.1") == "closed"
+
+def scripted(outcomes):
+    calls = []
+    def session(device_ip):
+        calls.append(device_ip)
+        return dict(outcomes[min(len(calls), len(outcomes)) - 1])
+    return session, calls
+
+def run_task(collector, session, device_ip="10.0.0.1"):
+    task = {"device_id": "sw1", "device_ip": device_ip, "task": session, "args": (device_ip,)}
+    return asyncio.run(collector.run(task))
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = CircuitBreaker(threshold=2, probe_interval=60)
+    monkeypatch.setattr(collector_module, "breaker", breaker)
+    monkeypatch.setattr(collector_module, "backoff_delay", lambda attempt: 0)
+    return breaker
+
+def test_retry_until_success(breaker):
+    unreachable = {"success": False, "retryable": True, "error": "timed out", "breaker_error": "timed out"}
+    session, calls = scripted([unreachable, unreachable, {"success": True}])
+    result = run_task(Collector(login_rate_per_minute=0, retry_attempts=2), session)
+    assert result["success"] is True
+    assert result["attempts"] == 3
+    assert len(calls) == 3
+    assert breaker.state("10.0.0.1") == "closed"
+
+def test_non_retryable_failure_is_not_retried(breaker):
+    session, calls = scripted([{"success": False, "retryable": False, "error": "auth failed"}])
+    result = run_task(Collector(login_rate_per_minute=0, retry_attempts=2), session)
+    assert result["attempts"] == 1
+    assert len(calls) == 1
+
+def test_breaker_counts_runs_not_attempts(breaker):
+    unreachable = {"success": False, "retryable": True, "error": "timed out", "breaker_error": "timed out"}
+    session, calls = scripted([unreachable])
+    collector = Collector(login_rate_per_minute=0, retry_attempts=2)
+
+    result = run_task(collector, session)
+    assert result["attempts"] == 3
+    assert "breaker_error" not in result
+    assert breaker.state("10.0.0.1") == "closed"
+    run_task(collector, session)
+    assert breaker.state("10.0.0.1") == "open"
+    assert len(calls) == 6
+
+def test_backoff_delay_is_capped():
+    for attempt in range(10):
+        delay = collector_module.backoff_delay(attempt, base=2, cap=30)
+        assert min(30, 2 * 2 ** attempt) / 2 <= delay <= min(30, 2 * 2 ** attempt)
@@ -0,0 +1,77 @@
+from sqlalchemy import func
+
+from conftest import add_device, config_text, store_versions
+from models import Backup, ConfigBlob
+from services import blobstore, history, retention
+
+def test_versions_round_trip_across_keyframes(db, monkeypatch):
+    monkeypatch.setattr(history, "KEYFRAME_INTERVAL", 5)
+    add_device(db)
+    texts = [config_text(n) for n in range(12)]
+    store_versions(db, "sw1", texts)
+
+    for number, text in enumerate(texts, start=1):
+        backup = history.get_version(db, "sw1", number)
+        assert backup.id == f"sw1-{number - 1}"
+        assert blobstore.backup_content(db, backup) == blobstore.normalize(text)
+    assert history.get_version(db, "sw1", 0) is None
+    assert history.get_version(db, "sw1", 13) is None
+
+    versions = history.describe_versions(db, "sw1")
+    storage = {v["version"]: v["storage"] for v in versions}
+    assert storage[12] == "full"
+    assert storage[5] == storage[10] == "full"
+    assert storage[1] == storage[11] == "delta"
+    assert max(v["chain_depth"] for v in versions) < 5
+
+def test_repeated_config_keeps_latest_version_full(db):
+    add_device(db)
+    a, b = config_text(1), config_text(2)
+    store_versions(db, "sw1", [a, b, a])
+
+    latest = history.get_version(db, "sw1", 3)
+    assert db.get(ConfigBlob, latest.content_hash).base_hash is None
+    for number, text in enumerate([a, b, a], start=1):
+        assert blobstore.backup_content(db, history.get_version(db, "sw1", number)) == blobstore.normalize(text)
+
+def test_pruning_middle_versions_keeps_survivors_readable(db, monkeypatch):
+    monkeypatch.setattr(history, "KEYFRAME_INTERVAL", 5)
+    add_device(db)
+    texts = [config_text(n) for n in range(12)]
+    entries = store_versions(db, "sw1", texts)
+
+    doomed = [(entry["id"], "sw1") for entry in entries[2:9]]
+    assert retention.delete_backups(db, doomed) == 7
+    db.commit()
+    report = retention.collect_blobs(db)
+    assert report["materialized"] >= 1
+    assert report["blobs_deleted"] == 7
+
+    survivors = [0, 1, 9, 10, 11]
+    versions = history.device_versions(db, "sw1")
+    assert [v.id for v in versions] == [f"sw1-{n}" for n in survivors]
+    for backup, n in zip(versions, survivors):
+        assert blobstore.backup_content(db, backup) == blobstore.normalize(texts[n])
+    assert db.query(func.count(ConfigBlob.hash)).scalar() == len(survivors)
+
+def test_retention_run_prunes_and_keeps_chain_intact(session_factory, monkeypatch):
+    monkeypatch.setattr(history, "KEYFRAME_INTERVAL", 4)
+    db = session_factory()
+    add_device(db)
+    texts = [config_text(n) for n in range(10)]
+    store_versions(db, "sw1", texts)
+    db.close()
+
+    policy = {"enabled": True, "keep_last": 3, "keep_daily_days": 0, "keep_monthly_months": 0, "keep_changed": False, "cron": None}
+    report = retention.run(session_factory, dry_run=False, policy=policy)
+    assert report["backups_deleted"] == 7
+
+    db = session_factory()
+    try:
+        versions = history.device_versions(db, "sw1")
+        assert [v.id for v in versions] == ["sw1-7", "sw1-8", "sw1-9"]
+        for backup, text in zip(versions, texts[7:]):
+            assert blobstore.backup_content(db, backup) == blobstore.normalize(text)
+        assert db.query(func.count(Backup.id)).scalar() == 3
+    finally:
+        db.close()
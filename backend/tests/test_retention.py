@@ -0,0 +1,91 @@
+import os
+from datetime import timedelta
+from types import SimpleNamespace
+
+from conftest import START, add_device, config_text, store_versions
+from models import ConfigBlob
+from services import blobstore, history, retention
+
+POLICY = {"keep_last": 1, "keep_daily_days": 0, "keep_monthly_months": 0, "keep_changed": False}
+
+def versions(count: int, step: timedelta, fingerprints=None):
+    # Newest first, as plan_batch hands them to kept_versions
+    return [
+        SimpleNamespace(id=f"v{n}", timestamp=START + step * n, fingerprint=(fingerprints or {}).get(n, f"f{n}"))
+        for n in reversed(range(count))
+    ]
+
+def test_kept_versions_keep_last():
+    kept = retention.kept_versions(versions(6, timedelta(hours=1)), {**POLICY, "keep_last": 3}, START)
+    assert kept == {"v5", "v4", "v3"}
+
+def test_kept_versions_always_keeps_newest():
+    kept = retention.kept_versions(versions(3, timedelta(hours=1)), {**POLICY, "keep_last": 0}, START)
+    assert kept == {"v2"}
+
+def test_kept_versions_daily_and_monthly():
+    history = versions(90, timedelta(hours=12))
+    now = history[0].timestamp
+    daily = retention.kept_versions(history, {**POLICY, "keep_daily_days": 3}, now)
+    # Newest of each of the last three days, plus the day the window starts in
+    assert daily == {"v89", "v87", "v85", "v83"}
+    monthly = retention.kept_versions(history, {**POLICY, "keep_monthly_months": 2}, now)
+    assert monthly == {"v89", "v61"}
+
+def test_kept_versions_keep_changed():
+    fingerprints = {0: "a", 1: "a", 2: "b", 3: "b", 4: "a"}
+    kept = retention.kept_versions(versions(5, timedelta(hours=1), fingerprints), {**POLICY, "keep_changed": True}, START)
+    assert kept == {"v0", "v2", "v4"}
+
+def test_collect_blobs_keeps_bases_of_kept_versions(db, monkeypatch):
+    add_device(db)
+    texts = [config_text(n) for n in range(4)]
+    entries = store_versions(db, "sw1", texts)
+    newest = entries[-1]["id"]
+    base = db.get(ConfigBlob, blobstore.content_hash(texts[-1]))
+    assert db.query(ConfigBlob).filter(ConfigBlob.base_hash == base.hash).count() == 1
+
+    retention.delete_backups(db, [(newest, "sw1")])
+    db.commit()
+    # Chains are normally rebuilt before collection; without that step the
+    # unreferenced base of the kept deltas must still survive
+    monkeypatch.setattr(retention, "materialize_orphaned_chains", lambda db: 0)
+    assert retention.collect_blobs(db)["blobs_deleted"] == 0
+    assert db.get(ConfigBlob, base.hash) is not None
+    for backup, text in zip(history.device_versions(db, "sw1"), texts):
+        assert blobstore.backup_content(db, backup) == blobstore.normalize(text)
+
+    monkeypatch.undo()
+    report = retention.collect_blobs(db)
+    assert report["materialized"] == 1
+    assert report["blobs_deleted"] == 1
+    for backup, text in zip(history.device_versions(db, "sw1"), texts):
+        assert blobstore.backup_content(db, backup) == blobstore.normalize(text)
+
+def test_collect_blobs_removes_unreferenced_chain(db, monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 1)
+    digests = [blobstore.put(db, config_text(n))[0] for n in range(3)]
+    blobstore.store_as_delta(db, digests[0], digests[1])
+    blobstore.store_as_delta(db, digests[1], digests[2])
+    db.commit()
+
+    report = retention.collect_blobs(db)
+    assert report["blobs_deleted"] == 3
+    assert db.query(ConfigBlob).count() == 0
+
+def test_orphan_files_only_touch_managed_files(db, tmp_path, monkeypatch):
+    backup_dir = tmp_path / "backups"
+    backup_dir.mkdir()
+    monkeypatch.setattr(retention, "BACKUP_DIR", str(backup_dir))
+    monkeypatch.setattr(retention, "MANAGED_LIST", str(backup_dir / ".managed"))
+    monkeypatch.setattr(retention, "ORPHAN_GRACE_SECONDS", 0)
+    for name in ("sw1.cfg", "old.cfg", "sample.cfg"):
+        (backup_dir / name).write_text("hostname sw1\n")
+    add_device(db)
+    store_versions(db, "sw1", [config_text(0)])
+    retention.mark_managed(["sw1.cfg", "old.cfg"])
+
+    assert retention.orphan_files(db) == [str(backup_dir / "old.cfg")]
+    assert retention.remove_managed(retention.orphan_files(db)) == 1
+    assert sorted(os.listdir(backup_dir)) == [".managed", "sample.cfg", "sw1.cfg"]
+    assert retention.read_managed() == {"sw1.cfg"}
@@ -0,0 +1,84 @@
+from models import CollectionTask
+from services import taskqueue
+
+def tasks(count: int):
+    return [{"device_id": f"sw{n}", "device_ip": f"10.0.0.{n}", "site": "plant-a"} for n in range(count)]
+
+def ok(task):
+    return {"device_id": task["device_id"], "success": True}
+
+def test_lease_is_exclusive_until_it_expires(session_factory):
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(2))
+
+    leased = queue.lease("w1", 10)
+    assert sorted(t["device_id"] for t in leased) == ["sw0", "sw1"]
+    assert queue.lease("w2", 10) == []
+    assert queue.depth() == {"leased": 2}
+
+def test_expired_lease_is_leased_again(session_factory):
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(1))
+
+    # A negative lease has already run out, as if w1 died mid-session
+    (first,) = queue.lease("w1", 10, lease_seconds=-1)
+    (second,) = queue.lease("w2", 10)
+    assert second["task_id"] == first["task_id"]
+
+    assert queue.heartbeat("w1", [first["task_id"]]) == set()
+    assert queue.complete("w1", {first["task_id"]: ok(first)}) == set()
+    assert queue.heartbeat("w2", [second["task_id"]]) == {second["task_id"]}
+    assert queue.complete("w2", {second["task_id"]: ok(second)}) == {second["task_id"]}
+
+    results = queue.take_results("job1")
+    assert [r["device_id"] for r in results] == ["sw0"]
+    assert queue.take_results("job1") == []
+    db = session_factory()
+    try:
+        assert db.get(CollectionTask, second["task_id"]).leases == 2
+    finally:
+        db.close()
+
+def test_heartbeat_keeps_lease(session_factory):
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(1))
+
+    (task,) = queue.lease("w1", 10, lease_seconds=-1)
+    assert queue.heartbeat("w1", [task["task_id"]], lease_seconds=60) == {task["task_id"]}
+    assert queue.lease("w2", 10) == []
+
+def test_released_task_does_not_count_as_lease(session_factory):
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(1))
+
+    (task,) = queue.lease("w1", 10)
+    queue.release("w1", [task["task_id"]])
+    (again,) = queue.lease("w2", 10)
+    assert again["task_id"] == task["task_id"]
+    db = session_factory()
+    try:
+        assert db.get(CollectionTask, task["task_id"]).leases == 1
+    finally:
+        db.close()
+
+def test_task_abandoned_after_max_leases(session_factory, monkeypatch):
+    monkeypatch.setattr(taskqueue, "MAX_LEASES", 2)
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(1))
+
+    assert len(queue.lease("w1", 10, lease_seconds=-1)) == 1
+    assert len(queue.lease("w2", 10, lease_seconds=-1)) == 1
+    assert queue.lease("w3", 10) == []
+
+    (result,) = queue.take_results("job1")
+    assert result["device_id"] == "sw0"
+    assert result["success"] is False
+    assert result["error_class"] == "abandoned"
+    assert result["attempts"] == 2
+
+def test_lease_filters_by_site(session_factory):
+    queue = taskqueue.SqliteTaskQueue(session_factory)
+    queue.enqueue("job1", tasks(1) + [{"device_id": "sw9", "device_ip": "10.0.1.9", "site": "plant-b"}])
+
+    assert [t["device_id"] for t in queue.lease("w1", 10, sites=["plant-b"])] == ["sw9"]
+    assert [t["device_id"] for t in queue.lease("w2", 10)] == ["sw0"]
@@ -0,0 +1,190 @@
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import backup_runner, taskqueue
+from services.collector import collector
+
+WORKER_CONCURRENCY = int(os.getenv("NETGUARD_WORKER_CONCURRENCY", collector.max_concurrency))
+WORKER_POLL_INTERVAL = float(os.getenv("NETGUARD_WORKER_POLL_INTERVAL", 1))
+WORKER_SITES = [s for s in os.getenv("NETGUARD_WORKER_SITES", "").split(",") if s]
+FLUSH_INTERVAL = 1.0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect device backups from the shared NetGuard task queue")
+    parser.add_argument("--queue", default=taskqueue.TASK_QUEUE or "sqlite", choices=["sqlite", "redis"])
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="device tasks leased at once")
+    parser.add_argument("--lease-seconds", type=float, default=taskqueue.LEASE_SECONDS)
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL, help="seconds to wait when the queue is empty")
+    parser.add_argument("--sites", default=",".join(WORKER_SITES), help="only take devices of these locations (comma list)")
+    parser.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+    return parser.parse_args(argv)
+
+def completion(result: Dict, worker_id: str, change: Optional[str] = None) -> Dict:
+    return {
+        "device_id": result["device_id"],
+        "device_name": result.get("device_name"),
+        "device_ip": result.get("device_ip"),
+        "success": result["success"],
+        "filename": result.get("filename"),
+        "timestamp": result.get("timestamp"),
+        "error": result.get("error"),
+        "error_class": result.get("error_class"),
+        "attempts": result.get("attempts", 1),
+        "duration": result.get("duration"),
+        "change": change,
+        "backup_id": result.get("backup_id") if change == "changed" else None,
+        "worker_id": worker_id
+    }
+
+def persist_leased(finished: List[Tuple[Dict, Dict]], worker_id: str) -> Dict[str, Dict]:
+    completions = {}
+    groups: Dict[tuple, List[Tuple[Dict, Dict]]] = {}
+    for lease, result in finished:
+        if result["success"]:
+            key = (tuple(lease["args"][4]), lease["template_name"], lease["only_changed"])
+            groups.setdefault(key, []).append((lease, result))
+        else:
+            completions[lease["task_id"]] = completion(result, worker_id)
+    for (commands, template_name, only_changed), items in groups.items():
+        outcome = backup_runner.persist_results([result for _, result in items], list(commands), template_name, only_changed)
+        for lease, result in items:
+            completions[lease["task_id"]] = completion(result, worker_id, outcome.get(result["device_id"]))
+    return completions
+
+# Leases up to `concurrency` device tasks, runs them through the same collector
+# as the API (executor, per-site/subnet limits, login rate, breaker, retries) and
+# persists finished results in chunks. Leases of running and unflushed tasks are
+# renewed every third of the lease time; results of tasks whose lease was lost to
+# another worker are dropped.
+class Worker:
+    def __init__(self, queue, worker_id: str, concurrency: int, lease_seconds: float, poll_interval: float, sites: List[str], drain: bool):
+        self.queue = queue
+        self.worker_id = worker_id
+        self.concurrency = max(concurrency, 1)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.sites = sites
+        self.drain = drain
+        self.stopping = False
+        self.running: Dict[asyncio.Task, Dict] = {}
+        self.finished: List[Tuple[Dict, Dict]] = []
+        self.lost: Set[str] = set()
+        self.processed = 0
+
+    def stop(self):
+        self.stopping = True
+
+    async def run(self):
+        last_flush = last_heartbeat = time.monotonic()
+        last_empty = None
+        while True:
+            leased = []
+            idle = last_empty is not None and time.monotonic() - last_empty < self.poll_interval
+            if not self.stopping and not idle and len(self.running) < self.concurrency:
+                leased = await asyncio.to_thread(
+                    self.queue.lease, self.worker_id, self.concurrency - len(self.running), self.lease_seconds, self.sites
+                )
+                last_empty = None if leased else time.monotonic()
+                for lease in leased:
+                    task = asyncio.ensure_future(collector.run(backup_runner.task_from_payload(lease)))
+                    self.running[task] = lease
+
+            if not self.running and not self.finished:
+                if self.stopping or (self.drain and last_empty is not None):
+                    break
+                if last_empty is not None:
+                    await asyncio.sleep(self.poll_interval)
+                continue
+
+            if self.running:
+                done, _ = await asyncio.wait(list(self.running), timeout=FLUSH_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    lease = self.running.pop(task)
+                    result = task.result()
+                    if lease["task_id"] in self.lost:
+                        self.lost.discard(lease["task_id"])
+                        backup_runner.discard_spool(result.get("spool"))
+                    else:
+                        self.finished.append((lease, result))
+
+            now = time.monotonic()
+            pending_bytes = sum(result.get("size") or 0 for _, result in self.finished)
+            if self.finished and (
+                not self.running
+                or len(self.finished) >= backup_runner.PERSIST_CHUNK_SIZE
+                or pending_bytes >= backup_runner.PERSIST_CHUNK_BYTES
+                or now - last_flush >= FLUSH_INTERVAL
+            ):
+                await self.flush()
+                last_flush = now
+
+            if now - last_heartbeat >= self.lease_seconds / 3:
+                await self.heartbeat()
+                last_heartbeat = now
+
+    async def heartbeat(self):
+        held = [lease["task_id"] for lease in self.running.values()] + [lease["task_id"] for lease, _ in self.finished]
+        kept = await asyncio.to_thread(self.queue.heartbeat, self.worker_id, held, self.lease_seconds)
+        self.lost.update(task_id for task_id in held if task_id not in kept)
+        for lease, result in [item for item in self.finished if item[0]["task_id"] in self.lost]:
+            self.lost.discard(lease["task_id"])
+            backup_runner.discard_spool(result.get("spool"))
+            self.finished.remove((lease, result))
+
+    async def flush(self):
+        finished, self.finished = self.finished, []
+        try:
+            completions = await asyncio.to_thread(persist_leased, finished, self.worker_id)
+            await asyncio.to_thread(self.queue.complete, self.worker_id, completions)
+        except Exception as e:
+            # The leases simply lapse and the devices are collected again elsewhere
+            print(f"worker {self.worker_id}: failed to store {len(finished)} results - {str(e)}")
+            return
+        self.processed += len(finished)
+
+    async def release(self):
+        held = [lease["task_id"] for lease in self.running.values()]
+        for task in self.running:
+            task.cancel()
+        await asyncio.gather(*self.running, return_exceptions=True)
+        self.running.clear()
+        await asyncio.to_thread(self.queue.release, self.worker_id, held)
+
+async def serve(args):
+    queue = taskqueue.create_queue(args.queue)
+    worker = Worker(
+        queue,
+        args.worker_id,
+        args.concurrency,
+        args.lease_seconds,
+        args.poll_interval,
+        [s for s in args.sites.split(",") if s],
+        args.drain
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+    print(f"worker {args.worker_id}: {args.queue} queue, {worker.concurrency} concurrent tasks"
+          + (f", sites {', '.join(worker.sites)}" if worker.sites else ""))
+    try:
+        await worker.run()
+    finally:
+        if worker.running:
+            await worker.release()
+        collector.shutdown()
+    print(f"worker {args.worker_id}: stopped after {worker.processed} devices")
+
+def main(argv=None):
+    asyncio.run(serve(parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
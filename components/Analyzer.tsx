@@ -1,6 +1,7 @@
 import React, { useState } from 'react';
-import { SwitchDevice, ConfigBackup, AuditReport } from '../types';
+import { SwitchDevice, ConfigBackup, AuditReport, AuditIssue } from '../types';
 import { analyzeConfiguration } from '../services/geminiService';
+import { backupApi, complianceApi } from '../services/api';
 import { ShieldCheck, AlertTriangle, AlertCircle, CheckCircle, Info, Loader2, Sparkles } from 'lucide-react';
 
 interface Props {
@@ -28,15 +29,41 @@ export default function Analyzer({ switches, backups }: Props) {
     setReport(null);
 
     try {
-      const analysis = await analyzeConfiguration(backup.content, device.vendor);
-      
+      // Deterministic checks run locally against the backend rule set; the LLM
+      // only reviews what rules cannot express and is optional.
+      let local: any = null;
+      try {
+        local = await complianceApi.backup(backup.id);
+      } catch {
+        // rule engine unavailable, rely on the LLM alone
+      }
+
+      let analysis: { issues: AuditIssue[], summary: string, score: number } | null = null;
+      try {
+        // Send the parsed block summary instead of the raw config when the backend can provide it
+        let configContent = backup.content;
+        try {
+          const parsed = await backupApi.parsed(backup.id);
+          if (parsed.summary.interfaces.length > 0 || parsed.summary.hostname) {
+            configContent = `结构化配置摘要 (JSON):\n${JSON.stringify(parsed.summary)}`;
+          }
+        } catch {
+          // fall back to the raw configuration
+        }
+        analysis = await analyzeConfiguration(configContent, device.vendor);
+      } catch (err) {
+        if (!local || local.status === 'no_config') throw err;
+      }
+
+      const localIssues: AuditIssue[] = local?.issues ?? [];
+      const localScore = local?.score ?? 100;
       const newReport: AuditReport = {
         id: crypto.randomUUID(),
         backupId: backup.id,
         timestamp: new Date().toISOString(),
-        issues: analysis.issues,
-        summary: analysis.summary,
-        score: analysis.score
+        issues: [...localIssues, ...(analysis?.issues ?? [])],
+        summary: analysis?.summary ?? `本地规则检查发现 ${localIssues.length} 项问题。`,
+        score: analysis ? Math.min(localScore, analysis.score) : localScore
       };
 
       setReport(newReport);
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import { SwitchDevice, ConfigBackup } from '../types';
 import { 
   BarChart, 
@@ -13,6 +13,7 @@ import {
   Cell
 } from 'recharts';
 import { ShieldAlert, HardDrive, Activity, CheckCircle } from 'lucide-react';
+import { statsApi } from '../services/api';
 
 interface Props {
   switches: SwitchDevice[];
@@ -20,20 +21,51 @@ interface Props {
 }
 
 const COLORS = ['#3b82f6', '#10b981', '#f59e0b', '#ef4444'];
+const STATS_REFRESH_INTERVAL = 30000;
+
+interface FleetStats {
+  devices: number;
+  backups: number;
+  coverage: number;
+  failing: number;
+  by_vendor: { vendor: string; devices: number }[];
+  daily: { day: string; backups: number; changes: number; failures: number }[];
+}
 
 export default function Dashboard({ switches, backups }: Props) {
-  
-  // Derive stats
+  const [stats, setStats] = useState<FleetStats | null>(null);
+
+  // Aggregates come precomputed from /api/stats; the device and backup lists are
+  // only used until the first response arrives (or when it fails).
+  useEffect(() => {
+    let active = true;
+    const load = () => statsApi.get()
+      .then((data) => { if (active) setStats(data); })
+      .catch((error) => console.error('Failed to load stats:', error));
+    load();
+    const timer = setInterval(load, STATS_REFRESH_INTERVAL);
+    return () => {
+      active = false;
+      clearInterval(timer);
+    };
+  }, []);
+
   const vendorCounts = switches.reduce((acc, curr) => {
     acc[curr.vendor] = (acc[curr.vendor] || 0) + 1;
     return acc;
   }, {} as Record<string, number>);
 
-  const vendorData = Object.keys(vendorCounts).map(k => ({ name: k, value: vendorCounts[k] }));
+  const vendorData = stats
+    ? stats.by_vendor.map(v => ({ name: v.vendor, value: v.devices }))
+    : Object.keys(vendorCounts).map(k => ({ name: k, value: vendorCounts[k] }));
   
   const recentBackups = backups.slice(0, 5);
-  const totalBackups = backups.length;
-  const coveragePercent = Math.round((switches.filter(s => s.lastBackup).length / (switches.length || 1)) * 100);
+  const deviceCount = stats ? stats.devices : switches.length;
+  const totalBackups = stats ? stats.backups : backups.length;
+  const coveragePercent = stats
+    ? Math.round(stats.coverage)
+    : Math.round((switches.filter(s => s.lastBackup).length / (switches.length || 1)) * 100);
+  const dailyData = (stats?.daily || []).map(d => ({ ...d, day: d.day.slice(5) }));
 
   return (
     <div className="space-y-6">
@@ -48,7 +80,7 @@ export default function Dashboard({ switches, backups }: Props) {
           <div className="flex justify-between items-start">
             <div>
               <p className="text-gray-500 text-sm">纳管设备</p>
-              <h3 className="text-3xl font-bold text-gray-900 mt-1">{switches.length}</h3>
+              <h3 className="text-3xl font-bold text-gray-900 mt-1">{deviceCount}</h3>
             </div>
             <div className="p-3 bg-blue-50 rounded-lg text-blue-600">
               <Activity size={24} />
@@ -81,6 +113,9 @@ export default function Dashboard({ switches, backups }: Props) {
           <div className="w-full bg-gray-100 h-1.5 mt-4 rounded-full overflow-hidden">
             <div className="bg-purple-500 h-full transition-all duration-500" style={{ width: `${coveragePercent}%` }}></div>
           </div>
+          {stats && stats.failing > 0 && (
+            <p className="text-xs text-red-500 mt-2">{stats.failing} 台设备最近一次备份失败</p>
+          )}
         </div>
 
         <div className="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
@@ -167,6 +202,25 @@ export default function Dashboard({ switches, backups }: Props) {
           </div>
         </div>
       </div>
+
+      {dailyData.length > 0 && (
+        <div className="bg-white p-6 rounded-xl border border-gray-200 shadow-sm">
+          <h3 className="text-lg font-semibold mb-6 text-gray-800">近期备份与配置变更</h3>
+          <div className="h-64">
+            <ResponsiveContainer width="100%" height="100%">
+              <BarChart data={dailyData}>
+                <CartesianGrid strokeDasharray="3 3" stroke="#f1f5f9" />
+                <XAxis dataKey="day" tick={{ fontSize: 12 }} />
+                <YAxis allowDecimals={false} tick={{ fontSize: 12 }} />
+                <Tooltip />
+                <Bar dataKey="backups" name="备份" fill={COLORS[0]} />
+                <Bar dataKey="changes" name="变更" fill={COLORS[1]} />
+                <Bar dataKey="failures" name="失败" fill={COLORS[3]} />
+              </BarChart>
+            </ResponsiveContainer>
+          </div>
+        </div>
+      )}
     </div>
   );
 }
\ No newline at end of file
@@ -68,14 +68,56 @@ export const deviceApi = {
   update: (id, data) => api.put(`/api/devices/${id}`, data),
   delete: (id) => api.delete(`/api/devices/${id}`),
   batchDelete: (deviceIds) => api.post('/api/devices/batch-delete', { device_ids: deviceIds }),
+  bulk: (rows, onConflict = 'update') => api.post(`/api/devices/bulk?on_conflict=${onConflict}`, rows),
+  bulkCsv: (file, onConflict = 'update') =>
+    api.request(`/api/devices/bulk?on_conflict=${onConflict}`, {
+      method: 'POST',
+      body: file,
+      headers: { 'Content-Type': 'text/csv' },
+    }),
 };
 
 export const backupApi = {
   getAll: () => api.get('/api/backups/'),
+  list: (params = {}) => api.get(`/api/backups/summaries?${new URLSearchParams(params)}`),
   getById: (id) => api.get(`/api/backups/${id}`),
+  diff: (id, against = 'previous', format = 'unified') =>
+    api.get(`/api/backups/${id}/diff?${new URLSearchParams({ against, format })}`),
+  diffLatest: () => api.get('/api/backups/diff/latest?changed_only=true'),
+  search: (q, latestOnly = true) =>
+    api.get(`/api/backups/search?${new URLSearchParams({ q, latest_only: latestOnly })}`),
   create: (data) => api.post('/api/backups/', data),
   delete: (id) => api.delete(`/api/backups/${id}`),
+  parsed: (id, includeTree = false) => api.get(`/api/backups/${id}/parsed?include_tree=${includeTree}`),
   download: (id, filename) => api.download(`/api/backups/${id}/download`, filename),
+  export: (params = {}, filename = 'netguard-backups.tar.gz') =>
+    api.download(`/api/backups/export?${new URLSearchParams(params)}`, filename),
+};
+
+export const configApi = {
+  summaries: (params = {}) => api.get(`/api/configs/summaries?${new URLSearchParams(params)}`),
+  interfaces: (params = {}) => api.get(`/api/configs/interfaces?${new URLSearchParams(params)}`),
+};
+
+export const complianceApi = {
+  rules: () => api.get('/api/compliance/rules'),
+  createRule: (data) => api.post('/api/compliance/rules', data),
+  updateRule: (id, data) => api.put(`/api/compliance/rules/${id}`, data),
+  deleteRule: (id) => api.delete(`/api/compliance/rules/${id}`),
+  report: (params = {}) => api.get(`/api/compliance/report?${new URLSearchParams(params)}`),
+  backup: (id) => api.get(`/api/compliance/backups/${id}`),
+};
+
+export const statsApi = {
+  get: () => api.get('/api/stats/'),
+};
+
+export const retentionApi = {
+  getPolicy: () => api.get('/api/retention/policy'),
+  updatePolicy: (data) => api.put('/api/retention/policy', data),
+  run: ({ dryRun = true, vacuum = false } = {}) =>
+    api.post(`/api/retention/run?dry_run=${dryRun}&vacuum=${vacuum}`),
+  report: () => api.get('/api/retention/report'),
 };
 
 export const templateApi = {
@@ -85,8 +127,21 @@ export const templateApi = {
   delete: (id) => api.delete(`/api/templates/${id}`),
 };
 
+const JOB_POLL_INTERVAL = 2000;
+
 export const backupJobApi = {
-  execute: (data) => api.post('/api/backup-jobs/', data),
+  submit: (data) => api.post('/api/backup-jobs/', data),
+  getAll: () => api.get('/api/backup-jobs/'),
+  getById: (id) => api.get(`/api/backup-jobs/${id}`),
+  events: (id) => new EventSource(`${API_BASE_URL}/api/backup-jobs/${id}/events`),
+  execute: async (data) => {
+    let job = await backupJobApi.submit(data);
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+      job = await backupJobApi.getById(job.job_id);
+    }
+    return job;
+  },
 };
 
 export default api;